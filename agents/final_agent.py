@@ -1,399 +1,210 @@
-from agents import Agent
-from openai import OpenAI
-import requests
 import json
-import tarfile
-import csv
-import re
+import argparse
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import lru_cache
 from pathlib import Path
-from collections import Counter, defaultdict
-from utils_ecuador import fetch_all_search
-
-client = OpenAI()
+from collections import Counter
+from typing import Optional
+import utils_fuentes
+from utils_ecuador import fetch_search_since
+from utils_chile import chile_archive_version
+from utils_fuentes import (
+    ANIO, DATA_DIR, MAX_EC_ROWS, METODO, chile_dir, normalizar_lote, query_chile_data, query_colombia_api,
+    query_ecuador_api,
+)
+from utils_incremental import RecordStore
+from utils_cache import set_offline
+from utils_salida import write_dataset
+from utils_agregacion import CuboAgregado
+from utils_entidades import ROLES, IndiceEntidades
+from utils_lotes import LOTE_DIR, LOTE_POR_HOST, PAISES, ejecutar_lote, matriz, parse_anios
+from utils_metricas import METRICAS
+from utils_payload import ANALISIS_MAX_TOKENS, construir_payload, contar_tokens
+from utils_clasificador import CLASIFICADOR
+from utils_llm import LLM_CACHE, DisabledBackend, chat_completion, set_backend
+from utils_registro import a_dicts
 
 # ========================
 # Config / Paths
 # ========================
-MAX_EC_ROWS = 200
-DATA_DIR = Path("./data")
-DATA_DIR.mkdir(exist_ok=True)
+# Año, método, Chile y LLM de normalización: ver utils_fuentes.py
+OUTPUT_DIR = Path("./datos_normalizados")
+STORE_PATH = DATA_DIR / "registros.sqlite"
+INDICE_PATH = OUTPUT_DIR / "indice_entidades.sqlite"
 
-SCHEMA = "id, entidad, objeto, presupuesto, moneda, lugar, fecha_conv, fecha_adj, oferentes, proveedor, valor_adj, justificacion"
+# Timeout por fuente en ejecutar_router (segundos)
+ROUTER_TIMEOUTS = {
+    "Ecuador": float(os.getenv("ROUTER_TIMEOUT_ECUADOR", "1800")),
+    "Colombia": float(os.getenv("ROUTER_TIMEOUT_COLOMBIA", "600")),
+    "Chile": float(os.getenv("ROUTER_TIMEOUT_CHILE", "3600")),
+}
 
-# ========================
-# Utils de parsing / limpieza
-# ========================
 
-def strip_code_fences(text: str) -> str:
-    if text is None:
-        return ""
-    text = text.strip()
-    text = re.sub(r"^```[a-zA-Z0-9]*\s*", "", text)
-    text = re.sub(r"\s*```$", "", text)
-    return text.strip()
-
-def to_number(val) -> float:
-    if val is None:
-        return 0.0
-    if isinstance(val, (int, float)):
-        return float(val)
-
-    s = str(val).strip()
-    if s == "":
-        return 0.0
-
-    repl = ["USD", "US$", "$", "CLP", "COP", "UF", "CLF", "FET"]
-    s_up = s.upper()
-    for token in repl:
-        s_up = s_up.replace(token, "")
-    s = s_up
-
-    s = s.replace("\xa0", " ").strip()
-
-    if s.count(".") > 0 and s.count(",") > 0:
-        s = s.replace(".", "")
-        s = s.replace(",", ".")
-    else:
-        if s.count(",") == 1 and len(s.split(",")[-1]) in (1, 2):
-            s = s.replace(",", ".")
-        else:
-            s = s.replace(",", "")
+# ===== Nuevo clasificador (usa objeto + entidad + justificación, con reglas CHI) =====
+# Palabras clave y motor compilado en utils_clasificador.py
+def clasificar_categoria_avanzado(objeto: str, entidad: str, justificacion: str = "") -> str:
+    return CLASIFICADOR.clasificar(objeto, entidad, justificacion)
 
-    s = s.replace(" ", "")
+# ========================
+# Carga incremental (marcas por fuente)
+# ========================
 
-    if s.startswith("(") and s.endswith(")"):
-        s = "-" + s[1:-1]
+def query_ecuador_delta(year, method, marca, max_rows: Optional[int] = None,
+                        cancel: Optional[threading.Event] = None):
+    # Se asume que las páginas nuevas se agregan al final; la última página leída se relee
+    start = (marca or {}).get("page", 1)
+    print(f"📡 Consultando datos nuevos de Ecuador (desde la página {start})...")
+    with METRICAS.span("descarga", fuente="ecuador"):
+        data, page = fetch_search_since(year=year, search=method, start_page=start,
+                                        max_rows=max_rows or utils_fuentes.MAX_EC_ROWS, cancel=cancel)
+    for d in data:
+        d.setdefault("pais", "Ecuador")
+    print(f"✅ {len(data)} registros obtenidos de Ecuador.")
+    ocid = data[-1]["id"] if data else (marca or {}).get("ocid")
+    return data, {"page": page, "ocid": ocid}
+
+def query_colombia_delta(year, method, api_url, marca):
+    since = (marca or {}).get("fecha_conv")
+    data = query_colombia_api(year, method, api_url, since=since)
+    fechas = [d["fecha_conv"] for d in data if d.get("fecha_conv")]
+    if since:
+        fechas.append(since)
+    return data, {"fecha_conv": max(fechas)} if fechas else marca
+
+def query_chile_delta(marca, year: int = ANIO, cancel: Optional[threading.Event] = None):
+    known = (marca or {}).get("version")
+    data = query_chile_data(known_version=known, year=year, cancel=cancel)
+    version = chile_archive_version(chile_dir(year))
+    # Si no hubo datos por un error, la marca no avanza
+    if data or version == known:
+        return data, {"version": version}
+    return data, marca
 
-    s = re.sub(r"[^0-9\.\-]", "", s)
+# ========================
+# Router
+# ========================
 
-    try:
-        return float(s) if s not in ("", ".", "-", "-.") else 0.0
-    except Exception:
-        return 0.0
+def clave_marca(pais: str, year=ANIO, method=METODO) -> str:
+    # La ejecución por defecto conserva las marcas por país de versiones anteriores
+    if (int(year), method) == (ANIO, METODO):
+        return pais
+    return f"{pais}|{year}|{method}"
 
-def convertir_a_usd(valor, moneda):
+def _en_hilo_daemon(fn, nombre: str) -> Future:
     """
-    Variables de entorno para ajustar tasas:
-      FX_COP_PER_USD (default 4000)
-      FX_CLP_PER_USD (default 850)
-      FX_UF_USD      (default 42)
+    Corre fn en un hilo daemon y entrega el resultado en un Future. Los hilos de
+    ThreadPoolExecutor se esperan al salir del intérprete: una fuente vencida
+    demoraría el fin del proceso hasta terminar por su cuenta.
     """
-    v = to_number(valor)
-    m = (moneda or "USD").strip().upper()
-
-    cop_per_usd = to_number(os.getenv("FX_COP_PER_USD", "4000"))
-    clp_per_usd = to_number(os.getenv("FX_CLP_PER_USD", "850"))
-    uf_usd      = to_number(os.getenv("FX_UF_USD", "42"))
-
-    rates = {
-        "USD": 1.0,
-        "COP": (1.0 / cop_per_usd) if cop_per_usd > 0 else 0.00025,
-        "CLP": (1.0 / clp_per_usd) if clp_per_usd > 0 else 1/850.0,
-        "UF": uf_usd if uf_usd > 0 else 42.0,
-        "CLF": uf_usd if uf_usd > 0 else 42.0,
-        "FET": uf_usd if uf_usd > 0 else 42.0,
-        "": 1.0,
-        None: 1.0,
-    }
-    return float(v) * rates.get(m, 1.0)
+    f: Future = Future()
 
-# ===== Nuevo clasificador (usa objeto + entidad + justificación, con reglas CHI) =====
-def clasificar_categoria_avanzado(objeto: str, entidad: str, justificacion: str = "") -> str:
-    t = f"{(objeto or '')} {(entidad or '')} {(justificacion or '')}".lower()
-
-    # Salud (palabras en objeto/justificación o por tipo de entidad)
-    salud_kw = [
-        "salud", "hospital", "clínic", "clinic", "médic", "medic", "quirúrg", "quirurg",
-        "insumo", "medicament", "laboratorio", "ambulancia", "esteriliz", "equipos médicos",
-        "servicio de salud", "cesfam", "sar ", "sapu"
-    ]
-    # Educación
-    educ_kw = [
-        "educación", "educacion", "escuela", "colegio", "universidad", "liceo", "docente",
-        "estudiante", "alumno", "junji", "jardín infantil", "jardin infantil", "daem",
-        "institución educativa", "institucion educativa"
-    ]
-    # Infraestructura / obras / TI/telecom/seguro/equipamiento general
-    infra_kw = [
-        "infraestructura", "obra", "obras", "vía", "via", "carretera", "puente", "calzada",
-        "rehabilitación", "rehabilitacion", "mantenimiento vial", "alcantarillado", "agua potable",
-        "paviment", "vial", "edificaci", "servidor", "impresor", "telefon", "hpe", "seguro",
-        "mantención", "mantencion", "licitación obra", "construcción", "conservación"
-    ]
-
-    # Heurísticas por entidad CHI
-    entidad_health = any(x in (entidad or "").lower() for x in [
-        "servicio de salud", "hospital", "cesfam", "sapu", "sar ", "posta", "ss metropolitan"
-    ])
-    entidad_educ = any(x in (entidad or "").lower() for x in [
-        "junji", "jardín infantil", "jardin infantil", "colegio", "liceo", "daem",
-        "ministerio de educación", "universidad", "municipalidad de"  # muchas muni compran p/escuelas
-    ])
-    entidad_infra = any(x in (entidad or "").lower() for x in [
-        "mop", "obras públicas", "obras publicas", "dirección de vialidad", "direccion de vialidad",
-        "serviu", "ministerio de obras", "municipalidad de", "dom"
-    ])
-
-    if any(k in t for k in salud_kw) or entidad_health:
-        return "Salud"
-    if any(k in t for k in educ_kw) or entidad_educ:
-        return "Educación"
-    if any(k in t for k in infra_kw) or entidad_infra:
-        return "Infraestructura"
-    return "Otras"
-
-# ========================
-# Chile (descarga, extracción, normalización por chunks, lectura)
-# ========================
-
-def download_and_extract_chile(url: str) -> Path:
-    tar_path = DATA_DIR / "chile.tar.gz"
-    print(f"[Chile] Descargando desde {url} ...")
-    resp = requests.get(url, stream=True)
-    resp.raise_for_status()
-    with open(tar_path, "wb") as f:
-        for chunk in resp.iter_content(chunk_size=8192):
-            f.write(chunk)
-
-    print(f"[Chile] Archivo comprimido guardado en {tar_path}")
-
-    csv_output = None
-    with tarfile.open(tar_path, "r:gz") as tar:
-        for member in tar.getmembers():
-            if member.name.endswith("contracts.csv"):
-                print(f"[Chile] Extrayendo {member.name} ...")
-                try:
-                    tar.extract(member, DATA_DIR, filter="data")  # Python 3.14+
-                except TypeError:
-                    tar.extract(member, DATA_DIR)
-                csv_output = DATA_DIR / member.name
-                break
-
-    if csv_output is None:
-        raise FileNotFoundError("[Chile] No se encontró un contracts.csv en el tar.gz")
-
-    print(f"[Chile] CSV extraído en {csv_output}")
-    return csv_output
-
-def normalize_chile_chunked(file_path: Path, lines_per_chunk: int = 1800, max_chunks: int = 6) -> Path:
-    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-        all_lines = f.readlines()
-
-    if not all_lines:
-        out_file = DATA_DIR / "chile_normalized.csv"
-        with open(out_file, "w", encoding="utf-8") as fout:
-            fout.write(SCHEMA + "\n")
-        print(f"[Chile] Archivo vacío, creado CSV normalizado vacío → {out_file}")
-        return out_file
-
-    header = all_lines[0]
-    body = all_lines[1:]
-
-    chunks = []
-    for i in range(0, len(body), lines_per_chunk):
-        if len(chunks) >= max_chunks:
-            break
-        chunk_lines = [header] + body[i:i + lines_per_chunk]
-        chunks.append("".join(chunk_lines))
-
-    out_file = DATA_DIR / "chile_normalized.csv"
-    wrote_header = False
-
-    for idx, chunk_text in enumerate(chunks, start=1):
-        prompt = f"""
-Eres un agente especializado en compras públicas.
-País: Chile
-Este es un fragmento del archivo CSV oficial (incluye cabecera).
-Convierte EXCLUSIVAMENTE las filas de este fragmento al siguiente esquema CSV EXACTO:
-
-{SCHEMA}
-
-Reglas estrictas:
-- Usa coma (,) como separador (no uses ';').
-- No repitas ni inventes filas.
-- No agregues texto fuera del CSV.
-- No envuelvas en bloques de código.
-- Si un valor no existe, deja la celda vacía.
-- En el PRIMER chunk incluye la cabecera; en los siguientes, NO incluyas cabecera.
-
-Fragmento CSV:
-{chunk_text[:180000]}
-""".strip()
-
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-        )
-        csv_out = strip_code_fences(resp.choices[0].message.content or "")
-        lines = [ln for ln in csv_out.splitlines() if ln.strip() != ""]
-
-        if not wrote_header:
-            first = (lines[0].strip().lower() if lines else "")
-            if not first.startswith("id,"):
-                lines.insert(0, SCHEMA)
-            wrote_header = True
-            mode = "w"
-        else:
-            if lines and lines[0].strip().lower().startswith("id,"):
-                lines = lines[1:]
-            mode = "a"
-
-        with open(out_file, mode, encoding="utf-8") as fout:
-            fout.write("\n".join(lines) + "\n")
-
-    print(f"[Chile] Normalización por chunks completada → {out_file}")
-    return out_file
-
-def _dictreader_autodelim(fp):
-    sample = fp.read(4096)
-    fp.seek(0)
-    dialect = None
-    try:
-        dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";"])
-    except Exception:
-        pass
-    if dialect is None:
-        first_try = csv.DictReader(fp, delimiter=";")
-        rows = []
+    def correr():
+        if not f.set_running_or_notify_cancel():
+            return
         try:
-            for i, r in enumerate(first_try):
-                rows.append(r)
-                if i > 3:
-                    break
-        except Exception:
-            rows = []
-        fp.seek(0)
-        if rows and len(rows[0].keys()) > 1:
-            return csv.DictReader(fp, delimiter=";")
-        else:
-            fp.seek(0)
-            return csv.DictReader(fp, delimiter=",")
-    else:
-        return csv.DictReader(fp, dialect=dialect)
-
-def query_chile_data():
-    try:
-        chile_url = "https://data.open-contracting.org/es/publication/144/download?name=2023.csv.tar.gz"
-        extracted_path = download_and_extract_chile(chile_url)
-        normalized_path = normalize_chile_chunked(extracted_path, lines_per_chunk=1800, max_chunks=6)
-
-        datos = []
-        with open(normalized_path, "r", encoding="utf-8", errors="ignore", newline="") as f:
-            reader = _dictreader_autodelim(f)
-            for row in reader:
-                if not row:
-                    continue
-                rid = (row.get("id") or "").strip()
-                if not rid or rid.lower() == "id":
-                    continue
-                datos.append({
-                    "id": rid,
-                    "entidad": (row.get("entidad") or "").strip(),
-                    "objeto": (row.get("objeto") or "").strip(),
-                    "presupuesto": (row.get("presupuesto") or "").strip(),
-                    "moneda": ((row.get("moneda") or "CLP").strip()).upper(),
-                    "lugar": (row.get("lugar") or "").strip(),
-                    "fecha_conv": (row.get("fecha_conv") or "").strip(),
-                    "fecha_adj": (row.get("fecha_adj") or "").strip(),
-                    "oferentes": (row.get("oferentes") or "").strip(),
-                    "proveedor": (row.get("proveedor") or "").strip(),
-                    "valor_adj": (row.get("valor_adj") or "").strip(),
-                    "justificacion": (row.get("justificacion") or "").strip(),
-                    "pais": "Chile",
-                })
-
-        print(f"✅ Chile: {len(datos)} registros normalizados por chunks.")
-        return datos
-    except Exception as e:
-        print("❌ Error Chile:", e)
-        return []
+            f.set_result(fn())
+        except BaseException as e:
+            f.set_exception(e)
 
-# ========================
-# Ecuador / Colombia
-# ========================
+    threading.Thread(target=correr, name=nombre, daemon=True).start()
+    return f
 
-def query_ecuador_api(year, method):
-    print("📡 Consultando datos de Ecuador...")
-    try:
-        data = fetch_all_search(year=year, search=method, max_rows=MAX_EC_ROWS)
-        print(f"✅ {len(data)} registros obtenidos de Ecuador.")
-        for d in data:
-            d.setdefault("pais", "Ecuador")
-        return data
-    except Exception as e:
-        print("❌ Error Ecuador:", e)
-        return []
-
-def query_colombia_api(year, method, api_url):
-    print("📡 Consultando datos de Colombia...")
-    r = requests.get("https://www.datos.gov.co/resource/p6dx-8zbt.json", params={
-        "$limit": 10000,
-        "$where": "modalidad_de_contratacion like '%subasta inversa%' AND fecha_de_publicacion_del >= '2023-01-01T00:00:00'"
-    })
-    if r.status_code != 200:
-        print("❌ Error Colombia:", r.status_code)
-        return []
-    data = r.json()
-    out = [
-        {
-            "pais": "Colombia",
-            "id": d.get("id_del_proceso"),
-            "entidad": d.get("entidad"),
-            "objeto": d.get("descripci_n_del_procedimiento"),
-            "presupuesto": d.get("precio_base", 0),
-            "moneda": "COP",
-            "lugar": d.get("ciudad_entidad"),
-            "fecha_conv": d.get("fecha_de_publicacion_del"),
-            "fecha_adj": d.get("fecha_adjudicacion"),
-            "oferentes": d.get("proveedores_invitados"),
-            "proveedor": d.get("nombre_del_proveedor"),
-            "valor_adj": d.get("valor_total_adjudicacion", 0),
-            "justificacion": d.get("justificaci_n_modalidad_de")
-        }
-        for d in data
-    ]
-    print(f"✅ {len(out)} registros obtenidos de Colombia.")
-    return out
+def ejecutar_router(timeouts=None, incremental=False, store: Optional[RecordStore] = None,
+                    cubo: Optional[CuboAgregado] = None, year=ANIO, method=METODO,
+                    paises=("Ecuador", "Colombia", "Chile"), max_ec_rows: Optional[int] = None,
+                    indice: Optional[IndiceEntidades] = None):
+    """
+    Ejecuta las fuentes de `paises` en paralelo (hilos: son etapas de red) y
+    normaliza cada una apenas termina. Una fuente que falla o supera su timeout
+    aporta []. Timeouts por fuente (segundos): ROUTER_TIMEOUT_ECUADOR / _COLOMBIA / _CHILE.
+    Cada fuente corre en un hilo daemon y, al vencer, se activa su evento de
+    cancelación: sus pools (páginas de Ecuador, chunks LLM y lectura del CSV de
+    Chile) dejan de tomar trabajo y la fuente no retrasa la salida del proceso.
 
-# ========================
-# Router + normalización final
-# ========================
+    incremental=True: cada fuente trae solo lo posterior a su marca, se hace
+    upsert por (pais, id) en el almacén local y se devuelve su contenido completo.
 
-def ejecutar_router():
-    datos = []
-    datos += query_ecuador_api(2023, "subasta inversa")
-    datos += query_colombia_api(2023, "subasta inversa", "")
-    datos += query_chile_data()
-
-    for d in datos:
-        # Moneda por defecto si faltara
-        if d.get("pais") == "Ecuador" and not d.get("moneda"):
-            d["moneda"] = "USD"
-        if d.get("pais") == "Chile" and not d.get("moneda"):
-            d["moneda"] = "CLP"
-
-        # Fallback de presupuesto
-        presupuesto = to_number(d.get("presupuesto"))
-        if presupuesto <= 0:
-            presupuesto = to_number(d.get("valor_adj"))
-        d["presupuesto"] = presupuesto or 0.0
-
-        # Clasificación (usa objeto + entidad + justificación)
-        d["categoria"] = clasificar_categoria_avanzado(
-            d.get("objeto", ""),
-            d.get("entidad", ""),
-            d.get("justificacion", "")
-        )
-
-        # Conversión a USD
-        d["presupuesto_usd"] = convertir_a_usd(d.get("presupuesto", 0), d.get("moneda", "USD"))
-        d["valor_adj_usd"] = convertir_a_usd(d.get("valor_adj", 0), d.get("moneda", "USD"))
-
-        # Si presupuesto_usd quedó 0 pero valor_adj_usd > 0, usarlo como aproximación
-        if (not d["presupuesto_usd"]) and d.get("valor_adj_usd"):
-            d["presupuesto_usd"] = d["valor_adj_usd"]
+    cubo: si se pasa, se actualiza con los registros de cada fuente a medida que
+    terminan (en modo incremental, con el contenido completo del almacén).
 
+    indice: índice de proveedores/entidades; cada fuente con datos reemplaza lo
+    indexado de su país (en modo incremental, solo se agregan sus registros nuevos).
+    """
+    cancelar = {pais: threading.Event() for pais in ("Ecuador", "Colombia", "Chile")}
+    if incremental:
+        store = store or RecordStore(STORE_PATH)
+        marcas = {pais: store.get_watermark(clave_marca(pais, year, method)) for pais in paises}
+        fuentes = {
+            "Ecuador": lambda: query_ecuador_delta(year, method, marcas["Ecuador"], max_ec_rows,
+                                                   cancel=cancelar["Ecuador"]),
+            "Colombia": lambda: query_colombia_delta(year, method, "", marcas["Colombia"]),
+            "Chile": lambda: query_chile_delta(marcas["Chile"], year, cancel=cancelar["Chile"]),
+        }
+    else:
+        fuentes = {
+            "Ecuador": lambda: query_ecuador_api(year, method, max_ec_rows, cancel=cancelar["Ecuador"]),
+            "Colombia": lambda: query_colombia_api(year, method, ""),
+            "Chile": lambda: query_chile_data(year=year, cancel=cancelar["Chile"]),
+        }
+    fuentes = {pais: fn for pais, fn in fuentes.items() if pais in paises}
+    timeouts = {**ROUTER_TIMEOUTS, **(timeouts or {})}
+    resultados = {pais: [] for pais in fuentes}
+
+    inicio = time.monotonic()
+    futures = {_en_hilo_daemon(fn, f"router-{pais.lower()}"): pais for pais, fn in fuentes.items()}
+    pendientes = set(futures)
+    while pendientes:
+        transcurrido = time.monotonic() - inicio
+        limite = min(timeouts[futures[f]] for f in pendientes)
+        done, pendientes = wait(pendientes, timeout=max(0.0, limite - transcurrido),
+                                return_when=FIRST_COMPLETED)
+        for f in done:
+            pais = futures[f]
+            marca = None
+            try:
+                registros = f.result() or []
+                if incremental:
+                    registros, marca = registros
+            except Exception as e:
+                print(f"❌ Error {pais}:", e)
+                registros = []
+            METRICAS.incr("filas_entrada", len(registros), fuente=pais.lower())
+            with METRICAS.span("normalizacion", fuente=pais.lower()):
+                resultados[pais] = normalizar_lote(registros)
+            METRICAS.incr("filas_salida", len(resultados[pais]), fuente=pais.lower())
+            if indice is not None and resultados[pais]:
+                try:
+                    with METRICAS.span("indice", fuente=pais.lower()):
+                        indice.agregar(resultados[pais], pais=None if incremental else pais)
+                except Exception as e:
+                    # El índice es auxiliar: un fallo no descarta los datos de la fuente
+                    print(f"❌ Error índice {pais}:", e)
+            if cubo is not None and not incremental:
+                with METRICAS.span("agregacion", fuente=pais.lower()):
+                    cubo.add_many(resultados[pais])
+            if incremental:
+                with METRICAS.span("upsert", fuente=pais.lower()):
+                    n = store.upsert_many(resultados[pais])
+                if marca:
+                    store.set_watermark(clave_marca(pais, year, method), marca)
+                print(f"🔁 {pais}: {n} registros nuevos/actualizados en {store.path}")
+                if cubo is not None:
+                    with METRICAS.span("agregacion", fuente=pais.lower()):
+                        cubo.add_many(store.iter_records(pais))
+
+        transcurrido = time.monotonic() - inicio
+        for f in [f for f in pendientes if transcurrido >= timeouts[futures[f]]]:
+            print(f"⏱️ {futures[f]}: sin respuesta tras {timeouts[futures[f]]:.0f}s, se omite.")
+            cancelar[futures[f]].set()
+            pendientes.discard(f)
+
+    # Orden estable: Ecuador, Colombia, Chile
+    datos = []
+    for pais in fuentes:
+        datos += list(store.iter_records(pais)) if incremental else resultados[pais]
     return datos
 
 # ========================
@@ -402,43 +213,135 @@ def ejecutar_router():
 
 def run_agent(agent, user_input):
     prompt = f"{agent.instructions}\n\nInput: {user_input}"
-    response = client.chat.completions.create(
+    return chat_completion(
         model=agent.model,
         messages=[{"role": "user", "content": prompt}]
     )
-    return response.choices[0].message.content
 
-# Agentes
-ecuador_agent = Agent(name="Ecuador Agent", instructions="...", model="gpt-4o-mini", tools=[])
-colombia_agent = Agent(name="Colombia Agent", instructions="...", model="gpt-4o-mini", tools=[])
-chile_agent = Agent(name="Chile Agent", instructions="...", model="gpt-4o-mini", tools=[])
+# Agentes: se construyen al primer uso (importar `agents` tarda segundos),
+# p. ej. final_agent.analysis_agent o get_agent("analysis_agent")
+AGENT_SPECS = {
+    "ecuador_agent": dict(name="Ecuador Agent", instructions="...", model="gpt-4o-mini", tools=[]),
+    "colombia_agent": dict(name="Colombia Agent", instructions="...", model="gpt-4o-mini", tools=[]),
+    "chile_agent": dict(name="Chile Agent", instructions="...", model="gpt-4o-mini", tools=[]),
+    "router_agent": dict(
+        name="Router Agent",
+        instructions="Recoge y normaliza los datos de Ecuador, Colombia y Chile.",
+        model="gpt-4o-mini",
+    ),
+    "analysis_agent": dict(
+        name="Analysis Agent",
+        instructions=(
+        "Recibes contratos de subasta inversa normalizados: totales_usd (presupuesto en USD por país y "
+        "categoría, ya calculado sobre todos los registros), registros_por_estrato y una muestra aleatoria "
+        "en forma de tabla (muestra.columnas + filas por estrato 'País|Categoría', textos recortados). "
+        "Usa totales_usd para las categorías Salud, Educación e Infraestructura por país y la muestra "
+        "solo como ejemplos. Haz un análisis comparativo en forma de informe."
+        ),
+        model="gpt-4o",
+    ),
+}
 
-router_agent = Agent(
-    name="Router Agent",
-    instructions="Recoge y normaliza los datos de Ecuador, Colombia y Chile.",
-    model="gpt-4o-mini"
-)
 
-analysis_agent = Agent(
-    name="Analysis Agent",
-    instructions=(
-        "Recibes una lista de contratos de subasta inversa normalizados (con país, categoría y presupuesto_usd). "
-        "Calcula el total de presupuesto en USD para las categorías: Salud, Educación e Infraestructura por país. "
-        "Haz un análisis comparativo en forma de informe."
-    ),
-    model="gpt-4o"
-)
+@lru_cache(maxsize=None)
+def get_agent(nombre: str):
+    from agents import Agent
+    return Agent(**AGENT_SPECS[nombre])
+
+
+def __getattr__(nombre: str):
+    if nombre in AGENT_SPECS:
+        return get_agent(nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 # ========================
 # Main
 # ========================
 if __name__ == "__main__":
-    print("📦 Ejecutando Router Agent (recolección de datos)...")
-    normalized_data = ejecutar_router()
+    parser = argparse.ArgumentParser(description="Compras públicas — subasta inversa (EC, CO, CL)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Solo usa respuestas HTTP ya guardadas en la caché (data/http_cache)")
+    parser.add_argument("--formato", choices=["auto", "parquet", "ndjson"], default="auto",
+                        help="Formato de datos_normalizados/ (auto: parquet si hay pyarrow)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Solo trae datos nuevos por fuente y los acumula en data/registros.sqlite")
+    parser.add_argument("--json", action="store_true",
+                        help="Además escribe el antiguo datos_normalizados.json")
+    parser.add_argument("--metricas", metavar="RUTA",
+                        help="Guarda un reporte JSON con spans y contadores por etapa (METRICAS=1 → data/metricas.json)")
+    parser.add_argument("--openmetrics", metavar="RUTA", help="Además exporta las métricas en formato OpenMetrics")
+    parser.add_argument("--max-tokens-analisis", type=int, default=ANALISIS_MAX_TOKENS,
+                        help="Presupuesto de tokens del payload del Analysis Agent (ANALISIS_MAX_TOKENS)")
+    parser.add_argument("--no-llm", action="store_true",
+                        help="Solo ingesta, normalización, clasificación y totales; no contacta ningún modelo")
+    lote = parser.add_argument_group("lotes", "Matriz año × método × país en un pool de procesos (sin LLM)")
+    lote.add_argument("--anios", help="Años del lote, p. ej. 2019-2025 o 2019,2021")
+    lote.add_argument("--metodos", help=f"Métodos separados por ',' (por defecto: {METODO})")
+    lote.add_argument("--paises", default=",".join(PAISES), help="Países separados por ',' (por defecto: todos)")
+    lote.add_argument("--procesos", type=int, help="Procesos del pool (LOTE_PROCESOS, por defecto os.cpu_count())")
+    lote.add_argument("--por-host", type=int, default=LOTE_POR_HOST,
+                      help="Descargas simultáneas por host entre todos los procesos (LOTE_POR_HOST)")
+    lote.add_argument("--max-filas-ecuador", type=int,
+                      help=f"Tope de filas de Ecuador por trabajo (por defecto MAX_EC_ROWS={MAX_EC_ROWS})")
+    lote.add_argument("--salida-lote", type=Path, default=LOTE_DIR, help="Raíz de las particiones del lote (LOTE_DIR)")
+    busqueda = parser.add_argument_group("búsqueda", f"Proveedores y entidades en {INDICE_PATH} (sin descargar nada)")
+    busqueda.add_argument("--buscar", metavar="NOMBRE", help="Busca por nombre (exacto o aproximado, sin tildes ni forma societaria)")
+    busqueda.add_argument("--rol", choices=ROLES, help="Solo proveedores o solo entidades compradoras")
+    busqueda.add_argument("--limite", type=int, default=10, help="Máximo de coincidencias")
+    busqueda.add_argument("--ids", action="store_true", help="Lista también los (pais, id) de cada coincidencia")
+    args = parser.parse_args()
+    if args.offline:
+        set_offline(True)
+
+    if args.buscar:
+        if not INDICE_PATH.exists():
+            parser.error(f"No existe {INDICE_PATH}: ejecuta primero la recolección")
+        indice = IndiceEntidades(INDICE_PATH)
+        t0 = time.perf_counter()
+        coincidencias = indice.buscar(args.buscar, rol=args.rol, limite=args.limite)
+        print(f"🔎 {len(coincidencias)} coincidencias para {args.buscar!r} ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+        for c in coincidencias:
+            print(f" - [{c['rol']}] {c['nombre']} (similitud {c['similitud']:.2f}): {c['registros']} registros, "
+                  f"USD {c['presupuesto_usd']:,.2f}")
+            for pais, p in sorted(c["por_pais"].items()):
+                print(f"     {pais}: {p['registros']} registros, USD {p['presupuesto_usd']:,.2f}")
+            print(f"     variantes: {'; '.join(c['variantes'][:5])}")
+            if args.ids:
+                print("     ids: " + ", ".join(f"{pais}/{rid}" for pais, rid in indice.ids(c["eid"])))
+        indice.close()
+        raise SystemExit(0)
+
+    if args.anios or args.metodos:
+        paises = [p.strip() for p in args.paises.split(",") if p.strip()]
+        desconocidos = sorted(set(paises) - set(PAISES))
+        if desconocidos:
+            parser.error(f"--paises: desconocidos {desconocidos}")
+        metodos = [m.strip() for m in (args.metodos or METODO).split(",") if m.strip()]
+        trabajos = matriz(parse_anios(args.anios or str(ANIO)), metodos, paises)
+        resumenes = ejecutar_lote(trabajos, args.salida_lote, fmt=args.formato, procesos=args.procesos,
+                                  por_host=args.por_host, max_ec_rows=args.max_filas_ecuador)
+        errores = [r for r in resumenes if r["error"]]
+        print(f"✅ Lote: {sum(r['filas'] for r in resumenes)} registros en {len(resumenes)} trabajos "
+              f"({len(errores)} con error) → {args.salida_lote / 'lote.json'}")
+        raise SystemExit(1 if errores else 0)
+    if args.no_llm:
+        set_backend(DisabledBackend())
+        utils_fuentes.CHILE_LLM_FALLBACK = False
+    if args.metricas or args.openmetrics:
+        METRICAS.activar()
 
-    with open("datos_normalizados.json", "w", encoding="utf-8") as f:
-        json.dump(normalized_data, f, indent=2, ensure_ascii=False)
-    print("✅ Datos guardados en datos_normalizados.json")
+    print("📦 Ejecutando Router Agent (recolección de datos)...")
+    cubo = CuboAgregado()
+    indice = IndiceEntidades(INDICE_PATH)
+    normalized_data = ejecutar_router(incremental=args.incremental, cubo=cubo, indice=indice)
+    indice.close()
+
+    n_rows = write_dataset(normalized_data, OUTPUT_DIR, fmt=args.formato)
+    print(f"✅ {n_rows} registros guardados en {OUTPUT_DIR}/ (particionado por país)")
+    if args.json:
+        with open("datos_normalizados.json", "w", encoding="utf-8") as f:
+            json.dump(a_dicts(normalized_data), f, ensure_ascii=False)
+        print("✅ Datos guardados en datos_normalizados.json")
 
     print("\n✔️ Países detectados:")
     conteo_paises = Counter(d["pais"] for d in normalized_data)
@@ -446,54 +349,32 @@ if __name__ == "__main__":
         print(f" - {pais}: {cantidad} registros")
 
     # --- 1) Totales locales (USD) por país y categoría ---
-    def compute_totals(data):
-        objetivos = {"Salud", "Educación", "Infraestructura"}
-        totals = defaultdict(lambda: defaultdict(float))
-        for d in data:
-            pais = d.get("pais", "Desconocido")
-            cat = d.get("categoria", "Otras")
-            amt = float(d.get("presupuesto_usd") or 0)
-            if amt == 0:
-                amt = float(d.get("valor_adj_usd") or 0)  # safety net
-            if cat in objetivos:
-                totals[pais][cat] += amt
-        # Asegura países/categorías aunque estén en 0
-        for p in ["Ecuador", "Colombia", "Chile"]:
-            for c in ["Salud", "Educación", "Infraestructura"]:
-                _ = totals[p][c]
-        return totals
-
-    totales = compute_totals(normalized_data)
+    totales = cubo.totales()
 
     print("\n📊 Totales por país y categoría:")
     for pais in sorted(totales.keys()):
         print(f" - {pais}: ", {cat: round(val, 2) for cat, val in totales[pais].items()})
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_DIR / "totales_usd.json", "w", encoding="utf-8") as f:
+        json.dump(totales, f, ensure_ascii=False, indent=2)
 
-    # --- 2) Muestra estratificada para GPT ---
-    def stratified_sample(data, k_per_country=120):
-        by_country = defaultdict(list)
-        for d in data:
-            by_country[d.get("pais", "Desconocido")].append(d)
-        sampled = []
-        for pais, filas in by_country.items():
-            sampled.extend(filas[:k_per_country])
-        return sampled
-
-    muestra_para_gpt = stratified_sample(normalized_data, k_per_country=120)
-
-    payload_gpt = {
-        "totales_usd": {
-            pais: {cat: round(val, 2) for cat, val in cats.items()}
-            for pais, cats in totales.items()
-        },
-        "muestra": muestra_para_gpt[:300]
-    }
-
-    print("\n📤 Enviando datos al Analysis Agent...")
-    input_text = json.dumps(payload_gpt, ensure_ascii=False)
-
-    final_report = run_agent(analysis_agent, input_text)
-
-    print("\n📄 Informe generado por GPT:\n")
-    print(final_report)
+    if args.no_llm:
+        print("\n⏭️ --no-llm: se omite el Analysis Agent.")
+    else:
+        # --- 2) Muestra estratificada (país, categoría) dentro del presupuesto de tokens ---
+        analysis_agent = get_agent("analysis_agent")
+        input_text = construir_payload(normalized_data, totales, max_tokens=args.max_tokens_analisis,
+                                       model=analysis_agent.model)
+        print(f"\n📤 Enviando datos al Analysis Agent (~{contar_tokens(input_text, analysis_agent.model)} tokens)...")
+
+        final_report = run_agent(analysis_agent, input_text)
+
+        print("\n📄 Informe generado por GPT:\n")
+        print(final_report)
+        print(f"\n🗃️ Caché LLM: {LLM_CACHE.stats()}")
+
+    if METRICAS.activo:
+        print(f"📈 Métricas en {METRICAS.exportar_json(args.metricas or DATA_DIR / 'metricas.json')}")
+        if args.openmetrics:
+            print(f"📈 OpenMetrics en {METRICAS.exportar_openmetrics(args.openmetrics)}")
 
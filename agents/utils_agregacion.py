@@ -0,0 +1,159 @@
+# utils_agregacion.py
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from utils_clasificador import CATEGORIAS
+
+PAISES = ["Ecuador", "Colombia", "Chile"]
+DIMENSIONES = ("pais", "categoria", "lugar", "mes", "proveedor")
+# Valor de la dimensión cuando el registro no la trae
+POR_DEFECTO = {"pais": "Desconocido", "categoria": "Otras"}
+
+_ISO_MES = re.compile(r"^(\d{4})-(\d{2})")
+_DMY_MES = re.compile(r"^\d{1,2}[/-](\d{1,2})[/-](\d{4})")
+
+
+def mes_de(fecha) -> str:
+    """'2023-05-04T10:00:00' → '2023-05'; también dd/mm/aaaa. '' si no se reconoce."""
+    s = str(fecha or "").strip()
+    m = _ISO_MES.match(s)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = _DMY_MES.match(s)
+    if m:
+        return f"{m.group(2)}-{int(m.group(1)):02d}"
+    return ""
+
+
+def monto_usd(d: Dict[str, Any]) -> float:
+    amt = float(d.get("presupuesto_usd") or 0)
+    if amt == 0:
+        amt = float(d.get("valor_adj_usd") or 0)  # safety net
+    return amt
+
+
+class Agg:
+    __slots__ = ("count", "sum", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Agg"):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0, "sum": 0.0, "mean": 0.0, "min": 0.0, "max": 0.0}
+        return {"count": self.count, "sum": self.sum, "mean": self.mean, "min": self.min, "max": self.max}
+
+
+class CuboAgregado:
+    """
+    Agregados (suma, conteo, media, mín, máx) de un monto por combinaciones de
+    dimensiones, actualizados a medida que llegan registros.
+
+    Se guarda la celda más fina (todas las dimensiones); cada `query` con un
+    group_by nuevo materializa ese rollup y desde entonces también se mantiene
+    de forma incremental, así que las consultas repetidas no recorren nada.
+    """
+
+    def __init__(self, dimensiones: Sequence[str] = DIMENSIONES,
+                 valor: Callable[[Dict[str, Any]], float] = monto_usd):
+        self.dimensiones = tuple(dimensiones)
+        self.valor = valor
+        self.celdas: Dict[Tuple, Agg] = defaultdict(Agg)
+        self.rollups: Dict[Tuple[str, ...], Dict[Tuple, Agg]] = {}
+        self.registros = 0
+        self.lock = threading.Lock()
+
+    def _clave(self, d: Dict[str, Any]) -> Tuple:
+        out = []
+        for dim in self.dimensiones:
+            if dim == "mes":
+                out.append(mes_de(d.get("fecha_conv")))
+            else:
+                v = d.get(dim, POR_DEFECTO.get(dim))
+                out.append("" if v is None else str(v).strip())
+        return tuple(out)
+
+    def _proyectar(self, clave: Tuple, dims: Tuple[str, ...]) -> Tuple:
+        return tuple(clave[self.dimensiones.index(dim)] for dim in dims)
+
+    def add(self, d: Dict[str, Any]):
+        clave = self._clave(d)
+        v = self.valor(d)
+        with self.lock:
+            self.celdas[clave].add(v)
+            for dims, tabla in self.rollups.items():
+                tabla[self._proyectar(clave, dims)].add(v)
+            self.registros += 1
+
+    def add_many(self, registros: Iterable[Dict[str, Any]]):
+        for d in registros:
+            self.add(d)
+
+    def _rollup(self, dims: Tuple[str, ...]) -> Dict[Tuple, Agg]:
+        if dims == self.dimensiones:
+            return self.celdas
+        tabla = self.rollups.get(dims)
+        if tabla is None:
+            tabla = defaultdict(Agg)
+            for clave, agg in self.celdas.items():
+                tabla[self._proyectar(clave, dims)].merge(agg)
+            self.rollups[dims] = tabla
+        return tabla
+
+    def query(self, group_by: Sequence[str] = ("pais",), where: Optional[Dict[str, Any]] = None
+              ) -> Dict[Tuple, Dict[str, float]]:
+        """
+        Devuelve {valores de group_by: {count, sum, mean, min, max}}.
+        where = {dimensión: valor o conjunto de valores} filtra antes de agrupar.
+        """
+        where = where or {}
+        for dim in list(group_by) + list(where):
+            if dim not in self.dimensiones:
+                raise KeyError(f"Dimensión no agregada: {dim}")
+        # Se usa el rollup de (group_by + dimensiones filtradas) y se filtra sobre él
+        dims = tuple(d for d in self.dimensiones if d in group_by or d in where)
+        filtros = {
+            dims.index(dim): (set(val) if isinstance(val, (set, list, tuple, frozenset)) else {val})
+            for dim, val in where.items()
+        }
+        pos = [dims.index(dim) for dim in group_by]
+        out: Dict[Tuple, Agg] = defaultdict(Agg)
+        with self.lock:
+            for clave, agg in self._rollup(dims).items():
+                if all(clave[i] in vals for i, vals in filtros.items()):
+                    out[tuple(clave[i] for i in pos)].merge(agg)
+        return {k: v.as_dict() for k, v in out.items()}
+
+    def totales(self, paises: Sequence[str] = PAISES, categorias: Sequence[str] = CATEGORIAS
+                ) -> Dict[str, Dict[str, float]]:
+        """Suma por país y categoría objetivo, con 0 en las combinaciones sin datos."""
+        totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for (pais, cat), agg in self.query(("pais", "categoria"), where={"categoria": set(categorias)}).items():
+            totals[pais][cat] += agg["sum"]
+        for p in paises:
+            for c in categorias:
+                _ = totals[p][c]
+        return totals
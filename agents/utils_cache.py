@@ -0,0 +1,150 @@
+# utils_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", "./data/http_cache"))
+CACHE_MAX_BYTES = int(float(os.getenv("HTTP_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+# TTL por fuente (segundos); 0 desactiva la caché para esa fuente
+CACHE_TTLS = {
+    "ecuador": float(os.getenv("HTTP_CACHE_TTL_ECUADOR", str(6 * 3600))),
+    "colombia": float(os.getenv("HTTP_CACHE_TTL_COLOMBIA", str(6 * 3600))),
+    "chile": float(os.getenv("HTTP_CACHE_TTL_CHILE", str(24 * 3600))),
+}
+
+_offline = os.getenv("HTTP_OFFLINE", "0") == "1"
+
+
+class OfflineCacheMiss(requests.RequestException):
+    """Modo offline y la respuesta no está en caché."""
+
+
+def set_offline(value: bool = True):
+    global _offline
+    _offline = value
+
+
+def is_offline() -> bool:
+    return _offline
+
+
+def cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    raw = json.dumps([url, sorted((params or {}).items())], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    """
+    Caché en disco direccionada por hash(url + params). Cada entrada son dos
+    archivos: <key>.body (bytes de la respuesta) y <key>.json (metadatos).
+    Se expulsan las entradas menos usadas cuando se supera max_bytes.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._index: Optional[Dict[str, list]] = None  # key -> [size, last_access]
+
+    def _paths(self, key: str):
+        return self.root / f"{key}.body", self.root / f"{key}.json"
+
+    def _load_index(self) -> Dict[str, list]:
+        if self._index is None:
+            self._index = {}
+            if self.root.exists():
+                for meta_path in self.root.glob("*.json"):
+                    body = meta_path.with_suffix(".body")
+                    if body.exists():
+                        st = body.stat()
+                        self._index[meta_path.stem] = [st.st_size, st.st_mtime]
+        return self._index
+
+    def lookup(self, url: str, params: Optional[Dict[str, Any]], ttl: float) -> Optional[Path]:
+        """Ruta del cuerpo cacheado si existe y está vigente (en offline se ignora el TTL)."""
+        key = cache_key(url, params)
+        body, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not body.exists():
+            return None
+        if not _offline and (ttl <= 0 or time.time() - meta.get("fetched_at", 0) > ttl):
+            return None
+        now = time.time()
+        os.utime(body, (now, now))
+        with self.lock:
+            entry = self._load_index().get(key)
+            if entry:
+                entry[1] = now
+        return body
+
+    def get_bytes(self, url: str, params: Optional[Dict[str, Any]], ttl: float) -> Optional[bytes]:
+        body = self.lookup(url, params, ttl)
+        if body is None:
+            return None
+        return body.read_bytes()
+
+    @contextmanager
+    def writer(self, url: str, params: Optional[Dict[str, Any]]) -> Iterator[Any]:
+        """Escribe el cuerpo en un temporal; solo se publica si el bloque termina sin error."""
+        key = cache_key(url, params)
+        body, meta_path = self._paths(key)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # pid + hilo: varios procesos (utils_lotes) comparten la misma caché
+        tmp = body.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+        f = open(tmp, "wb")
+        try:
+            yield f
+        except BaseException:
+            f.close()
+            tmp.unlink(missing_ok=True)
+            raise
+        f.close()
+        os.replace(tmp, body)
+        with open(meta_path, "w", encoding="utf-8") as fm:
+            json.dump({"url": url, "params": params or {}, "fetched_at": time.time()}, fm,
+                      ensure_ascii=False, default=str)
+        try:
+            size = body.stat().st_size
+        except FileNotFoundError:  # expulsada por otro proceso
+            return
+        self._register(key, size)
+
+    def put_bytes(self, url: str, params: Optional[Dict[str, Any]], data: bytes):
+        with self.writer(url, params) as f:
+            f.write(data)
+
+    def _register(self, key: str, size: int):
+        with self.lock:
+            index = self._load_index()
+            index[key] = [size, time.time()]
+            total = sum(e[0] for e in index.values())
+            if total <= self.max_bytes:
+                return
+            for old_key, (old_size, _) in sorted(index.items(), key=lambda kv: kv[1][1]):
+                if total <= self.max_bytes or old_key == key:
+                    continue
+                for p in self._paths(old_key):
+                    p.unlink(missing_ok=True)
+                del index[old_key]
+                total -= old_size
+
+
+HTTP_CACHE = HttpCache()
+
+
+def miss(url: str):
+    """Se llama ante un fallo de caché: en modo offline corta aquí."""
+    if _offline:
+        raise OfflineCacheMiss(f"[offline] sin respuesta cacheada para {url}")
@@ -0,0 +1,582 @@
+# utils_chile.py
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils_cache import CACHE_TTLS, is_offline, miss
+from utils_http import HTTP
+from utils_metricas import METRICAS
+from utils_registro import Registro
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow es opcional: sin él se lee por rangos en un pool de procesos
+    pa = None
+    pc = None
+    pacsv = None
+
+IO_CHUNK = 1024 * 1024  # 1 MB para red y disco
+
+# Orden de columnas de chile_normalized.csv (ver SCHEMA en final_agent.py)
+SCHEMA_FIELDS = [
+    "id", "entidad", "objeto", "presupuesto", "moneda", "lugar",
+    "fecha_conv", "fecha_adj", "oferentes", "proveedor", "valor_adj", "justificacion",
+]
+
+# Candidatos por campo, en orden de preferencia. Las claves se comparan ya
+# normalizadas (minúsculas, sin separadores), así "value/amount", "value_amount"
+# y "value.amount" caen todas en "valueamount".
+CHILE_COLUMN_MAP: Dict[str, List[str]] = {
+    "id": ["id", "contractid", "ocid"],
+    "entidad": [
+        "buyername", "buyer", "tenderprocuringentityname", "procuringentityname",
+        "compradornombre", "entidad",
+    ],
+    "objeto": ["title", "tendertitle", "description", "objeto"],
+    "presupuesto": ["valueamount", "tendervalueamount", "amount", "presupuesto"],
+    "moneda": ["valuecurrency", "tendervaluecurrency", "currency", "moneda"],
+    "lugar": [
+        "buyeraddressregion", "deliveryaddressregion", "region",
+        "buyeraddresslocality", "lugar",
+    ],
+    "fecha_conv": [
+        "tendertenderperiodstartdate", "tenderperiodstartdate", "tenderdatepublished",
+        "datepublished", "periodstartdate", "fecha_conv",
+    ],
+    "fecha_adj": ["datesigned", "awarddate", "dateawarded", "fecha_adj"],
+    "oferentes": ["tendernumberoftenderers", "numberoftenderers", "oferentes"],
+    "proveedor": [
+        "suppliersname", "suppliers0name", "suppliername", "awardsuppliersname",
+        "supplier", "proveedor",
+    ],
+    "valor_adj": ["awardvalueamount", "valueamount", "amount", "valor_adj"],
+    "justificacion": [
+        "tenderprocurementmethodrationale", "procurementmethodrationale",
+        "justificacion",
+    ],
+}
+
+
+def _norm_col(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", (name or "").strip().lower())
+
+
+def detect_delimiter(first_line: str) -> str:
+    return ";" if first_line.count(";") > first_line.count(",") else ","
+
+
+def build_column_index(header: List[str]) -> Dict[str, Optional[int]]:
+    """Devuelve, para cada campo de SCHEMA_FIELDS, el índice de columna del CSV (o None)."""
+    positions: Dict[str, int] = {}
+    for i, col in enumerate(header):
+        positions.setdefault(_norm_col(col), i)
+
+    index: Dict[str, Optional[int]] = {}
+    for field in SCHEMA_FIELDS:
+        index[field] = None
+        for cand in CHILE_COLUMN_MAP[field]:
+            pos = positions.get(_norm_col(cand))
+            if pos is not None:
+                index[field] = pos
+                break
+    return index
+
+
+def iter_chile_rows(reader, index: Dict[str, Optional[int]]) -> Iterator[List[str]]:
+    for row in reader:
+        if not row:
+            continue
+        out = []
+        for field in SCHEMA_FIELDS:
+            pos = index[field]
+            val = row[pos].strip() if pos is not None and pos < len(row) else ""
+            out.append(val)
+        if not out[0]:
+            continue
+        if not out[4]:
+            out[4] = "CLP"
+        yield out
+
+
+def normalize_chile_rules(file_path: Path, out_file: Path) -> Optional[Path]:
+    """
+    Normaliza contracts.csv (OCDS) a SCHEMA_FIELDS leyendo fila a fila.
+    Devuelve None si no se puede mapear ni siquiera la columna id.
+    """
+    with open(file_path, "r", encoding="utf-8-sig", errors="ignore", newline="") as f:
+        first_line = f.readline()
+        f.seek(0)
+        reader = csv.reader(f, delimiter=detect_delimiter(first_line))
+        header = next(reader, None)
+        if header is None:
+            with open(out_file, "w", encoding="utf-8", newline="") as fout:
+                csv.writer(fout).writerow(SCHEMA_FIELDS)
+            print(f"[Chile] Archivo vacío, creado CSV normalizado vacío → {out_file}")
+            return out_file
+
+        index = build_column_index(header)
+        if index["id"] is None:
+            return None
+        missing = [k for k, v in index.items() if v is None]
+        if missing:
+            print(f"[Chile] Columnas sin mapeo (quedan vacías): {', '.join(missing)}")
+
+        n = 0
+        with open(out_file, "w", encoding="utf-8", newline="") as fout:
+            writer = csv.writer(fout)
+            writer.writerow(SCHEMA_FIELDS)
+            for out in iter_chile_rows(reader, index):
+                writer.writerow(out)
+                n += 1
+        METRICAS.incr("lineas_entrada", max(reader.line_num - 1, 0), etapa="chile_reglas")
+        METRICAS.incr("filas_salida", n, etapa="chile_reglas")
+
+    print(f"[Chile] Normalización por reglas completada ({n} filas) → {out_file}")
+    return out_file
+
+
+# ========================
+# Lectura de chile_normalized.csv (lotes columnares, en paralelo)
+# ========================
+
+# "auto" (pyarrow.csv si está instalado), "pyarrow" o "procesos"
+CSV_MOTOR = os.getenv("CHILE_CSV_MOTOR", "auto")
+CSV_PROCESOS = int(os.getenv("CHILE_CSV_PROCESOS", "0"))  # 0 = os.cpu_count()
+# Por debajo de este tamaño no compensa levantar procesos
+CSV_MIN_PARALELO = int(float(os.getenv("CHILE_CSV_MIN_MB", "32")) * 1024 * 1024)
+CSV_RANGO_BYTES = 16 * 1024 * 1024  # tamaño aproximado de cada rango (y de cada bloque de pyarrow)
+# Sin fork: la lectura corre en un hilo del router mientras otras fuentes están en
+# medio de llamadas HTTP, y hacer fork de un proceso con hilos puede bloquearse
+CSV_INICIO_PROCESOS = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Un lote: {campo de SCHEMA_FIELDS: [valores]}, todas las listas del mismo largo
+Lote = Dict[str, List[str]]
+
+
+def _leer_registro(f) -> bytes:
+    """Un registro completo desde la posición actual (un campo entre comillas puede abarcar líneas)."""
+    buf = b""
+    while True:
+        line = f.readline()
+        buf += line
+        if not line or buf.count(b'"') % 2 == 0:
+            return buf
+
+
+def rangos_registros(path: Path, partes: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    Cabecera y hasta `partes` rangos [inicio, fin) de bytes alineados a límites
+    de registro. Cada corte avanza hasta el primer salto de línea precedido por
+    una cantidad par de comillas (fuera de un campo); las comillas se cuentan
+    en una sola pasada secuencial con bytes.count.
+    """
+    size = Path(path).stat().st_size
+    with open(path, "rb") as f:
+        header = _leer_registro(f)
+        pos = f.tell()
+        cortes = [pos]
+        comillas = 0
+        for k in range(1, partes):
+            objetivo = cortes[0] + (size - cortes[0]) * k // partes
+            while pos < objetivo:
+                blk = f.read(min(IO_CHUNK, objetivo - pos))
+                if not blk:
+                    break
+                comillas += blk.count(b'"')
+                pos += len(blk)
+            while True:
+                line = f.readline()
+                comillas += line.count(b'"')
+                pos += len(line)
+                if not line or (comillas % 2 == 0 and line.endswith(b"\n")):
+                    break
+            if pos >= size:
+                break
+            if pos > cortes[-1]:
+                cortes.append(pos)
+        cortes.append(size)
+    return header, [(a, b) for a, b in zip(cortes, cortes[1:]) if b > a]
+
+
+def _indices_cabecera(nombres: List[str]) -> Dict[str, Optional[int]]:
+    posiciones: Dict[str, int] = {}
+    for i, nombre in enumerate(nombres):
+        posiciones.setdefault(nombre.strip().lower(), i)
+    return {field: posiciones.get(field) for field in SCHEMA_FIELDS}
+
+
+def _columnas(filas: Iterable[List[str]], indices: Dict[str, Optional[int]], bloque: int = 2048) -> Lote:
+    ancho = max((i for i in indices.values() if i is not None), default=-1) + 1
+    columnas: List[List[str]] = [[] for _ in range(ancho)]
+    n = 0
+    filas = iter(filas)
+    # Por bloques: las listas de cada fila mueren jóvenes y el GC no las recorre de nuevo
+    while True:
+        leidas = list(islice(filas, bloque))
+        if not leidas:
+            break
+        leidas = [r for r in leidas if r]
+        for r in leidas:
+            if len(r) < ancho:
+                r.extend([""] * (ancho - len(r)))
+        # Transpuesta en C: una tupla por columna
+        for col, valores in zip(columnas, zip(*leidas)):
+            col.extend(map(str.strip, valores))
+        n += len(leidas)
+    lote: Lote = {}
+    for field in SCHEMA_FIELDS:
+        i = indices[field]
+        lote[field] = [""] * n if i is None else columnas[i]
+    # Sin id o cabecera repetida (la salida del LLM puede traer una por chunk)
+    ids = lote["id"]
+    keep = [j for j, v in enumerate(ids) if v and v.lower() != "id"]
+    if len(keep) != len(ids):
+        lote = {field: [col[j] for j in keep] for field, col in lote.items()}
+    lote["moneda"] = [(m or "CLP").upper() for m in lote["moneda"]]
+    return lote
+
+
+def _parsear_rango(path: str, inicio: int, fin: int, delim: str, indices: Dict[str, Optional[int]]) -> Lote:
+    with open(path, "rb") as f:
+        f.seek(inicio)
+        texto = f.read(fin - inicio).decode("utf-8", errors="ignore")
+    return _columnas(csv.reader(io.StringIO(texto, newline=""), delimiter=delim), indices)
+
+
+def _contexto_procesos():
+    ctx = multiprocessing.get_context(CSV_INICIO_PROCESOS)
+    if CSV_INICIO_PROCESOS == "forkserver":
+        # El servidor (un proceso sin hilos) importa una sola vez __main__ y este
+        # módulo; cada worker es un fork suyo en vez de volver a importar todo
+        ctx.set_forkserver_preload(["__main__", __name__])
+    return ctx
+
+
+def _lotes_procesos(path: Path, delim: str, procesos: Optional[int]) -> Iterator[Lote]:
+    size = path.stat().st_size
+    procesos = procesos or CSV_PROCESOS or os.cpu_count() or 1
+    paralelo = procesos > 1 and size >= CSV_MIN_PARALELO
+    header, rangos = rangos_registros(path, max(1, size // CSV_RANGO_BYTES, procesos if paralelo else 1))
+    nombres = next(csv.reader(io.StringIO(header.decode("utf-8-sig", errors="ignore"), newline=""),
+                              delimiter=delim), [])
+    indices = _indices_cabecera(nombres)
+    if not paralelo or len(rangos) == 1:
+        for inicio, fin in rangos:
+            yield _parsear_rango(str(path), inicio, fin, delim, indices)
+        return
+    # map conserva el orden de los rangos (y por lo tanto el de las filas)
+    pool = ProcessPoolExecutor(max_workers=min(procesos, len(rangos)), mp_context=_contexto_procesos())
+    try:
+        yield from pool.map(_parsear_rango, repeat(str(path)), [a for a, _ in rangos], [b for _, b in rangos],
+                            repeat(delim), repeat(indices))
+    finally:
+        # Si el consumidor deja de leer (p. ej. timeout del router), los rangos en cola no se parsean
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _tipos_texto(path: Path, delim: str) -> Dict[str, "pa.DataType"]:
+    # Todas las columnas como texto: los montos se interpretan después (utils_montos)
+    with open(path, "r", encoding="utf-8-sig", errors="ignore", newline="") as f:
+        nombres = next(csv.reader(f, delimiter=delim), [])
+    return {n: pa.string() for n in nombres}
+
+
+def _tabla_pyarrow(path: Path, delim: str):
+    """Lee, recorta y filtra con pyarrow (multihilo). Lanza ArrowInvalid si el CSV no es regular."""
+    tabla = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=CSV_RANGO_BYTES, use_threads=True),
+        parse_options=pacsv.ParseOptions(delimiter=delim, newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=False, quoted_strings_can_be_null=False,
+                                             column_types=_tipos_texto(path, delim)),
+    )
+    indices = _indices_cabecera(tabla.column_names)
+    cols = {}
+    for field in SCHEMA_FIELDS:
+        i = indices[field]
+        cols[field] = (pa.array([""] * tabla.num_rows, pa.string()) if i is None
+                       else pc.utf8_trim_whitespace(tabla.column(i)))
+    ids = cols["id"]
+    mask = pc.and_(pc.not_equal(ids, ""), pc.not_equal(pc.utf8_lower(ids), "id"))
+    moneda = cols["moneda"]
+    cols["moneda"] = pc.if_else(pc.equal(moneda, ""), "CLP", pc.utf8_upper(moneda))
+    return pa.table(cols).filter(mask)
+
+
+def iter_lotes_csv(path: Path, motor: Optional[str] = None, procesos: Optional[int] = None) -> Iterator[Lote]:
+    """
+    Lee chile_normalized.csv en lotes columnares {campo: [str, ...]} con los
+    valores recortados, sin filas sin id ni cabeceras repetidas y con la moneda
+    en mayúsculas (CLP si falta). El delimitador se detecta una vez.
+
+    motor: "pyarrow" (lector nativo multihilo) o "procesos" (rangos de bytes
+    alineados a registros, parseados en un pool de procesos). Con "auto" se usa
+    pyarrow si está instalado y el CSV es regular; si no, el pool de procesos.
+    """
+    path = Path(path)
+    motor = motor or CSV_MOTOR
+    with open(path, "rb") as f:
+        first = f.readline()
+    if not first:
+        return
+    delim = detect_delimiter(first.decode("utf-8-sig", errors="ignore"))
+
+    if motor == "pyarrow" and pacsv is None:
+        raise ImportError("Para CHILE_CSV_MOTOR=pyarrow hace falta instalar pyarrow")
+    if motor in ("auto", "pyarrow") and pacsv is not None:
+        try:
+            tabla = _tabla_pyarrow(path, delim)
+        except pa.ArrowInvalid as e:
+            if motor == "pyarrow":
+                raise
+            # p. ej. filas con otra cantidad de columnas o UTF-8 inválido
+            print(f"[Chile] pyarrow no pudo leer {path.name} ({e}); se lee por rangos.")
+        else:
+            for batch in tabla.to_batches(max_chunksize=100_000):
+                yield batch.to_pydict()
+            return
+    yield from _lotes_procesos(path, delim, procesos)
+
+
+def registros_de_lote(lote: Lote, pais: str = "Chile") -> List[Registro]:
+    return Registro.desde_columnas({field: lote[field] for field in SCHEMA_FIELDS}, pais=pais)
+
+
+
+# ========================
+# Chunks para el LLM (streaming, por presupuesto de tokens)
+# ========================
+
+CHARS_PER_TOKEN = 3.5  # estimación conservadora para texto en español / CSV
+# Tokens de entrada por chunk; la salida (12 columnas) debe caber en la respuesta
+MODEL_CHUNK_TOKENS = {"gpt-4o": 24000, "gpt-4o-mini": 24000}
+DEFAULT_CHUNK_TOKENS = 8000
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def chunk_token_budget(model: str) -> int:
+    return MODEL_CHUNK_TOKENS.get(model, DEFAULT_CHUNK_TOKENS)
+
+
+def iter_csv_records(f) -> Iterator[str]:
+    """
+    Texto crudo de cada registro CSV. Un registro termina en la primera línea en
+    que el número acumulado de comillas es par, así que los campos entre comillas
+    con saltos de línea nunca se parten ("" escapado suma 2 y no cambia la paridad).
+    """
+    buf: List[str] = []
+    quotes = 0
+    for line in f:
+        buf.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield "".join(buf)
+            buf = []
+            quotes = 0
+    if buf:
+        yield "".join(buf)
+
+
+def iter_csv_chunks(file_path: Path, max_tokens: int, max_records: Optional[int] = None) -> Iterator[str]:
+    """
+    Lee el CSV de forma perezosa y agrupa registros completos hasta max_tokens
+    (estimados). Cada chunk repite la cabecera; un registro que por sí solo
+    supera el presupuesto va en un chunk propio, sin recortar.
+    """
+    with open(file_path, "r", encoding="utf-8-sig", errors="ignore") as f:
+        records = iter_csv_records(f)
+        header = next(records, None)
+        if header is None:
+            return
+        if not header.endswith("\n"):
+            header += "\n"
+        header_tokens = estimate_tokens(header)
+
+        parts, tokens, n = [header], header_tokens, 0
+        for rec in records:
+            if not rec.strip():
+                continue
+            if not rec.endswith("\n"):
+                rec += "\n"
+            t = estimate_tokens(rec)
+            if n and (tokens + t > max_tokens or (max_records and n >= max_records)):
+                yield "".join(parts)
+                parts, tokens, n = [header], header_tokens, 0
+            parts.append(rec)
+            tokens += t
+            n += 1
+        if n:
+            yield "".join(parts)
+
+
+# ========================
+# Descarga condicional / reanudable y extracción en streaming
+# ========================
+
+def _load_meta(meta_path: Path) -> Dict[str, str]:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(meta_path: Path, meta: Dict[str, Any]) -> None:
+    tmp = meta_path.with_name(f"{meta_path.name}.tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, meta_path)
+
+
+def _save_meta(meta_path: Path, url: str, resp, csv_path: Optional[Path]) -> None:
+    _write_meta(meta_path, {
+        "url": url,
+        "etag": resp.headers.get("ETag", ""),
+        "last_modified": resp.headers.get("Last-Modified", ""),
+        "csv": str(csv_path) if csv_path else "",
+        "fetched_at": time.time(),
+    })
+
+
+def chile_archive_version(data_dir: Path) -> str:
+    """Versión del último tar.gz descargado (ETag o Last-Modified), "" si no se conoce."""
+    meta = _load_meta(data_dir / "chile.meta.json")
+    return meta.get("etag") or meta.get("last_modified") or ""
+
+
+def _touch_meta(meta_path: Path, meta: Dict[str, str]) -> None:
+    _write_meta(meta_path, {**meta, "fetched_at": time.time()})
+
+
+def _conditional_headers(meta: Dict[str, str], url: str) -> Dict[str, str]:
+    if meta.get("url") != url or not meta.get("csv") or not Path(meta["csv"]).exists():
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _safe_target(data_dir: Path, member_name: str) -> Path:
+    rel = Path(member_name)
+    if rel.is_absolute() or ".." in rel.parts:
+        raise ValueError(f"[Chile] Ruta no permitida en el tar.gz: {member_name}")
+    return data_dir / rel
+
+
+def _extract_contracts(tar: tarfile.TarFile, data_dir: Path) -> Optional[Path]:
+    # Lectura secuencial: se detiene en cuanto aparece contracts.csv
+    for member in tar:
+        if member.isfile() and member.name.endswith("contracts.csv"):
+            print(f"[Chile] Extrayendo {member.name} ...")
+            target = _safe_target(data_dir, member.name)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Se escribe aparte y se publica completo: un corte a mitad de la descarga
+            # (red, timeout del router, Ctrl-C) deja intacto el contracts.csv anterior,
+            # que es al que apunta chile.meta.json. pid: varios procesos (utils_lotes)
+            part = target.with_name(f"{target.name}.part{os.getpid()}")
+            src = tar.extractfile(member)
+            try:
+                with open(part, "wb") as fout:
+                    shutil.copyfileobj(src, fout, IO_CHUNK)
+                    fout.flush()
+                    os.fsync(fout.fileno())
+            except BaseException:
+                part.unlink(missing_ok=True)
+                raise
+            os.replace(part, target)
+            return target
+    return None
+
+
+def download_chile_csv(url: str, data_dir: Path, mode: str = "stream", timeout: int = 120) -> Path:
+    """
+    mode="stream": el tar.gz se descomprime directamente desde la respuesta HTTP.
+    mode="file":   se guarda chile.tar.gz (reanudable con Range) y luego se extrae.
+    En ambos modos se omite la descarga si ETag/Last-Modified no cambiaron.
+    """
+    data_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = data_dir / "chile.meta.json"
+    meta = _load_meta(meta_path)
+    headers = _conditional_headers(meta, url)
+
+    # Dentro del TTL (o en modo offline) no se consulta la red
+    if headers and (is_offline() or time.time() - meta.get("fetched_at", 0) <= CACHE_TTLS["chile"]):
+        print(f"[Chile] Usando CSV en caché {meta['csv']}")
+        METRICAS.incr("cache_hits", fuente="chile")
+        return Path(meta["csv"])
+    miss(url)
+
+    if mode == "stream":
+        with HTTP.get(url, stream=True, headers=headers, timeout=timeout, fuente="chile") as resp:
+            if resp.status_code == 304:
+                print(f"[Chile] Sin cambios (304), reutilizando {meta['csv']}")
+                _touch_meta(meta_path, meta)
+                return Path(meta["csv"])
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            print(f"[Chile] Descargando y extrayendo en streaming desde {url} ...")
+            with tarfile.open(fileobj=resp.raw, mode="r|gz", bufsize=IO_CHUNK) as tar:
+                csv_output = _extract_contracts(tar, data_dir)
+            METRICAS.incr("bytes_descargados", resp.raw.tell(), fuente="chile")
+            if csv_output is None:
+                raise FileNotFoundError("[Chile] No se encontró un contracts.csv en el tar.gz")
+            _save_meta(meta_path, url, resp, csv_output)
+        print(f"[Chile] CSV extraído en {csv_output}")
+        return csv_output
+
+    tar_path = data_dir / "chile.tar.gz"
+    part_path = data_dir / "chile.tar.gz.part"
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    if offset:
+        # Reanudar solo si el recurso sigue siendo el mismo
+        headers = {"Range": f"bytes={offset}-"}
+        if meta.get("url") == url and (meta.get("etag") or meta.get("last_modified")):
+            headers["If-Range"] = meta.get("etag") or meta["last_modified"]
+
+    print(f"[Chile] Descargando desde {url} ...")
+    with HTTP.get(url, stream=True, headers=headers, timeout=timeout, fuente="chile") as resp:
+        if resp.status_code == 304:
+            print(f"[Chile] Sin cambios (304), reutilizando {meta['csv']}")
+            _touch_meta(meta_path, meta)
+            return Path(meta["csv"])
+        resp.raise_for_status()
+        if resp.status_code == 206:
+            print(f"[Chile] Reanudando descarga desde el byte {offset}")
+            file_mode = "ab"
+        else:
+            file_mode = "wb"
+        # Se guarda ETag/Last-Modified antes de terminar para poder usar If-Range
+        _save_meta(meta_path, url, resp, None)
+        with open(part_path, file_mode) as f:
+            for chunk in resp.iter_content(chunk_size=IO_CHUNK):
+                f.write(chunk)
+                METRICAS.incr("bytes_descargados", len(chunk), fuente="chile")
+        part_path.replace(tar_path)
+
+        print(f"[Chile] Archivo comprimido guardado en {tar_path}")
+        with tarfile.open(tar_path, "r|gz", bufsize=IO_CHUNK) as tar:
+            csv_output = _extract_contracts(tar, data_dir)
+        if csv_output is None:
+            raise FileNotFoundError("[Chile] No se encontró un contracts.csv en el tar.gz")
+        _save_meta(meta_path, url, resp, csv_output)
+
+    print(f"[Chile] CSV extraído en {csv_output}")
+    return csv_output
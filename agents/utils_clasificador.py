@@ -0,0 +1,169 @@
+# utils_clasificador.py
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Salud (palabras en objeto/justificación o por tipo de entidad)
+SALUD_KW = [
+    "salud", "hospital", "clínic", "clinic", "médic", "medic", "quirúrg", "quirurg",
+    "insumo", "medicament", "laboratorio", "ambulancia", "esteriliz", "equipos médicos",
+    "servicio de salud", "cesfam", "sar ", "sapu"
+]
+# Educación
+EDUC_KW = [
+    "educación", "educacion", "escuela", "colegio", "universidad", "liceo", "docente",
+    "estudiante", "alumno", "junji", "jardín infantil", "jardin infantil", "daem",
+    "institución educativa", "institucion educativa"
+]
+# Infraestructura / obras / TI/telecom/seguro/equipamiento general
+INFRA_KW = [
+    "infraestructura", "obra", "obras", "vía", "via", "carretera", "puente", "calzada",
+    "rehabilitación", "rehabilitacion", "mantenimiento vial", "alcantarillado", "agua potable",
+    "paviment", "vial", "edificaci", "servidor", "impresor", "telefon", "hpe", "seguro",
+    "mantención", "mantencion", "licitación obra", "construcción", "conservación"
+]
+
+# Heurísticas por entidad CHI
+ENTIDAD_SALUD_KW = [
+    "servicio de salud", "hospital", "cesfam", "sapu", "sar ", "posta", "ss metropolitan"
+]
+ENTIDAD_EDUC_KW = [
+    "junji", "jardín infantil", "jardin infantil", "colegio", "liceo", "daem",
+    "ministerio de educación", "universidad", "municipalidad de"  # muchas muni compran p/escuelas
+]
+ENTIDAD_INFRA_KW = [
+    "mop", "obras públicas", "obras publicas", "dirección de vialidad", "direccion de vialidad",
+    "serviu", "ministerio de obras", "municipalidad de", "dom"
+]
+
+# Orden = precedencia
+CATEGORIAS = ["Salud", "Educación", "Infraestructura"]
+
+
+def _minimal(keywords: Sequence[str]) -> List[str]:
+    # Si k contiene a otra palabra de la misma categoría, k no aporta nada
+    kws = list(dict.fromkeys(keywords))
+    return [k for k in kws if not any(o != k and o in k for o in kws)]
+
+
+def _text(value) -> str:
+    if isinstance(value, str):
+        return value
+    return f"{value or ''}"
+
+
+class _Memo(dict):
+    """dict acotado que calcula las claves faltantes con `fn` (se vacía al llenarse)."""
+
+    def __init__(self, fn, maxsize: int):
+        super().__init__()
+        self.fn = fn
+        self.maxsize = maxsize
+
+    def __missing__(self, key):
+        if len(self) >= self.maxsize:
+            self.clear()
+        value = self[key] = self.fn(key)
+        return value
+
+
+class ClasificadorCategorias:
+    """
+    Mismo resultado que el clasificador por `in` original, sin recorrer el texto
+    ~60 veces por registro:
+
+    - Las palabras sin espacios solo pueden aparecer dentro de un token de
+      texto.split(" "), así que se calcula una máscara de categorías por token
+      (memoizada) y se combinan con OR.
+    - Las palabras con espacios ("sar ", "agua potable", ...) se comprueban en el
+      texto completo solo si algún token termina con su primera parte.
+    - Los campos completos (entidad, justificación repetida) y las heurísticas
+      por entidad también se memoizan.
+    """
+
+    def __init__(self, categorias: Optional[List[Tuple[str, Sequence[str], Sequence[str]]]] = None,
+                 cache_size: int = 200_000):
+        if categorias is None:
+            categorias = [
+                ("Salud", SALUD_KW, ENTIDAD_SALUD_KW),
+                ("Educación", EDUC_KW, ENTIDAD_EDUC_KW),
+                ("Infraestructura", INFRA_KW, ENTIDAD_INFRA_KW),
+            ]
+        self.nombres = [c[0] for c in categorias]
+        self.simples: List[Tuple[int, str]] = []
+        self.compuestas: List[Tuple[int, str, str]] = []  # (bit categoría, palabra, primera parte)
+        self.entidad_kw: List[Tuple[int, List[str]]] = []
+        for i, (_, kws, ent_kws) in enumerate(categorias):
+            bit = 1 << i
+            for k in _minimal(kws):
+                if " " in k:
+                    self.compuestas.append((bit, k, k.split(" ", 1)[0]))
+                else:
+                    self.simples.append((bit, k))
+            self.entidad_kw.append((bit, list(ent_kws)))
+        self.n_cat = len(categorias)
+        self._token_mask = _Memo(self._calc_token, cache_size)
+        self._field_mask = _Memo(self._calc_field, cache_size)
+        self._entidad_mask = _Memo(self._calc_entidad, cache_size)
+
+    # Máscara: bits [0, n_cat) = categorías; bits n_cat + j = "quizá aparece compuesta j"
+    def _calc_token(self, token: str) -> int:
+        t = token.lower()
+        mask = 0
+        for bit, k in self.simples:
+            if k in t:
+                mask |= bit
+        for j, (_, _, first) in enumerate(self.compuestas):
+            if t.endswith(first):
+                mask |= 1 << (self.n_cat + j)
+        return mask
+
+    def _calc_field(self, text: str) -> int:
+        return reduce(or_, map(self._token_mask.__getitem__, text.split(" ")), 0)
+
+    def _calc_entidad(self, entidad: str) -> int:
+        e = entidad.lower()
+        mask = 0
+        for bit, kws in self.entidad_kw:
+            if any(x in e for x in kws):
+                mask |= bit
+        return mask
+
+    def _mask(self, objeto: str, entidad: str, justificacion: str) -> int:
+        objeto, entidad, justificacion = _text(objeto), _text(entidad), _text(justificacion)
+        ent = self._entidad_mask[entidad]
+        if ent & 1:
+            return ent  # la entidad ya decide la primera categoría
+        fm = self._field_mask
+        mask = fm[objeto] | fm[entidad] | fm[justificacion]
+        pending = mask >> self.n_cat
+        mask &= (1 << self.n_cat) - 1
+        if pending:
+            t = f"{objeto} {entidad} {justificacion}".lower()
+            for j, (bit, k, _) in enumerate(self.compuestas):
+                if pending >> j & 1 and not mask & bit and k in t:
+                    mask |= bit
+        return mask | ent
+
+    def _nombre(self, mask: int) -> str:
+        for i, nombre in enumerate(self.nombres):
+            if mask >> i & 1:
+                return nombre
+        return "Otras"
+
+    def clasificar(self, objeto: str, entidad: str, justificacion: str = "") -> str:
+        return self._nombre(self._mask(objeto, entidad, justificacion))
+
+    def classify_many(self, rows: Iterable[Tuple[str, str, str]]) -> List[str]:
+        """Clasifica (objeto, entidad, justificación) en lote; las filas repetidas se calculan una vez."""
+        seen: Dict[Tuple[str, str, str], str] = {}
+        out = []
+        for row in rows:
+            cat = seen.get(row)
+            if cat is None:
+                cat = seen[row] = self.clasificar(*row)
+            out.append(cat)
+        return out
+
+
+CLASIFICADOR = ClasificadorCategorias()
@@ -0,0 +1,88 @@
+# utils_colombia.py
+from typing import Any, Dict, Iterator, Optional
+
+from utils_cache import CACHE_TTLS, HTTP_CACHE, miss
+from utils_http import HTTP, iter_json_array
+from utils_metricas import METRICAS
+from utils_registro import Registro
+
+SODA_URL = "https://www.datos.gov.co/resource/p6dx-8zbt.json"
+
+# Únicas columnas que se mapean (se piden con $select)
+SODA_FIELDS = [
+    "id_del_proceso", "entidad", "descripci_n_del_procedimiento", "precio_base",
+    "ciudad_entidad", "fecha_de_publicacion_del", "fecha_adjudicacion",
+    "proveedores_invitados", "nombre_del_proveedor", "valor_total_adjudicacion",
+    "justificaci_n_modalidad_de",
+]
+
+SODA_PAGE_SIZE = 50000  # máximo de $limit en SODA 2.1
+
+
+def normalize_from_soda_row(d: Dict[str, Any]) -> Registro:
+    return Registro(
+        pais="Colombia",
+        id=d.get("id_del_proceso"),
+        entidad=d.get("entidad"),
+        objeto=d.get("descripci_n_del_procedimiento"),
+        presupuesto=d.get("precio_base", 0),
+        moneda="COP",
+        lugar=d.get("ciudad_entidad"),
+        fecha_conv=d.get("fecha_de_publicacion_del"),
+        fecha_adj=d.get("fecha_adjudicacion"),
+        oferentes=d.get("proveedores_invitados"),
+        proveedor=d.get("nombre_del_proveedor"),
+        valor_adj=d.get("valor_total_adjudicacion", 0),
+        justificacion=d.get("justificaci_n_modalidad_de"),
+    )
+
+
+def _iter_file(path, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _iter_page(url: str, params: Dict[str, Any], timeout: int, cacheable: bool) -> Iterator[Dict[str, Any]]:
+    cached = HTTP_CACHE.lookup(url, params, CACHE_TTLS["colombia"])
+    if cached is not None:
+        METRICAS.incr("cache_hits", fuente="colombia")
+        yield from iter_json_array(_iter_file(cached))
+        return
+    miss(url)
+
+    METRICAS.incr("paginas", fuente="colombia")
+    if not cacheable:
+        yield from HTTP.iter_json_array(url, params, timeout=timeout, fuente="colombia")
+        return
+    # Se guarda la página mientras se decodifica; si se corta, no se publica
+    with HTTP_CACHE.writer(url, params) as w:
+        yield from HTTP.iter_json_array(url, params, timeout=timeout, fuente="colombia", sink=w)
+
+
+def fetch_all_soda(where: str, url: str = SODA_URL, page_size: int = SODA_PAGE_SIZE,
+                   order: str = ":id", timeout: int = 120,
+                   max_rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Recorre todas las páginas ($offset/$order) y entrega las filas una a una."""
+    cacheable = CACHE_TTLS["colombia"] > 0 and max_rows is None
+    offset = 0
+    while True:
+        params = {
+            "$select": ",".join(SODA_FIELDS),
+            "$where": where,
+            "$order": order,
+            "$limit": page_size,
+            "$offset": offset,
+        }
+        n = 0
+        for row in _iter_page(url, params, timeout, cacheable):
+            yield row
+            n += 1
+            if max_rows is not None and offset + n >= max_rows:
+                return
+        if n < page_size:
+            return
+        offset += page_size
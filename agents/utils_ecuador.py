@@ -1,8 +1,17 @@
 # utils_ecuador.py
+import json
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from typing import Dict, Any, List, Optional
 
+from utils_cache import CACHE_TTLS, HTTP_CACHE, miss
+from utils_http import HTTP
+from utils_metricas import METRICAS
+from utils_registro import Registro
+
 SEARCH_URL = "https://datosabiertos.compraspublicas.gob.ec/PLATAFORMA/api/search_ocds"
 
 def get_multi(d: Dict[str, Any], keys: List[str], default=None):
@@ -12,70 +21,205 @@ def get_multi(d: Dict[str, Any], keys: List[str], default=None):
     return default
 
 # utils_ecuador.py (solo este bloque)
-def normalize_from_search_row(row: Dict[str, Any]) -> Dict[str, Any]:
+def normalize_from_search_row(row: Dict[str, Any]) -> Registro:
     def get_multi(d, keys, default=None):
         for k in keys:
             if k in d and d[k] not in (None, "", [], {}):
                 return d[k]
         return default
 
-    out = {
-        "pais": "Ecuador",
-        "id": get_multi(row, ["ocid", "id"]),
-        "entidad": get_multi(row, ["buyerName", "buyer", "buyer_name", "entidad"]),
-        "objeto": get_multi(row, ["title", "objeto", "descripcion", "description"]),
-        "presupuesto": get_multi(row, ["budgetAmount", "tenderValueAmount", "presupuesto", "amount", "valueAmount"]),
-        "moneda": get_multi(row, ["currency", "budgetCurrency", "tenderValueCurrency", "moneda"]) or "USD",
-        "lugar": get_multi(row, [
+    out = Registro(
+        pais="Ecuador",
+        id=get_multi(row, ["ocid", "id"]),
+        entidad=get_multi(row, ["buyerName", "buyer", "buyer_name", "entidad"]),
+        objeto=get_multi(row, ["title", "objeto", "descripcion", "description"]),
+        presupuesto=get_multi(row, ["budgetAmount", "tenderValueAmount", "presupuesto", "amount", "valueAmount"]),
+        moneda=get_multi(row, ["currency", "budgetCurrency", "tenderValueCurrency", "moneda"]) or "USD",
+        lugar=get_multi(row, [
             "buyerProvince","buyer_province","province","provincia",
             "region","buyerRegion","buyer_region","jurisdiction"
         ]),
-        "fecha_conv": get_multi(row, ["date", "publicationDate", "tenderStartDate"]),
-        "fecha_adj": get_multi(row, ["awardDate", "adjudicationDate"]),
-        "oferentes": get_multi(row, ["tenderersCount", "numberOfTenderers", "oferentes"]),
-        "proveedor": get_multi(row, ["supplierName", "supplier", "adjudicatario", "awardedSupplier"]),
-        "valor_adj": get_multi(row, ["awardValueAmount", "awardedAmount", "amountAwarded", "valorAdjudicado"]),
-        "justificacion": get_multi(row, ["procurementMethodRationale", "justification", "rationale", "justificacion"]),
-    }
+        fecha_conv=get_multi(row, ["date", "publicationDate", "tenderStartDate"]),
+        fecha_adj=get_multi(row, ["awardDate", "adjudicationDate"]),
+        oferentes=get_multi(row, ["tenderersCount", "numberOfTenderers", "oferentes"]),
+        proveedor=get_multi(row, ["supplierName", "supplier", "adjudicatario", "awardedSupplier"]),
+        valor_adj=get_multi(row, ["awardValueAmount", "awardedAmount", "amountAwarded", "valorAdjudicado"]),
+        justificacion=get_multi(row, ["procurementMethodRationale", "justification", "rationale", "justificacion"]),
+    )
     return out
 
 
-def fetch_all_search(year=2023, search="subasta inversa", buyer=None, supplier=None, max_rows=500):
-    page, all_rows, backoff = 1, [], 2.0
-    while True:
-        params = {"year": year, "search": search, "page": page}
-        if buyer: params["buyer"] = buyer
-        if supplier: params["supplier"] = supplier
+class RateLimiter:
+    """
+    Token bucket compartido entre hilos. Ante un 429 reduce la tasa a la mitad y
+    pausa a todos los workers (respetando Retry-After); cada éxito la sube de a poco.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 4, min_rate: float = 0.2, max_rate: float = 8.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, cancel: Optional[threading.Event] = None):
+        """cancel: si se activa durante la espera, lanza TimeoutError."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            if cancel is None:
+                time.sleep(wait)
+            elif cancel.wait(wait):
+                raise TimeoutError("espera del limitador cancelada (timeout del router)")
+
+    def penalize(self, retry_after: Optional[float] = None) -> float:
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = 0.0
+            return pause
+
+    def reward(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+# Limitador único para todas las llamadas a search_ocds del proceso
+ECUADOR_LIMITER = RateLimiter()
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+        return max(0.0, dt.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
-        try:
-            r = requests.get(
-                "https://datosabiertos.compraspublicas.gob.ec/PLATAFORMA/api/search_ocds",
-                params=params, timeout=60, headers={"Accept-Encoding": "gzip, deflate"}
-            )
-            if r.status_code == 429:
-                print(f"⏳ 429 recibido, reintentando en {backoff:.1f}s...")
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 30)
-                continue
-            r.raise_for_status()
-        except requests.RequestException as e:
-            print("❌ Error Ecuador:", e)
-            break
 
+def fetch_search_page(params: Dict[str, Any], limiter: RateLimiter = ECUADOR_LIMITER,
+                      max_retries: int = 6, cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    ttl = CACHE_TTLS["ecuador"]
+    cached = HTTP_CACHE.get_bytes(SEARCH_URL, params, ttl)
+    if cached is not None:
+        METRICAS.incr("cache_hits", fuente="ecuador")
+        return json.loads(cached)
+    miss(SEARCH_URL)
+
+    # Errores de conexión y 5xx los reintenta el cliente HTTP compartido;
+    # aquí solo se maneja 429 (pausa global del limitador)
+    for _ in range(max_retries):
+        with METRICAS.span("espera_limitador", fuente="ecuador"):
+            limiter.acquire(cancel)
+        with METRICAS.span("http", fuente="ecuador"):
+            r = HTTP.get(SEARCH_URL, params=params, timeout=60, fuente="ecuador")
+        if r.status_code == 429:
+            pause = limiter.penalize(_retry_after_seconds(r.headers.get("Retry-After")))
+            METRICAS.incr("reintentos_429", fuente="ecuador")
+            METRICAS.observar("espera_s", pause, fuente="ecuador", motivo="429")
+            print(f"⏳ 429 en página {params.get('page')}, pausa global de {pause:.1f}s...")
+            continue
+        r.raise_for_status()
+        limiter.reward()
+        METRICAS.incr("paginas", fuente="ecuador")
+        METRICAS.incr("bytes_descargados", len(r.content), fuente="ecuador")
         payload = r.json()
-        data = payload.get("data") or []
-        if not isinstance(data, list) or not data:
-            break
+        if ttl > 0:
+            HTTP_CACHE.put_bytes(SEARCH_URL, params, r.content)
+        return payload
+    raise requests.RequestException(f"Página {params.get('page')}: demasiados 429")
+
+
+def fetch_search_since(year=2023, search="subasta inversa", start_page=1, buyer=None, supplier=None,
+                       max_rows=500, workers=4, limiter: RateLimiter = ECUADOR_LIMITER,
+                       raise_errors: bool = False, cancel: Optional[threading.Event] = None):
+    """
+    Igual que fetch_all_search pero empezando en start_page. Devuelve (filas,
+    última página leída sin huecos), que sirve de marca para la carga incremental.
+    Con raise_errors, una página fallida lanza RequestException en vez de
+    devolver lo que se alcanzó a leer.
+    cancel: al activarse (timeout del router) no se piden más páginas y se lanza
+    TimeoutError; las pausas por 429 también se cortan.
+    """
+    base = {"year": year, "search": search}
+    if buyer: base["buyer"] = buyer
+    if supplier: base["supplier"] = supplier
+
+    try:
+        payload = fetch_search_page({**base, "page": start_page}, limiter, cancel=cancel)
+    except requests.RequestException as e:
+        if raise_errors:
+            raise
+        print("❌ Error Ecuador:", e)
+        return [], start_page
+
+    first = payload.get("data") or []
+    if not isinstance(first, list) or not first:
+        return [], start_page
+    all_rows = list(first[:max_rows])
+
+    # Solo se piden las páginas necesarias para llegar a max_rows
+    pages = int(payload.get("pages") or 1)
+    per_page = len(first)
+    last_page = min(pages, start_page - 1 + -(-max_rows // per_page))
+    if last_page <= start_page or len(all_rows) >= max_rows:
+        return [normalize_from_search_row(r) for r in all_rows], start_page
 
-        for row in data:
-            all_rows.append(row)
+    def fetch(page):
+        if cancel is not None and cancel.is_set():
+            raise TimeoutError(f"página {page} cancelada (timeout del router)")
+        try:
+            return fetch_search_page({**base, "page": page}, limiter, cancel=cancel).get("data") or []
+        except requests.RequestException as e:
+            print(f"❌ Error Ecuador página {page}:", e)
+            return None
+
+    failed = []
+    high_water = start_page
+    rest = range(start_page + 1, last_page + 1)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ecuador")
+    try:
+        # map conserva el orden de las páginas
+        for page, data in zip(rest, pool.map(fetch, rest)):
+            if data is None:
+                failed.append(page)
+                continue
+            if not failed:
+                high_water = page
+            all_rows.extend(data)
             if len(all_rows) >= max_rows:
-                return [normalize_from_search_row(r) for r in all_rows]
+                all_rows = all_rows[:max_rows]
+                break
+    finally:
+        # Los hilos del pool se esperan al salir del intérprete: al cortar (max_rows,
+        # error o cancel) las páginas en cola no se piden y nadie espera las en curso
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if failed:
+        print(f"⚠️ Ecuador: {len(failed)} páginas fallidas: {failed}")
+        if raise_errors:
+            raise requests.RequestException(f"Ecuador: {len(failed)} páginas fallidas: {failed}")
+    return [normalize_from_search_row(r) for r in all_rows], high_water
 
-        pages = int(payload.get("pages") or 1)
-        cur = int(payload.get("page") or page)
-        if cur >= pages:
-            break
-        page, backoff = cur + 1, 2.0  # reset backoff tras éxito
 
-    return [normalize_from_search_row(r) for r in all_rows]
\ No newline at end of file
+def fetch_all_search(year=2023, search="subasta inversa", buyer=None, supplier=None, max_rows=500,
+                     workers=4, limiter: RateLimiter = ECUADOR_LIMITER, raise_errors: bool = False,
+                     cancel: Optional[threading.Event] = None):
+    rows, _ = fetch_search_since(year, search, 1, buyer, supplier, max_rows, workers, limiter, raise_errors,
+                                 cancel)
+    return rows
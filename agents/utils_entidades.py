@@ -0,0 +1,288 @@
+# utils_entidades.py
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils_agregacion import monto_usd
+
+ROLES = ("proveedor", "entidad")
+UMBRAL_SIMILITUD = float(os.getenv("INDICE_UMBRAL", "0.3"))  # Jaccard mínimo entre trigramas
+# Un trigrama presente en más nombres que esto ("de ", "ion") no genera candidatos
+MAX_POSTING = int(os.getenv("INDICE_MAX_POSTING", "20000"))
+CANDIDATOS = 500  # candidatos que se puntúan con la similitud exacta
+BLOQUE_ALTAS = 20000  # entidades nuevas por tanda de inserción de trigramas
+
+# Formas societarias (EC, CO, CL) que se quitan del final del nombre, ya sin
+# puntos ni tildes: "S.A.S." → "sas", "Cía. Ltda." → "cia ltda", "E.I.R.L." → "eirl"
+SUFIJOS = frozenset({
+    "sa", "sas", "saa", "sac", "ca", "cia", "ltda", "limitada", "spa", "eirl", "srl",
+    "esp", "eu", "ep", "sociedad", "anonima", "compania", "responsabilidad", "comandita",
+    "en", "de", "y", "inc", "llc", "ltd", "corp",
+})
+
+
+def normalizar_nombre(texto: Any) -> str:
+    """Minúsculas, sin tildes ni puntuación y sin la forma societaria final."""
+    # Solo los textos pasan por la caché: un dict o lista del payload no es hashable
+    return _normalizar_texto(texto) if isinstance(texto, str) else ""
+
+
+@lru_cache(maxsize=65536)
+def _normalizar_texto(texto: str) -> str:
+    s = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii").lower()
+    s = re.sub(r"\b([a-z])\.", r"\1", s)  # iniciales: "s.a." → "sa"
+    tokens: List[str] = []
+    en_siglas = False
+    for t in re.sub(r"[^a-z0-9]+", " ", s).split():
+        # Letras sueltas seguidas forman una sigla: "s a s" → "sas"
+        if len(t) == 1 and t.isalpha():
+            if en_siglas:
+                tokens[-1] += t
+                continue
+            en_siglas = True
+        else:
+            en_siglas = False
+        tokens.append(t)
+    while len(tokens) > 1 and tokens[-1] in SUFIJOS:
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def trigramas(nombre: str) -> Set[str]:
+    s = f"  {nombre} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+# normalizar_nombre deja solo [a-z0-9 ]: un trigrama es un número < 37**3. Cada
+# posting es un entero (código << 33 | rol << 32 | eid) que sirve de rowid, así
+# la lista de un trigrama (y rol) es un rango contiguo de la tabla
+_ALFABETO = {c: i for i, c in enumerate(" 0123456789abcdefghijklmnopqrstuvwxyz")}
+_BIT_ROL = {rol: i << 32 for i, rol in enumerate(ROLES)}
+_MASCARA_EID = (1 << 32) - 1
+
+
+@lru_cache(maxsize=None)
+def codigo_trigrama(t: str) -> int:
+    a, b, c = (_ALFABETO[ch] for ch in t)
+    return (a * 37 + b) * 37 + c
+
+
+def _postings(eid: int, rol: str, tri: Iterable[str]) -> List[int]:
+    base = _BIT_ROL[rol] | eid
+    return [codigo_trigrama(t) << 33 | base for t in tri]
+
+
+def _rango(t: str, rol: Optional[str]) -> Tuple[int, int]:
+    desde = codigo_trigrama(t) << 33
+    if rol:
+        desde |= _BIT_ROL[rol]
+        return desde, desde | _MASCARA_EID
+    return desde, desde | (1 << 33) - 1
+
+
+class IndiceEntidades:
+    """
+    Índice persistente (SQLite) de proveedores y entidades compradoras:
+    nombre normalizado → registros (pais, id) y presupuesto_usd, con un índice
+    invertido de trigramas para la búsqueda aproximada. agregar() es un upsert
+    por (rol, pais, id), así que se puede alimentar de forma incremental.
+
+    La búsqueda aproximada toma candidatos solo de los trigramas poco
+    frecuentes del nombre buscado y los ordena por Jaccard exacto.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # se puede reconstruir desde los datos
+        # Las altas caen repartidas por todo el árbol de trigramas: caché de 64 MB
+        self.conn.execute("PRAGMA cache_size=-65536")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS entidades ("
+            " eid INTEGER PRIMARY KEY, rol TEXT NOT NULL, nombre TEXT NOT NULL, n_trigramas INTEGER NOT NULL,"
+            " UNIQUE (nombre, rol));"
+            "CREATE TABLE IF NOT EXISTS variantes ("
+            " eid INTEGER NOT NULL, nombre TEXT NOT NULL, PRIMARY KEY (eid, nombre)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS trigramas (clave INTEGER PRIMARY KEY);"
+            "CREATE TABLE IF NOT EXISTS frecuencias ("
+            " trigrama TEXT PRIMARY KEY, n INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS registros ("
+            " rol TEXT NOT NULL, pais TEXT NOT NULL, id TEXT NOT NULL, eid INTEGER NOT NULL,"
+            " presupuesto_usd REAL NOT NULL, PRIMARY KEY (rol, pais, id));"
+            "CREATE INDEX IF NOT EXISTS registros_eid ON registros (eid);"
+        )
+        self.conn.commit()
+        self._eids: Optional[Dict[Tuple[str, str], int]] = None  # (rol, nombre) -> eid
+
+    def _cargar_eids(self) -> Dict[Tuple[str, str], int]:
+        if self._eids is None:
+            self._eids = {(rol, nombre): eid for eid, rol, nombre in
+                          self.conn.execute("SELECT eid, rol, nombre FROM entidades")}
+        return self._eids
+
+    # ---- carga ----
+
+    def agregar(self, registros: Iterable[Any], pais: Optional[str] = None) -> int:
+        """
+        Indexa proveedor y entidad de cada registro. Con `pais`, los registros
+        son la carga completa de ese país: antes se borra lo que tenía indexado.
+        """
+        filas = []
+        variantes: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        for d in registros:
+            rid = d.get("id")
+            if rid in (None, ""):
+                continue
+            monto = monto_usd(d)
+            for rol in ROLES:
+                original = d.get(rol)
+                nombre = normalizar_nombre(original)
+                if not nombre:
+                    continue
+                filas.append((rol, d.get("pais") or "", str(rid), nombre, monto))
+                variantes[(rol, nombre)].add(" ".join(original.split()))
+
+        eids = self._cargar_eids()
+        with self.conn:
+            if pais is not None:
+                self.conn.execute("DELETE FROM registros WHERE pais = ?", (pais,))
+            self._crear([k for k in variantes if k not in eids])
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO variantes (eid, nombre) VALUES (?, ?)",
+                ((eids[k], v) for k, vs in variantes.items() for v in vs),
+            )
+            self.conn.executemany(
+                "INSERT INTO registros (rol, pais, id, eid, presupuesto_usd) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(rol, pais, id) DO UPDATE SET eid = excluded.eid,"
+                " presupuesto_usd = excluded.presupuesto_usd",
+                ((rol, p, rid, eids[(rol, nombre)], monto) for rol, p, rid, nombre, monto in filas),
+            )
+            if pais is not None:
+                self._podar()
+        return len(filas)
+
+    def _crear(self, nuevas: List[Tuple[str, str]]):
+        if not nuevas:
+            return
+        eids = self._cargar_eids()
+        siguiente = (self.conn.execute("SELECT MAX(eid) FROM entidades").fetchone()[0] or 0) + 1
+        frec = Counter()
+        for inicio in range(0, len(nuevas), BLOQUE_ALTAS):
+            entidades, postings = [], []
+            for eid, (rol, nombre) in enumerate(nuevas[inicio:inicio + BLOQUE_ALTAS], start=siguiente + inicio):
+                tri = trigramas(nombre)
+                eids[(rol, nombre)] = eid
+                entidades.append((eid, rol, nombre, len(tri)))
+                postings += _postings(eid, rol, tri)
+                frec.update(tri)
+            # En orden de clave las inserciones en el B-tree son casi secuenciales
+            postings.sort()
+            self.conn.executemany("INSERT INTO entidades (eid, rol, nombre, n_trigramas) VALUES (?, ?, ?, ?)",
+                                  entidades)
+            self.conn.executemany("INSERT INTO trigramas (clave) VALUES (?)", ((c,) for c in postings))
+        self.conn.executemany(
+            "INSERT INTO frecuencias (trigrama, n) VALUES (?, ?)"
+            " ON CONFLICT(trigrama) DO UPDATE SET n = n + excluded.n",
+            sorted(frec.items()),
+        )
+
+    def _podar(self):
+        # Entidades que quedaron sin registros tras una recarga completa
+        huerfanas = self.conn.execute(
+            "SELECT eid, rol, nombre FROM entidades e"
+            " WHERE NOT EXISTS (SELECT 1 FROM registros r WHERE r.eid = e.eid)").fetchall()
+        if not huerfanas:
+            return
+        frec = Counter()
+        postings = []
+        for eid, rol, nombre in huerfanas:
+            tri = trigramas(nombre)
+            frec.update(tri)
+            postings += _postings(eid, rol, tri)
+        postings.sort()
+        self.conn.executemany("DELETE FROM trigramas WHERE clave = ?", ((c,) for c in postings))
+        self.conn.executemany("UPDATE frecuencias SET n = n - ? WHERE trigrama = ?",
+                              [(n, t) for t, n in frec.items()])
+        self.conn.execute("DELETE FROM frecuencias WHERE n <= 0")
+        params = [(eid,) for eid, _, _ in huerfanas]
+        self.conn.executemany("DELETE FROM variantes WHERE eid = ?", params)
+        self.conn.executemany("DELETE FROM entidades WHERE eid = ?", params)
+        self._eids = None
+
+    # ---- consultas ----
+
+    def buscar(self, nombre: str, rol: Optional[str] = None, limite: int = 10,
+               umbral: float = UMBRAL_SIMILITUD) -> List[Dict[str, Any]]:
+        """
+        Entidades parecidas a `nombre` (exacta primero, similitud 1.0), cada una
+        con sus variantes de escritura, cantidad de registros y presupuesto_usd
+        total y por país.
+        """
+        norm = normalizar_nombre(nombre)
+        if not norm:
+            return []
+        q = trigramas(norm)
+        frec = dict(self.conn.execute(
+            f"SELECT trigrama, n FROM frecuencias WHERE trigrama IN ({','.join('?' * len(q))})", sorted(q)))
+        # Si todos son frecuentes se usan los 3 más raros, leyendo a lo sumo
+        # MAX_POSTING entradas de cada uno
+        raros = [t for t, n in frec.items() if n <= MAX_POSTING] or sorted(frec, key=frec.get)[:3]
+
+        comunes: Counter = Counter()
+        for t in raros:
+            comunes.update(c & _MASCARA_EID for (c,) in self.conn.execute(
+                "SELECT clave FROM trigramas WHERE clave BETWEEN ? AND ? LIMIT ?", (*_rango(t, rol), MAX_POSTING)))
+        elegidos = [eid for eid, _ in comunes.most_common(CANDIDATOS)]
+        candidatos = set(self.conn.execute(
+            "SELECT eid, rol, nombre FROM entidades WHERE nombre = ?" + (" AND rol = ?" if rol else ""),
+            (norm, rol) if rol else (norm,)))
+        if elegidos:
+            candidatos.update(self.conn.execute(
+                f"SELECT eid, rol, nombre FROM entidades WHERE eid IN ({','.join('?' * len(elegidos))})", elegidos))
+
+        puntuados = []
+        for eid, r, n in candidatos:
+            t = trigramas(n)
+            sim = 1.0 if n == norm else len(q & t) / len(q | t)
+            if sim >= umbral:
+                puntuados.append((-sim, n, r, eid))
+        puntuados.sort()
+        return [self._detalle(eid, r, n, round(-s, 4)) for s, n, r, eid in puntuados[:limite]]
+
+    def exacto(self, nombre: str, rol: Optional[str] = None) -> List[Dict[str, Any]]:
+        norm = normalizar_nombre(nombre)
+        filas = self.conn.execute(
+            "SELECT eid, rol, nombre FROM entidades WHERE nombre = ?" + (" AND rol = ?" if rol else ""),
+            (norm, rol) if rol else (norm,),
+        ).fetchall()
+        return [self._detalle(eid, r, n, 1.0) for eid, r, n in filas]
+
+    def _detalle(self, eid: int, rol: str, nombre: str, similitud: float) -> Dict[str, Any]:
+        por_pais = {}
+        n = 0
+        for pais, cantidad, total in self.conn.execute(
+                "SELECT pais, COUNT(*), SUM(presupuesto_usd) FROM registros WHERE eid = ? GROUP BY pais", (eid,)):
+            por_pais[pais] = {"registros": cantidad, "presupuesto_usd": total}
+            n += cantidad
+        variantes = [v for (v,) in self.conn.execute(
+            "SELECT nombre FROM variantes WHERE eid = ? ORDER BY nombre LIMIT 20", (eid,))]
+        return {
+            "eid": eid, "rol": rol, "nombre": nombre, "similitud": similitud, "variantes": variantes,
+            "registros": n, "presupuesto_usd": sum(p["presupuesto_usd"] for p in por_pais.values()),
+            "por_pais": por_pais,
+        }
+
+    def ids(self, eid: int, pais: Optional[str] = None) -> List[Tuple[str, str]]:
+        """(pais, id) de los registros de la entidad."""
+        sql = "SELECT pais, id FROM registros WHERE eid = ?" + (" AND pais = ?" if pais else "") + " ORDER BY pais, id"
+        return self.conn.execute(sql, (eid, pais) if pais else (eid,)).fetchall()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,360 @@
+# utils_fuentes.py
+"""
+Fuentes por país (descarga + normalización) y normalización común de montos y
+categorías. Lo usan el router de final_agent.py y los trabajos de utils_lotes.py;
+la configuración mutable (CHILE_LLM_FALLBACK, MAX_EC_ROWS, URLs) vive aquí.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from utils_chile import (
+    SCHEMA_FIELDS, chile_archive_version, chunk_token_budget, download_chile_csv, estimate_tokens,
+    iter_csv_chunks, iter_lotes_csv, normalize_chile_rules, registros_de_lote,
+)
+from utils_clasificador import CLASIFICADOR
+from utils_colombia import SODA_URL, fetch_all_soda, normalize_from_soda_row
+from utils_ecuador import SEARCH_URL, fetch_all_search
+from utils_llm import chat_completion_with_retry
+from utils_metricas import METRICAS
+from utils_montos import fx_rate_many, to_number_many
+
+# ========================
+# Config
+# ========================
+# Año y método de la ejecución simple (los lotes recorren otros, ver utils_lotes.py)
+ANIO = int(os.getenv("ANIO", "2023"))
+METODO = os.getenv("METODO", "subasta inversa")
+MAX_EC_ROWS = int(os.getenv("MAX_EC_ROWS", "200"))
+DATA_DIR = Path("./data")  # se crea al escribir el primer archivo
+# Un tar.gz por año; cada año se descarga y normaliza en data/chile/<año>/
+CHILE_URL_TEMPLATE = "https://data.open-contracting.org/es/publication/144/download?name={year}.csv.tar.gz"
+
+SCHEMA = ", ".join(SCHEMA_FIELDS)
+
+# Chile: normalización por reglas; el LLM solo entra si se pide explícitamente
+CHILE_LLM_FALLBACK = os.getenv("CHILE_LLM_FALLBACK", "0") == "1"
+# "stream" (extrae desde la respuesta HTTP) o "file" (guarda el tar.gz, reanudable)
+CHILE_DOWNLOAD_MODE = os.getenv("CHILE_DOWNLOAD_MODE", "stream")
+# Peticiones simultáneas al LLM en la normalización por chunks
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+# Presupuesto de tokens de entrada por chunk (0 = el del modelo)
+CHILE_CHUNK_TOKENS = int(os.getenv("CHILE_CHUNK_TOKENS", "0"))
+
+def strip_code_fences(text: str) -> str:
+    if text is None:
+        return ""
+    text = text.strip()
+    text = re.sub(r"^```[a-zA-Z0-9]*\s*", "", text)
+    text = re.sub(r"\s*```$", "", text)
+    return text.strip()
+
+def hosts_por_pais() -> Dict[str, str]:
+    # Host de cada fuente (semáforos de utils_lotes)
+    urls = {"Ecuador": SEARCH_URL, "Colombia": SODA_URL, "Chile": chile_url()}
+    return {pais: urlsplit(url).netloc for pais, url in urls.items()}
+
+# ========================
+# Chile (descarga, extracción, normalización por reglas / chunks LLM, lectura)
+# ========================
+
+def chile_dir(year: int = ANIO) -> Path:
+    return DATA_DIR / "chile" / str(year)
+
+def chile_url(year: int = ANIO) -> str:
+    return CHILE_URL_TEMPLATE.format(year=year)
+
+def download_and_extract_chile(url: str, mode: str = CHILE_DOWNLOAD_MODE, data_dir: Optional[Path] = None) -> Path:
+    with METRICAS.span("descarga", fuente="chile"):
+        return download_chile_csv(url, data_dir or chile_dir(), mode=mode)
+
+def _chile_chunk_prompt(chunk_text: str) -> str:
+    # El chunk ya viene acotado por tokens: nunca se recorta texto del prompt
+    return f"""
+Eres un agente especializado en compras públicas.
+País: Chile
+Este es un fragmento del archivo CSV oficial (incluye cabecera).
+Convierte EXCLUSIVAMENTE las filas de este fragmento al siguiente esquema CSV EXACTO:
+
+{SCHEMA}
+
+Reglas estrictas:
+- Usa coma (,) como separador (no uses ';').
+- No repitas ni inventes filas.
+- No agregues texto fuera del CSV.
+- No envuelvas en bloques de código.
+- Si un valor no existe, deja la celda vacía.
+- En el PRIMER chunk incluye la cabecera; en los siguientes, NO incluyas cabecera.
+
+Fragmento CSV:
+{chunk_text}
+""".strip()
+
+def _chile_chunk_part(chunks_dir: Path, idx: int, prompt: str) -> Path:
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    return chunks_dir / f"chunk-{idx:05d}-{digest}.csv"
+
+def _convert_chile_chunk(prompt: str, part: Path, model: str, cancel: Optional[threading.Event] = None):
+    # Un chunk ya convertido en una ejecución anterior no se vuelve a pedir
+    if part.exists():
+        with open(part, "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    METRICAS.observar("llm_chunk_tokens_estimados", estimate_tokens(prompt), modelo=model)
+    with METRICAS.span("llm_chunk", modelo=model):
+        csv_out = strip_code_fences(chat_completion_with_retry(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            cancel=cancel,
+        ))
+    lines = [ln for ln in csv_out.splitlines() if ln.strip() != ""]
+
+    tmp = part.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    os.replace(tmp, part)
+    return lines
+
+def normalize_chile_chunked(file_path: Path, lines_per_chunk: Optional[int] = 1800,
+                            max_chunks: Optional[int] = 6, concurrency: int = LLM_CONCURRENCY,
+                            model: str = "gpt-4o", max_tokens: Optional[int] = None,
+                            out_dir: Optional[Path] = None, cancel: Optional[threading.Event] = None) -> Path:
+    """
+    lines_per_chunk: máximo de registros por chunk; max_tokens: presupuesto de
+    entrada por chunk (por defecto el del modelo, ver utils_chile.MODEL_CHUNK_TOKENS).
+    out_dir: carpeta del año (chile_normalized.csv y chile_chunks/).
+    cancel: al activarse no se envían más chunks y se lanza TimeoutError; los ya
+    convertidos quedan en chile_chunks/ para la próxima ejecución.
+    """
+    budget = max_tokens or CHILE_CHUNK_TOKENS or chunk_token_budget(model)
+    chunks = iter_csv_chunks(file_path, budget, max_records=lines_per_chunk)
+    if max_chunks is not None:
+        chunks = islice(chunks, max_chunks)
+
+    out_dir = out_dir or chile_dir()
+    out_file = out_dir / "chile_normalized.csv"
+    chunks_dir = out_dir / "chile_chunks"
+    wrote_header = False
+    failed = []
+    used_parts = set()
+
+    def write_chunk(lines):
+        nonlocal wrote_header
+        if not wrote_header:
+            first = (lines[0].strip().lower() if lines else "")
+            if not first.startswith("id,"):
+                lines.insert(0, SCHEMA)
+            wrote_header = True
+            mode = "w"
+        else:
+            if lines and lines[0].strip().lower().startswith("id,"):
+                lines = lines[1:]
+            mode = "a"
+
+        with open(out_file, mode, encoding="utf-8") as fout:
+            fout.write("\n".join(lines) + "\n")
+
+    def drain(in_flight):
+        idx, part, fut = in_flight.popleft()
+        try:
+            lines = fut.result()
+        except Exception as e:
+            print(f"❌ [Chile] Chunk {idx} falló: {e}")
+            failed.append(idx)
+            return
+        used_parts.add(part.name)
+        write_chunk(lines)
+
+    # Varias peticiones en vuelo; la escritura sigue el orden de los chunks
+    chunks_dir.mkdir(parents=True, exist_ok=True)
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            raise TimeoutError("[Chile] normalización por chunks cancelada")
+
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chile-llm")
+    try:
+        in_flight = deque()
+        for idx, chunk_text in enumerate(chunks, start=1):
+            check_cancel()
+            prompt = _chile_chunk_prompt(chunk_text)
+            part = _chile_chunk_part(chunks_dir, idx, prompt)
+            in_flight.append((idx, part, pool.submit(_convert_chile_chunk, prompt, part, model, cancel)))
+            if len(in_flight) >= concurrency * 2:
+                drain(in_flight)
+        while in_flight:
+            check_cancel()
+            drain(in_flight)
+    finally:
+        # Los hilos del pool se esperan al salir del intérprete: si se corta, los
+        # chunks en cola no se envían y nadie espera los que están en curso
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if not wrote_header:
+        with open(out_file, "w", encoding="utf-8") as fout:
+            fout.write(SCHEMA + "\n")
+        if not failed:
+            print(f"[Chile] Archivo vacío, creado CSV normalizado vacío → {out_file}")
+
+    # Resultados de chunks de ejecuciones anteriores que ya no corresponden
+    for old in chunks_dir.glob("chunk-*.csv"):
+        if old.name not in used_parts:
+            old.unlink()
+    with open(chunks_dir / "failed.json", "w", encoding="utf-8") as f:
+        json.dump({"source": str(file_path), "failed": failed}, f)
+
+    if failed:
+        print(f"⚠️ [Chile] {len(failed)} chunks fallidos {failed}; se reintentan en la próxima ejecución.")
+    print(f"[Chile] Normalización por chunks completada → {out_file}")
+    return out_file
+
+def normalize_chile(file_path: Path, use_llm_fallback: Optional[bool] = None,
+                    out_dir: Optional[Path] = None, cancel: Optional[threading.Event] = None) -> Path:
+    if use_llm_fallback is None:
+        use_llm_fallback = CHILE_LLM_FALLBACK
+    out_dir = out_dir or chile_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_file = out_dir / "chile_normalized.csv"
+    normalized = normalize_chile_rules(file_path, out_file)
+    if normalized is not None:
+        return normalized
+    if not use_llm_fallback:
+        raise ValueError("[Chile] contracts.csv sin columna id reconocible (usa CHILE_LLM_FALLBACK=1 para el modo LLM)")
+    print("[Chile] Columnas no reconocidas, usando normalización por chunks con LLM ...")
+    return normalize_chile_chunked(file_path, lines_per_chunk=1800, max_chunks=6, out_dir=out_dir, cancel=cancel)
+
+def query_chile_data(known_version: Optional[str] = None, year: int = ANIO, raise_errors: bool = False,
+                     cancel: Optional[threading.Event] = None):
+    """
+    known_version: si el tar.gz descargado tiene esa versión (ETag/Last-Modified), no se reprocesa.
+    El archivo de Chile trae todos los métodos de compra del año: no se filtra por método.
+    raise_errors: propaga el error (lotes) en vez de devolver [].
+    cancel: timeout del router; corta la normalización por LLM y la lectura del CSV.
+    """
+    try:
+        data_dir = chile_dir(year)
+        extracted_path = download_and_extract_chile(chile_url(year), data_dir=data_dir)
+        if known_version and chile_archive_version(data_dir) == known_version:
+            print("✅ Chile: archivo sin cambios desde la última carga.")
+            return []
+        normalized_path = normalize_chile(extracted_path, out_dir=data_dir, cancel=cancel)
+
+        datos = []
+        with METRICAS.span("lectura", fuente="chile"):
+            for lote in iter_lotes_csv(normalized_path):
+                if cancel is not None and cancel.is_set():
+                    raise TimeoutError("[Chile] lectura cancelada")
+                datos.extend(registros_de_lote(lote, "Chile"))
+
+        METRICAS.incr("filas_salida", len(datos), etapa="chile_lectura")
+        print(f"✅ Chile: {len(datos)} registros normalizados.")
+        return datos
+    except Exception as e:
+        print("❌ Error Chile:", e)
+        if raise_errors:
+            raise
+        return []
+
+# ========================
+# Ecuador / Colombia
+# ========================
+
+def query_ecuador_api(year, method, max_rows: Optional[int] = None, raise_errors: bool = False,
+                      cancel: Optional[threading.Event] = None):
+    """
+    raise_errors: propaga el error (lotes) en vez de devolver [].
+    cancel: timeout del router; deja de pedir páginas (ver fetch_search_since).
+    """
+    print("📡 Consultando datos de Ecuador...")
+    try:
+        with METRICAS.span("descarga", fuente="ecuador"):
+            data = fetch_all_search(year=year, search=method, max_rows=max_rows or MAX_EC_ROWS,
+                                    raise_errors=raise_errors, cancel=cancel)
+        print(f"✅ {len(data)} registros obtenidos de Ecuador.")
+        for d in data:
+            d.setdefault("pais", "Ecuador")
+        return data
+    except Exception as e:
+        print("❌ Error Ecuador:", e)
+        if raise_errors:
+            raise
+        return []
+
+def _soql_str(value: str) -> str:
+    return "'{}'".format(str(value).replace("'", "''"))
+
+def colombia_where(year, method) -> str:
+    # Solo el año pedido: sin el límite superior un lote de varios años se solaparía
+    return (
+        f"modalidad_de_contratacion like {_soql_str(f'%{method}%')}"
+        f" AND fecha_de_publicacion_del >= '{int(year)}-01-01T00:00:00'"
+        f" AND fecha_de_publicacion_del < '{int(year) + 1}-01-01T00:00:00'"
+    )
+
+def query_colombia_api(year, method, api_url, since: Optional[str] = None, raise_errors: bool = False):
+    """raise_errors: propaga el error (lotes) en vez de devolver []."""
+    print("📡 Consultando datos de Colombia...")
+    where = colombia_where(year, method)
+    if since:
+        # >= en vez de >: los registros con la misma fecha se deduplican en el upsert
+        where += f" AND fecha_de_publicacion_del >= {_soql_str(since)}"
+    try:
+        with METRICAS.span("descarga", fuente="colombia"):
+            out = [normalize_from_soda_row(d) for d in fetch_all_soda(where, url=api_url or SODA_URL)]
+    except (requests.RequestException, ValueError) as e:
+        print("❌ Error Colombia:", e)
+        if raise_errors:
+            raise
+        return []
+    print(f"✅ {len(out)} registros obtenidos de Colombia.")
+    return out
+
+# ========================
+# Normalización común
+# ========================
+
+def normalizar_lote(registros):
+    """
+    Normaliza los registros en su lugar: moneda por defecto (Ecuador USD, Chile
+    CLP), presupuesto con respaldo en valor_adj, categoría y montos en USD. Los
+    montos y la conversión a USD se calculan por columnas (utils_montos).
+    """
+    if not registros:
+        return registros
+    for d in registros:
+        if d.get("pais") == "Ecuador" and not d.get("moneda"):
+            d["moneda"] = "USD"
+        if d.get("pais") == "Chile" and not d.get("moneda"):
+            d["moneda"] = "CLP"
+
+    with METRICAS.span("montos"):
+        presupuesto = to_number_many(d.get("presupuesto") for d in registros)
+        valor_adj = to_number_many(d.get("valor_adj") for d in registros)
+        rates = fx_rate_many(d.get("moneda", "USD") for d in registros)
+
+    with METRICAS.span("clasificador"):
+        categorias = CLASIFICADOR.classify_many(
+            (d.get("objeto", ""), d.get("entidad", ""), d.get("justificacion", "")) for d in registros
+        )
+
+    for i, d in enumerate(registros):
+        p = presupuesto[i]
+        if p <= 0:
+            p = valor_adj[i]
+        d["presupuesto"] = float(p) or 0.0
+        d["categoria"] = categorias[i]
+
+        d["presupuesto_usd"] = d["presupuesto"] * float(rates[i])
+        d["valor_adj_usd"] = float(valor_adj[i]) * float(rates[i])
+        if (not d["presupuesto_usd"]) and d.get("valor_adj_usd"):
+            d["presupuesto_usd"] = d["valor_adj_usd"]
+    return registros
@@ -0,0 +1,156 @@
+# utils_http.py
+import codecs
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils_metricas import METRICAS
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "4"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "1.0"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# 429 no se reintenta aquí: cada fuente lo maneja (p. ej. el RateLimiter de Ecuador)
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+class _Retry(Retry):
+    """Retry de urllib3 que además registra los reintentos y su espera en METRICAS."""
+    fuente = ""
+
+    def new(self, **kw):
+        new = super().new(**kw)
+        new.fuente = self.fuente
+        return new
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new = super().increment(method, url, response, error, _pool, _stacktrace)
+        METRICAS.incr("reintentos", fuente=self.fuente)
+        METRICAS.observar("espera_s", new.get_backoff_time(), fuente=self.fuente, motivo="error")
+        return new
+
+
+def _retry_policy(retries: int, backoff: float, fuente: str) -> Retry:
+    params = dict(
+        total=retries, connect=retries, read=retries, status=retries,
+        backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    try:
+        retry = _Retry(backoff_jitter=backoff, **params)
+    except TypeError:  # urllib3 < 2 no tiene backoff_jitter
+        retry = _Retry(**params)
+    retry.fuente = fuente
+    return retry
+
+
+class HttpClient:
+    """
+    Una requests.Session por host (keep-alive + pool de conexiones) con política
+    de reintentos común: errores de conexión/lectura y 5xx con backoff
+    exponencial + jitter. Timeout por defecto (conexión, lectura) configurable
+    con HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT. `fuente` solo etiqueta las
+    métricas (por defecto, el host).
+    """
+
+    def __init__(self, retries: int = HTTP_RETRIES, backoff: float = HTTP_BACKOFF,
+                 pool_size: int = HTTP_POOL_SIZE,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.sessions: Dict[str, requests.Session] = {}
+        self.lock = threading.Lock()
+
+    def session(self, url: str, fuente: str = "") -> requests.Session:
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            s = self.sessions.get(key)
+            if s is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                      max_retries=_retry_policy(self.retries, self.backoff,
+                                                                fuente or parts.hostname or ""))
+                s.mount(key, adapter)
+                self.sessions[key] = s
+            return s
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, timeout=None, fuente: str = "",
+            **kwargs) -> requests.Response:
+        if timeout is not None and not isinstance(timeout, tuple):
+            timeout = (min(HTTP_CONNECT_TIMEOUT, timeout), timeout)
+        return self.session(url, fuente).get(url, params=params, timeout=timeout or self.timeout, **kwargs)
+
+    def iter_json_array(self, url: str, params: Optional[Dict[str, Any]] = None, timeout=None,
+                        fuente: str = "", sink=None, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+        """
+        GET en streaming de un array JSON, entregando los elementos a medida que
+        llegan. `sink.write(bytes)` recibe una copia del cuerpo (p. ej. la caché).
+        """
+        fuente = fuente or urlsplit(url).hostname or ""
+        with self.get(url, params=params, timeout=timeout, fuente=fuente, stream=True) as r:
+            r.raise_for_status()
+
+            def body():
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    METRICAS.incr("bytes_descargados", len(chunk), fuente=fuente)
+                    if sink is not None:
+                        sink.write(chunk)
+                    yield chunk
+
+            yield from iter_json_array(body())
+
+    def close(self):
+        with self.lock:
+            for s in self.sessions.values():
+                s.close()
+            self.sessions = {}
+
+
+HTTP = HttpClient()
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Decodifica incrementalmente un array JSON de objetos a partir de bloques de
+    bytes, sin cargar el cuerpo completo en memoria.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    started = False
+    for piece in codecs.iterdecode(chunks, "utf-8"):
+        buf += piece
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Se esperaba un array JSON")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # objeto incompleto: faltan bytes
+            yield obj
+            pos = end
+        buf = buf[pos:]
+    if buf.strip():
+        raise ValueError("Array JSON truncado")
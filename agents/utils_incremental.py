@@ -0,0 +1,73 @@
+# utils_incremental.py
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from utils_registro import Registro, a_dict
+
+
+class RecordStore:
+    """
+    Almacén local (SQLite) de registros normalizados con upsert por (pais, id)
+    y marcas de agua por fuente para la carga incremental.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS registros ("
+            " pais TEXT NOT NULL, id TEXT NOT NULL, fecha_conv TEXT, datos TEXT NOT NULL,"
+            " actualizado REAL NOT NULL, PRIMARY KEY (pais, id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS marcas (fuente TEXT PRIMARY KEY, valor TEXT NOT NULL, actualizado REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def upsert_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        now = time.time()
+        rows = (
+            (d.get("pais") or "", str(d.get("id")), d.get("fecha_conv"), json.dumps(a_dict(d), ensure_ascii=False), now)
+            for d in records if d.get("id") not in (None, "")
+        )
+        with self.conn:
+            cur = self.conn.executemany(
+                "INSERT INTO registros (pais, id, fecha_conv, datos, actualizado) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(pais, id) DO UPDATE SET fecha_conv = excluded.fecha_conv,"
+                " datos = excluded.datos, actualizado = excluded.actualizado",
+                rows,
+            )
+        return cur.rowcount
+
+    def get_watermark(self, fuente: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT valor FROM marcas WHERE fuente = ?", (fuente,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_watermark(self, fuente: str, valor: Dict[str, Any]):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO marcas (fuente, valor, actualizado) VALUES (?, ?, ?)"
+                " ON CONFLICT(fuente) DO UPDATE SET valor = excluded.valor, actualizado = excluded.actualizado",
+                (fuente, json.dumps(valor, ensure_ascii=False), time.time()),
+            )
+
+    def iter_records(self, pais: Optional[str] = None) -> Iterator[Registro]:
+        if pais is None:
+            cur = self.conn.execute("SELECT datos FROM registros ORDER BY pais, id")
+        else:
+            cur = self.conn.execute("SELECT datos FROM registros WHERE pais = ? ORDER BY id", (pais,))
+        for (datos,) in cur:
+            yield Registro.desde_dict(json.loads(datos))
+
+    def count(self, pais: Optional[str] = None) -> int:
+        if pais is None:
+            return self.conn.execute("SELECT COUNT(*) FROM registros").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM registros WHERE pais = ?", (pais,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
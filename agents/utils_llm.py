@@ -0,0 +1,214 @@
+# utils_llm.py
+import csv
+import functools
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils_cache import HttpCache
+from utils_metricas import METRICAS
+from utils_chile import SCHEMA_FIELDS, build_column_index, detect_delimiter, iter_chile_rows
+
+LLM_CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR", "./data/llm_cache"))
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") == "1"
+
+
+@functools.lru_cache(maxsize=None)
+def transient_errors() -> Tuple[type, ...]:
+    # openai se importa recién aquí: importarlo al cargar el módulo cuesta ~1 s
+    try:
+        import openai
+    except ImportError:
+        return ()
+    return (
+        openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+
+# ========================
+# Backends
+# ========================
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def complete(self, model: str, messages: List[Dict[str, str]], **params) -> str:
+        if self.client is None:
+            from openai import OpenAI
+            self.client = OpenAI()
+        resp = self.client.chat.completions.create(model=model, messages=messages, **params)
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            METRICAS.observar("llm_tokens", usage.prompt_tokens or 0, modelo=model, tipo="prompt")
+            METRICAS.observar("llm_tokens", usage.completion_tokens or 0, modelo=model, tipo="completion")
+        return resp.choices[0].message.content or ""
+
+
+class DisabledBackend:
+    """Backend de --no-llm: cualquier llamada al modelo es un error, nunca se contacta la API."""
+    name = "disabled"
+
+    def complete(self, model: str, messages: List[Dict[str, str]], **params) -> str:
+        raise RuntimeError("LLM desactivado (--no-llm)")
+
+
+class LocalBackend:
+    """
+    Sustituto local y determinista (sin red). Reconoce los dos prompts del
+    pipeline: fragmentos CSV de Chile (se normalizan por reglas) y el payload
+    del Analysis Agent (informe a partir de totales_usd). `handler` permite
+    inyectar otra respuesta.
+    """
+    name = "local"
+
+    def __init__(self, handler=None):
+        self.handler = handler
+
+    def complete(self, model: str, messages: List[Dict[str, str]], **params) -> str:
+        prompt = messages[-1]["content"] if messages else ""
+        if self.handler is not None:
+            return self.handler(model, messages, **params)
+        if "Fragmento CSV:" in prompt:
+            return _local_chile_chunk(prompt.split("Fragmento CSV:", 1)[1].lstrip("\n"))
+        if "Input: " in prompt:
+            return _local_report(prompt.split("Input: ", 1)[1])
+        return ""
+
+
+def _local_chile_chunk(chunk_text: str) -> str:
+    first_line = chunk_text.split("\n", 1)[0]
+    reader = csv.reader(io.StringIO(chunk_text), delimiter=detect_delimiter(first_line))
+    header = next(reader, None) or []
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(SCHEMA_FIELDS)
+    index = build_column_index(header)
+    if index["id"] is not None:
+        for row in iter_chile_rows(reader, index):
+            writer.writerow(row)
+    return out.getvalue()
+
+
+def _local_report(payload_text: str) -> str:
+    try:
+        payload = json.loads(payload_text)
+    except ValueError:
+        return "Informe local: payload no interpretable."
+    lines = ["Informe (backend local, sin LLM)", ""]
+    for pais, cats in sorted((payload.get("totales_usd") or {}).items()):
+        total = sum(cats.values())
+        detalle = ", ".join(f"{cat}: {val:,.2f} USD" for cat, val in cats.items())
+        lines.append(f"- {pais}: {detalle} (total {total:,.2f} USD)")
+    return "\n".join(lines)
+
+
+_backend: Any = None
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = LocalBackend() if os.getenv("LLM_BACKEND", "openai") == "local" else OpenAIBackend()
+    return _backend
+
+
+# ========================
+# Caché persistente de respuestas
+# ========================
+
+class LLMCache:
+    """Respuestas guardadas por hash(modelo, mensajes, parámetros) con contadores de aciertos."""
+
+    def __init__(self, root: Path = LLM_CACHE_DIR, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.store = HttpCache(root, max_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _params(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Dict[str, Any]:
+        # El backend forma parte de la clave: una respuesta local nunca sustituye a la de OpenAI.
+        # Se guarda solo el hash para no duplicar prompts grandes en los metadatos.
+        raw = json.dumps({"backend": get_backend().name, "model": model, "messages": messages, **params},
+                         ensure_ascii=False, sort_keys=True, default=str)
+        return {"sha256": hashlib.sha256(raw.encode("utf-8")).hexdigest()}
+
+    def get(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Optional[str]:
+        data = self.store.get_bytes("llm://chat", self._params(model, messages, params), float("inf"))
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return data.decode("utf-8")
+
+    def put(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any], text: str):
+        self.store.put_bytes("llm://chat", self._params(model, messages, params), text.encode("utf-8"))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+LLM_CACHE = LLMCache()
+
+
+def chat_completion(model: str, messages: List[Dict[str, str]], use_cache: bool = LLM_CACHE_ENABLED,
+                    **params) -> str:
+    """Equivale a client.chat.completions.create(...).choices[0].message.content, con caché."""
+    if use_cache:
+        cached = LLM_CACHE.get(model, messages, params)
+        if cached is not None:
+            METRICAS.incr("llm_cache_hits", modelo=model)
+            return cached
+    with METRICAS.span("llm", modelo=model):
+        text = get_backend().complete(model, messages, **params)
+    if use_cache and text:
+        LLM_CACHE.put(model, messages, params, text)
+    return text
+
+
+def _retry_after(exc) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def chat_completion_with_retry(model: str, messages: List[Dict[str, str]], max_retries: int = 5,
+                               cancel: Optional[threading.Event] = None, **params) -> str:
+    """
+    chat_completion reintentando errores transitorios y 429 con backoff exponencial + jitter.
+    cancel: si se activa durante una espera, lanza TimeoutError en vez de reintentar.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return chat_completion(model, messages, **params)
+        except transient_errors() as e:
+            if attempt == max_retries:
+                raise
+            wait = _retry_after(e) or min(60.0, 2.0 ** attempt) * (0.5 + random.random())
+            METRICAS.incr("reintentos_429" if type(e).__name__ == "RateLimitError" else "reintentos", fuente="llm")
+            METRICAS.observar("espera_s", wait, fuente="llm", motivo=type(e).__name__)
+            print(f"⏳ LLM: {type(e).__name__}, reintento {attempt + 1}/{max_retries} en {wait:.1f}s")
+            if cancel is None:
+                time.sleep(wait)
+            elif cancel.wait(wait):
+                raise TimeoutError("LLM: reintentos cancelados") from e
@@ -0,0 +1,190 @@
+# utils_lotes.py
+"""
+Lotes de trabajos (año, método, país) sobre un pool de procesos. Cada trabajo
+descarga, normaliza y escribe su propia partición:
+
+  <salida>/anio=<año>/metodo=<método>/pais=<País>/part-00000.<parquet|ndjson>
+
+Los trabajos que van al mismo host comparten un semáforo entre procesos
+(LOTE_POR_HOST descargas simultáneas); la normalización y la escritura corren
+fuera del semáforo. La caché HTTP en disco (HTTP_CACHE_DIR) es común a todos.
+"""
+import json
+import multiprocessing
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product, zip_longest
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import utils_chile
+import utils_fuentes
+from utils_agregacion import CuboAgregado
+from utils_cache import is_offline, set_offline
+from utils_fuentes import (
+    chile_dir, chile_url, download_and_extract_chile, hosts_por_pais, normalizar_lote, query_chile_data,
+    query_colombia_api, query_ecuador_api,
+)
+from utils_llm import DisabledBackend, set_backend
+from utils_salida import write_dataset
+
+PAISES = ("Ecuador", "Colombia", "Chile")
+LOTE_DIR = Path(os.getenv("LOTE_DIR", "./datos_lote"))
+LOTE_PROCESOS = int(os.getenv("LOTE_PROCESOS", "0"))  # 0 = os.cpu_count()
+# Con 2 por host, Ecuador tiene a lo sumo dos RateLimiter activos (uno por proceso)
+LOTE_POR_HOST = int(os.getenv("LOTE_POR_HOST", "2"))
+
+
+class Trabajo(NamedTuple):
+    anio: int
+    metodo: str  # "" en Chile: el archivo anual trae todos los métodos
+    pais: str
+
+
+def slug(texto: str) -> str:
+    s = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", s.lower()).strip("-") or "todos"
+
+
+def parse_anios(texto: str) -> List[int]:
+    """'2019-2025' o '2019,2021,2023' (o ambos combinados)."""
+    anios: List[int] = []
+    for parte in texto.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        if "-" in parte:
+            desde, hasta = (int(x) for x in parte.split("-", 1))
+            anios += range(desde, hasta + 1)
+        else:
+            anios.append(int(parte))
+    return sorted(set(anios))
+
+
+def matriz(anios: Iterable[int], metodos: Iterable[str], paises: Iterable[str] = PAISES) -> List[Trabajo]:
+    """Producto año × método × país; Chile va una sola vez por año."""
+    trabajos: List[Trabajo] = []
+    for anio, metodo, pais in product(anios, metodos, paises):
+        t = Trabajo(int(anio), "" if pais == "Chile" else metodo, pais)
+        if t not in trabajos:
+            trabajos.append(t)
+    return trabajos
+
+
+def particion(salida: Path, t: Trabajo) -> Path:
+    """Raíz que recibe write_dataset (que agrega pais=<País>/)."""
+    return Path(salida) / f"anio={t.anio}" / f"metodo={slug(t.metodo)}"
+
+
+def _intercalar(trabajos: Sequence[Trabajo], hosts: Dict[str, str]) -> List[Trabajo]:
+    # Por turnos entre hosts: la primera tanda del pool no queda esperando un solo semáforo
+    grupos: Dict[str, List[Trabajo]] = defaultdict(list)
+    for t in trabajos:
+        grupos[hosts[t.pais]].append(t)
+    return [t for tanda in zip_longest(*grupos.values()) for t in tanda if t is not None]
+
+
+# ========================
+# Proceso hijo
+# ========================
+
+_SEMAFOROS: Dict[str, Any] = {}
+
+
+def _iniciar(semaforos: Dict[str, Any], offline: bool):
+    global _SEMAFOROS
+    _SEMAFOROS = semaforos
+    set_offline(offline)
+    # Los lotes solo ingestan: sin modelo y sin el respaldo LLM de Chile
+    set_backend(DisabledBackend())
+    # Cada trabajo ya es un proceso: el CSV de Chile se lee sin otro pool
+    utils_chile.CSV_PROCESOS = 1
+    utils_fuentes.CHILE_LLM_FALLBACK = False
+
+
+def _descargar(t: Trabajo, max_ec_rows: Optional[int]):
+    # Un fallo va a resumen["error"]: un año sin datos no se confunde con uno que no se pudo bajar
+    if t.pais == "Ecuador":
+        return query_ecuador_api(t.anio, t.metodo, max_ec_rows, raise_errors=True)
+    if t.pais == "Colombia":
+        return query_colombia_api(t.anio, t.metodo, "", raise_errors=True)
+    if t.pais == "Chile":
+        # Solo la descarga ocupa el host; query_chile_data reutiliza el CSV extraído
+        download_and_extract_chile(chile_url(t.anio), data_dir=chile_dir(t.anio))
+        return None
+    raise ValueError(f"País desconocido: {t.pais}")
+
+
+def ejecutar_trabajo(t: Trabajo, salida: str, fmt: str = "auto",
+                     max_ec_rows: Optional[int] = None) -> Dict[str, Any]:
+    inicio = time.monotonic()
+    resumen: Dict[str, Any] = {**t._asdict(), "filas": 0, "error": None}
+    try:
+        with _SEMAFOROS[t.pais]:
+            registros = _descargar(t, max_ec_rows)
+        if t.pais == "Chile":
+            registros = query_chile_data(year=t.anio, raise_errors=True)
+        registros = normalizar_lote(registros)
+        cubo = CuboAgregado()
+        cubo.add_many(registros)
+        destino = particion(Path(salida), t)
+        # Ecuador y Colombia comparten anio=/metodo=: cada trabajo reemplaza solo su país
+        resumen["filas"] = write_dataset(registros, destino, fmt=fmt, paises=[t.pais])
+        resumen["destino"] = str(destino)
+        resumen["totales_usd"] = {p: dict(cats) for p, cats in cubo.totales(paises=[t.pais]).items()}
+    except Exception as e:
+        resumen["error"] = f"{type(e).__name__}: {e}"
+    resumen["segundos"] = round(time.monotonic() - inicio, 3)
+    return resumen
+
+
+# ========================
+# Proceso principal
+# ========================
+
+def ejecutar_lote(trabajos: Sequence[Trabajo], salida: Path = LOTE_DIR, fmt: str = "auto",
+                  procesos: Optional[int] = None, por_host: int = LOTE_POR_HOST,
+                  max_ec_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Corre los trabajos en un pool de procesos y deja en <salida>/lote.json el
+    resumen de cada uno (filas, segundos, totales en USD o el error).
+    """
+    if not trabajos:
+        return []
+    salida = Path(salida)
+    hosts = hosts_por_pais()
+    ctx = multiprocessing.get_context()
+    por_host_sem = {h: ctx.BoundedSemaphore(por_host) for h in set(hosts.values())}
+    semaforos = {pais: por_host_sem[h] for pais, h in hosts.items()}
+    procesos = min(procesos or LOTE_PROCESOS or os.cpu_count() or 1, len(trabajos))
+
+    print(f"🗂️ Lote: {len(trabajos)} trabajos, {procesos} procesos, {por_host} por host → {salida}/")
+    inicio = time.monotonic()
+    resumenes: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=ctx, initializer=_iniciar,
+                             initargs=(semaforos, is_offline())) as pool:
+        futures = {pool.submit(ejecutar_trabajo, t, str(salida), fmt, max_ec_rows): t
+                   for t in _intercalar(trabajos, hosts)}
+        for i, f in enumerate(as_completed(futures), start=1):
+            try:
+                r = f.result()
+            except Exception as e:
+                # Un proceso caído (p. ej. sin memoria) no corta el lote: queda como error de su
+                # trabajo; segundos es lo transcurrido del lote hasta detectarlo
+                r = {**futures[f]._asdict(), "filas": 0, "error": f"{type(e).__name__}: {e}",
+                     "segundos": round(time.monotonic() - inicio, 3)}
+            resumenes.append(r)
+            estado = f"❌ {r['error']}" if r["error"] else f"{r['filas']} filas"
+            print(f"[{i}/{len(futures)}] {r['pais']} {r['anio']} {r['metodo'] or '(todos)'}: "
+                  f"{estado} en {r['segundos']:.1f}s")
+
+    resumenes.sort(key=lambda r: (r["anio"], r["metodo"], PAISES.index(r["pais"])))
+    salida.mkdir(parents=True, exist_ok=True)
+    with open(salida / "lote.json", "w", encoding="utf-8") as f:
+        json.dump({"duracion_s": round(time.monotonic() - inicio, 3), "trabajos": resumenes},
+                  f, ensure_ascii=False, indent=2)
+    return resumenes
@@ -0,0 +1,193 @@
+# utils_metricas.py
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+METRICAS_ENABLED = os.getenv("METRICAS", "0") == "1"
+MAX_TRAZA = int(os.getenv("METRICAS_MAX_TRAZA", "10000"))  # spans individuales guardados en el reporte
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def _etiquetas(labels: Dict[str, Any]) -> Etiquetas:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _SpanNulo:
+    """Lo que devuelve span() con las métricas desactivadas: no mide nada."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _SpanNulo()
+
+
+class _Span:
+    __slots__ = ("metricas", "nombre", "labels", "inicio")
+
+    def __init__(self, metricas: "Metricas", nombre: str, labels: Etiquetas):
+        self.metricas = metricas
+        self.nombre = nombre
+        self.labels = labels
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metricas._cerrar(self, time.perf_counter())
+        return False
+
+
+class Metricas:
+    """
+    Spans (duración por etapa), contadores y observaciones (p. ej. latencia o
+    tokens por chunk del LLM), agrupados por nombre + etiquetas.
+
+    Desactivado, cada llamada es un `if` y span() devuelve un objeto compartido,
+    así que la instrumentación puede quedar en los caminos calientes.
+    """
+
+    def __init__(self, activo: bool = METRICAS_ENABLED):
+        self.activo = activo
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.t0 = time.perf_counter()
+        self.inicio = time.time()
+        self.spans: Dict[Tuple[str, Etiquetas], List[float]] = {}  # [n, total, max]
+        self.contadores: Dict[Tuple[str, Etiquetas], float] = {}
+        self.observaciones: Dict[Tuple[str, Etiquetas], List[float]] = {}  # [n, suma, min, max]
+        self.traza: List[Dict[str, Any]] = []
+
+    def activar(self, valor: bool = True):
+        self.activo = valor
+
+    # ---- registro ----
+
+    def span(self, nombre: str, **labels):
+        if not self.activo:
+            return _NULO
+        return _Span(self, nombre, _etiquetas(labels))
+
+    def _cerrar(self, s: _Span, fin: float):
+        dur = fin - s.inicio
+        with self.lock:
+            agg = self.spans.get((s.nombre, s.labels))
+            if agg is None:
+                self.spans[(s.nombre, s.labels)] = [1, dur, dur]
+            else:
+                agg[0] += 1
+                agg[1] += dur
+                if dur > agg[2]:
+                    agg[2] = dur
+            if len(self.traza) < MAX_TRAZA:
+                self.traza.append({
+                    "nombre": s.nombre, "etiquetas": dict(s.labels),
+                    "inicio_s": round(s.inicio - self.t0, 6), "duracion_s": round(dur, 6),
+                    "hilo": threading.current_thread().name,
+                })
+
+    def incr(self, nombre: str, valor: float = 1, **labels):
+        if not self.activo:
+            return
+        key = (nombre, _etiquetas(labels))
+        with self.lock:
+            self.contadores[key] = self.contadores.get(key, 0) + valor
+
+    def observar(self, nombre: str, valor: float, **labels):
+        if not self.activo:
+            return
+        key = (nombre, _etiquetas(labels))
+        with self.lock:
+            agg = self.observaciones.get(key)
+            if agg is None:
+                self.observaciones[key] = [1, valor, valor, valor]
+            else:
+                agg[0] += 1
+                agg[1] += valor
+                agg[2] = min(agg[2], valor)
+                agg[3] = max(agg[3], valor)
+
+    # ---- exportación ----
+
+    def reporte(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+                "duracion_s": round(time.perf_counter() - self.t0, 6),
+                "spans": [
+                    {"nombre": n, "etiquetas": dict(l), "n": int(a[0]), "total_s": round(a[1], 6),
+                     "media_s": round(a[1] / a[0], 6), "max_s": round(a[2], 6)}
+                    for (n, l), a in sorted(self.spans.items())
+                ],
+                "contadores": [
+                    {"nombre": n, "etiquetas": dict(l), "valor": v}
+                    for (n, l), v in sorted(self.contadores.items())
+                ],
+                "observaciones": [
+                    {"nombre": n, "etiquetas": dict(l), "n": int(a[0]), "suma": a[1],
+                     "media": a[1] / a[0], "min": a[2], "max": a[3]}
+                    for (n, l), a in sorted(self.observaciones.items())
+                ],
+                "traza": list(self.traza),
+            }
+
+    def exportar_json(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.reporte(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def openmetrics(self, prefijo: str = "compras") -> str:
+        """Texto en formato OpenMetrics (spans y observaciones como summary)."""
+
+        def fmt(labels: Etiquetas) -> str:
+            if not labels:
+                return ""
+            esc = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, esc)) + "}"
+
+        def agrupar(items):
+            grupos: Dict[str, list] = {}
+            for (n, l), v in sorted(items):
+                grupos.setdefault(n, []).append((l, v))
+            return grupos.items()
+
+        lines = []
+        with self.lock:
+            for n, filas in agrupar(self.contadores.items()):
+                lines.append(f"# TYPE {prefijo}_{n} counter")
+                lines += [f"{prefijo}_{n}_total{fmt(l)} {v}" for l, v in filas]
+            for n, filas in agrupar(self.spans.items()):
+                lines.append(f"# TYPE {prefijo}_{n}_seconds summary")
+                lines.append(f"# UNIT {prefijo}_{n}_seconds seconds")
+                for l, a in filas:
+                    lines.append(f"{prefijo}_{n}_seconds_count{fmt(l)} {int(a[0])}")
+                    lines.append(f"{prefijo}_{n}_seconds_sum{fmt(l)} {a[1]:.6f}")
+            for n, filas in agrupar(self.observaciones.items()):
+                lines.append(f"# TYPE {prefijo}_{n} summary")
+                for l, a in filas:
+                    lines.append(f"{prefijo}_{n}_count{fmt(l)} {int(a[0])}")
+                    lines.append(f"{prefijo}_{n}_sum{fmt(l)} {a[1]}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def exportar_openmetrics(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.openmetrics(), encoding="utf-8")
+        return path
+
+
+METRICAS = Metricas()
@@ -0,0 +1,249 @@
+# utils_montos.py
+import operator
+import os
+import re
+from array import array
+from itertools import repeat
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # sin numpy se usa el camino escalar
+    np = None
+
+# numpy.strings existe desde NumPy 2.0; antes las cadenas "sucias" van al camino escalar
+_NS = getattr(np, "strings", None)
+# Las cadenas se copian a un array de ancho fijo (el de la más larga): las que
+# pasan de MAX_ANCHO caracteres se resuelven una a una
+MAX_ANCHO = 32
+
+CURRENCY_TOKENS = ["USD", "US$", "$", "CLP", "COP", "UF", "CLF", "FET"]
+
+
+def to_number(val) -> float:
+    if val is None:
+        return 0.0
+    if isinstance(val, (int, float)):
+        return float(val)
+
+    s = str(val).strip()
+    if s == "":
+        return 0.0
+
+    repl = CURRENCY_TOKENS
+    s_up = s.upper()
+    for token in repl:
+        s_up = s_up.replace(token, "")
+    s = s_up
+
+    s = s.replace("\xa0", " ").strip()
+
+    if s.count(".") > 0 and s.count(",") > 0:
+        s = s.replace(".", "")
+        s = s.replace(",", ".")
+    else:
+        if s.count(",") == 1 and len(s.split(",")[-1]) in (1, 2):
+            s = s.replace(",", ".")
+        else:
+            s = s.replace(",", "")
+
+    s = s.replace(" ", "")
+
+    if s.startswith("(") and s.endswith(")"):
+        s = "-" + s[1:-1]
+
+    s = re.sub(r"[^0-9\.\-]", "", s)
+
+    try:
+        return float(s) if s not in ("", ".", "-", "-.") else 0.0
+    except Exception:
+        return 0.0
+
+
+# ========================
+# Tasas de cambio (se resuelven una vez por ejecución)
+# ========================
+
+_FX_RATES: Optional[Dict[Any, float]] = None
+
+
+def fx_rates() -> Dict[Any, float]:
+    """
+    Variables de entorno para ajustar tasas:
+      FX_COP_PER_USD (default 4000)
+      FX_CLP_PER_USD (default 850)
+      FX_UF_USD      (default 42)
+    """
+    global _FX_RATES
+    if _FX_RATES is None:
+        cop_per_usd = to_number(os.getenv("FX_COP_PER_USD", "4000"))
+        clp_per_usd = to_number(os.getenv("FX_CLP_PER_USD", "850"))
+        uf_usd      = to_number(os.getenv("FX_UF_USD", "42"))
+
+        _FX_RATES = {
+            "USD": 1.0,
+            "COP": (1.0 / cop_per_usd) if cop_per_usd > 0 else 0.00025,
+            "CLP": (1.0 / clp_per_usd) if clp_per_usd > 0 else 1/850.0,
+            "UF": uf_usd if uf_usd > 0 else 42.0,
+            "CLF": uf_usd if uf_usd > 0 else 42.0,
+            "FET": uf_usd if uf_usd > 0 else 42.0,
+            "": 1.0,
+            None: 1.0,
+        }
+    return _FX_RATES
+
+
+def reset_fx_rates():
+    """Vuelve a leer FX_* del entorno en la próxima conversión."""
+    global _FX_RATES
+    _FX_RATES = None
+
+
+def convertir_a_usd(valor, moneda):
+    v = to_number(valor)
+    m = (moneda or "USD").strip().upper()
+    return float(v) * fx_rates().get(m, 1.0)
+
+
+# ========================
+# API por lotes (columnas completas)
+# ========================
+
+def _float_mask(s):
+    """
+    Sobre la matriz de code points: (ok, vacío). ok = solo [0-9.-] con forma de
+    float válido (a lo sumo un punto, signo solo al inicio); vacío = sin dígitos.
+    """
+    n = len(s)
+    if s.dtype.itemsize == 0:
+        return np.ones(n, dtype=bool), np.ones(n, dtype=bool)
+    m = s.view(np.uint32).reshape(n, -1)
+    digit = (m >= 48) & (m <= 57)
+    dot = m == 46
+    minus = m == 45
+    allowed = (digit | dot | minus | (m == 0)).all(axis=1)
+    n_minus = minus.sum(axis=1)
+    ok = allowed & (dot.sum(axis=1) <= 1) & ((n_minus == 0) | ((n_minus == 1) & minus[:, 0]))
+    return ok, ok & ~digit.any(axis=1)
+
+
+def _parse_floats(s, ok, empty):
+    values = np.zeros(len(s), dtype=np.float64)
+    parse = ok & ~empty
+    if parse.any():
+        with np.errstate(over="ignore"):  # como float(): desborda a inf sin avisar
+            values[parse] = s[parse].astype(np.float64)
+    return values
+
+
+def _reemplazar(d, viejo: str, nuevo: str = "", filas=None):
+    """
+    numpy.strings.replace solo sobre las filas que contienen `viejo` (y están en
+    `filas`), en el mismo array: `nuevo` nunca es más largo que `viejo`.
+    """
+    m = _NS.find(d, viejo) >= 0
+    if filas is not None:
+        m &= filas
+    if m.any():
+        d[m] = _NS.replace(d[m], viejo, nuevo)
+    return d
+
+
+def _to_number_vectorized(strs: Sequence[str]):
+    """
+    Aplica las mismas reglas que to_number con operaciones de numpy.strings.
+    Devuelve (valores, máscara_ok); las posiciones sin máscara se resuelven
+    con el camino escalar (paréntesis, letras sueltas, formatos raros).
+    """
+    s = np.asarray(strs, dtype=np.str_)
+    # Camino rápido: cadenas que ya son un float limpio no necesitan limpieza
+    ok, empty = _float_mask(s)
+    values = _parse_floats(s, ok, empty)
+    dirty = np.flatnonzero(~ok)
+    if len(dirty) == 0 or _NS is None:
+        return values, ok
+
+    ns = _NS
+    d = s[dirty]
+    d = ns.upper(ns.strip(d))
+    for token in CURRENCY_TOKENS:
+        d = _reemplazar(d, token)
+    d = ns.strip(_reemplazar(d, "\xa0", " "))
+
+    n_dot = ns.count(d, ".")
+    n_comma = ns.count(d, ",")
+    both = (n_dot > 0) & (n_comma > 0)
+    decimals_after_comma = ns.str_len(d) - ns.rfind(d, ",") - 1
+    comma_decimal = ~both & (n_comma == 1) & ((decimals_after_comma == 1) | (decimals_after_comma == 2))
+
+    d = _reemplazar(d, ".", "", both)
+    decimal = both | comma_decimal
+    d = _reemplazar(d, ",", ".", decimal)
+    d = _reemplazar(d, ",", "", ~decimal)
+    d = _reemplazar(d, " ")
+    # "(123)" → "-123"; los paréntesis que queden en medio los deja al camino escalar
+    parens = ns.startswith(d, "(") & ns.endswith(d, ")")
+    if parens.any():
+        d = np.where(parens, ns.add("-", ns.strip(d, "()")), d)
+
+    d_ok, d_empty = _float_mask(d)
+    values[dirty] = _parse_floats(d, d_ok, d_empty)
+    ok[dirty] = d_ok
+    return values, ok
+
+
+def to_number_many(values: Iterable[Any]):
+    """Versión por lotes de to_number: devuelve un array float64 (o array('d') sin numpy)."""
+    values = list(values)
+    if np is None:
+        return array("d", (to_number(v) for v in values))
+
+    n = len(values)
+    out = np.zeros(n, dtype=np.float64)
+    # type(v) is str evaluado en C (map), sin un bucle de Python por valor
+    es_str = np.fromiter(map(operator.is_, map(type, values), repeat(str)), dtype=bool, count=n)
+    for i in np.flatnonzero(~es_str).tolist():
+        v = values[i]
+        if v is not None:
+            out[i] = float(v) if isinstance(v, (int, float)) else to_number(v)
+
+    str_pos = np.flatnonzero(es_str)
+    strs = [values[i] for i in str_pos.tolist()]
+    if not strs:
+        return out
+    cortas = np.fromiter(map(len, strs), dtype=np.intp, count=len(strs)) <= MAX_ANCHO
+    if not cortas.all():
+        for j in np.flatnonzero(~cortas).tolist():
+            out[str_pos[j]] = to_number(strs[j])
+        str_pos = str_pos[cortas]
+        strs = [strs[j] for j in np.flatnonzero(cortas).tolist()]
+    if strs:
+        parsed, ok = _to_number_vectorized(strs)
+        out[str_pos[ok]] = parsed[ok]
+        for j in np.flatnonzero(~ok).tolist():
+            out[str_pos[j]] = to_number(strs[j])
+    return out
+
+
+def fx_rate_many(monedas: Iterable[Any]):
+    rates = fx_rates()
+    memo: Dict[Any, float] = {}
+
+    def rate(m):
+        if m not in memo:
+            memo[m] = rates.get((m or "USD").strip().upper(), 1.0)
+        return memo[m]
+
+    if np is None:
+        return array("d", (rate(m) for m in monedas))
+    return np.fromiter((rate(m) for m in monedas), dtype=np.float64)
+
+
+def convertir_a_usd_many(valores: Iterable[Any], monedas: Iterable[Any]):
+    """Versión por lotes de convertir_a_usd (mismo resultado posición a posición)."""
+    nums = to_number_many(valores)
+    rates = fx_rate_many(monedas)
+    if np is None:
+        return array("d", (v * r for v, r in zip(nums, rates)))
+    with np.errstate(over="ignore"):
+        return nums * rates
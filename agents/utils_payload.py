@@ -0,0 +1,153 @@
+# utils_payload.py
+import json
+import os
+import random
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils_chile import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # sin tiktoken se estima por caracteres
+    tiktoken = None
+
+ANALISIS_MAX_TOKENS = int(os.getenv("ANALISIS_MAX_TOKENS", "12000"))
+MAX_POR_ESTRATO = 200  # reservorio por (pais, categoria); el presupuesto decide cuántas entran
+# Semilla fija: con los mismos datos el prompt es idéntico y la caché del LLM acierta
+ANALISIS_SEMILLA = int(os.getenv("ANALISIS_SEMILLA", "0"))
+
+# Columnas de la muestra y largo máximo de cada texto libre
+MUESTRA_COLUMNAS = ["entidad", "objeto", "presupuesto_usd", "lugar", "fecha_conv", "proveedor", "justificacion"]
+TEXTO_MAX = {"entidad": 60, "objeto": 120, "lugar": 30, "proveedor": 60, "justificacion": 80}
+
+
+# ========================
+# Tokens
+# ========================
+
+_encoders: Dict[str, Any] = {}
+
+
+def _encoder(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except Exception:  # modelo desconocido o sin el archivo de encoding (sin red)
+            try:
+                _encoders[model] = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoders[model] = None
+    return _encoders[model]
+
+
+def contar_tokens(text: str, model: str = "gpt-4o") -> int:
+    enc = _encoder(model)
+    if enc is None:
+        return estimate_tokens(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+# ========================
+# Muestreo y codificación compacta
+# ========================
+
+def muestra_estratificada(registros: Iterable[Dict[str, Any]], por_estrato: int = MAX_POR_ESTRATO,
+                          semilla: Optional[int] = ANALISIS_SEMILLA
+                          ) -> Tuple[Dict[Tuple[str, str], List[Dict[str, Any]]], Dict[Tuple[str, str], int]]:
+    """
+    Muestra aleatoria uniforme (y barajada) de hasta `por_estrato` registros por
+    (pais, categoria) en una sola pasada (reservoir sampling), y el total por estrato.
+    Con semilla=None la muestra cambia en cada llamada.
+    """
+    rnd = random.Random(semilla)
+    reservas: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    vistos: Dict[Tuple[str, str], int] = defaultdict(int)
+    for d in registros:
+        key = (d.get("pais") or "Desconocido", d.get("categoria") or "Otras")
+        vistos[key] += 1
+        res = reservas[key]
+        if len(res) < por_estrato:
+            res.append(d)
+        else:
+            j = rnd.randrange(vistos[key])
+            if j < por_estrato:
+                res[j] = d
+    for res in reservas.values():
+        rnd.shuffle(res)
+    return dict(reservas), dict(vistos)
+
+
+def _recortar(value: Any, limite: int) -> str:
+    s = " ".join(str(value or "").split())
+    return s if len(s) <= limite else s[:limite - 1].rstrip() + "…"
+
+
+def fila_compacta(d: Dict[str, Any]) -> List[Any]:
+    out = []
+    for col in MUESTRA_COLUMNAS:
+        val = d.get(col)
+        if col == "presupuesto_usd":
+            out.append(round(float(val or 0)))
+        elif col == "fecha_conv":
+            out.append(str(val or "")[:10])
+        else:
+            out.append(_recortar(val, TEXTO_MAX.get(col, 80)))
+    return out
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def construir_payload(registros: Iterable[Dict[str, Any]], totales: Dict[str, Dict[str, float]],
+                      max_tokens: int = ANALISIS_MAX_TOKENS, model: str = "gpt-4o",
+                      semilla: Optional[int] = ANALISIS_SEMILLA) -> str:
+    """
+    Payload del Analysis Agent dentro de `max_tokens`:
+      totales_usd (completo) + conteo por estrato + muestra tabular
+      {"columnas": [...], "estratos": {"País|Categoría": [[...], ...]}}
+    Las filas se agregan por turnos entre estratos hasta agotar el presupuesto.
+    """
+    estratos, conteos = muestra_estratificada(registros, semilla=semilla)
+    claves = sorted(estratos)
+    payload: Dict[str, Any] = {
+        "totales_usd": {
+            pais: {cat: round(val, 2) for cat, val in cats.items()}
+            for pais, cats in totales.items()
+        },
+        # La muestra es parcial: el total real de cada estrato va aparte
+        "registros_por_estrato": {f"{p}|{c}": conteos[(p, c)] for p, c in claves},
+        "muestra": {"columnas": MUESTRA_COLUMNAS, "estratos": {f"{p}|{c}": [] for p, c in claves}},
+    }
+    base = contar_tokens(_dumps(payload), model)
+    restante = max_tokens - base
+
+    # Por turnos: primero una fila de cada estrato, luego la segunda, ...
+    elegidas: Dict[Tuple[str, str], List[List[Any]]] = defaultdict(list)
+    ronda = 0
+    while restante > 0 and any(ronda < len(estratos[k]) for k in claves):
+        for k in claves:
+            if ronda >= len(estratos[k]):
+                continue
+            fila = fila_compacta(estratos[k][ronda])
+            costo = contar_tokens(_dumps(fila), model) + 1  # + la coma
+            if costo > restante:
+                restante = 0
+                break
+            elegidas[k].append(fila)
+            restante -= costo
+        ronda += 1
+
+    for k in claves:
+        payload["muestra"]["estratos"][f"{k[0]}|{k[1]}"] = elegidas[k]
+
+    # Ajuste final con el texto completo (la suma por fila es aproximada)
+    text = _dumps(payload)
+    while contar_tokens(text, model) > max_tokens and any(elegidas.values()):
+        k = max(elegidas, key=lambda c: len(elegidas[c]))
+        elegidas[k].pop()
+        text = _dumps(payload)
+    return text
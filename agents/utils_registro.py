@@ -0,0 +1,130 @@
+# utils_registro.py
+import sys
+from itertools import repeat
+from typing import Any, Dict, Iterable, List, Sequence
+
+# Campos de un registro normalizado (mismo orden que la salida, ver utils_salida)
+CAMPOS = (
+    "pais", "id", "entidad", "objeto", "presupuesto", "moneda", "lugar",
+    "fecha_conv", "fecha_adj", "oferentes", "proveedor", "valor_adj",
+    "justificacion", "categoria", "presupuesto_usd", "valor_adj_usd",
+)
+# Textos de pocos valores distintos que se repiten en miles de filas (las fechas suelen
+# ser solo el día): una sola copia por valor con sys.intern
+INTERNADOS = frozenset({"pais", "moneda", "categoria", "entidad", "lugar", "proveedor", "justificacion",
+                        "fecha_conv", "fecha_adj"})
+
+_CAMPOS = frozenset(CAMPOS)
+_FALTA = object()
+_intern = sys.intern
+
+
+class Registro:
+    """
+    Registro normalizado con __slots__ (sin un dict por fila) y los textos de
+    INTERNADOS compartidos entre filas. Se usa como un dict (get, [], in,
+    setdefault, keys/items, dict(r)); un campo nunca asignado es una clave ausente.
+    as_dict() lo convierte para JSON o el payload del LLM.
+    """
+    __slots__ = CAMPOS
+
+    def __init__(self, **campos):
+        for k, v in campos.items():
+            if k in INTERNADOS and type(v) is str:
+                v = _intern(v)
+            setattr(self, k, v)
+
+    @classmethod
+    def desde_columnas(cls, columnas: Dict[str, Sequence[Any]], **constantes) -> List["Registro"]:
+        """Registros a partir de un lote por columnas (p. ej. utils_chile.iter_lotes_csv)."""
+        nombres = list(columnas) + list(constantes)
+        fijar = [getattr(cls, k).__set__ for k in nombres]  # descriptores de los slots
+        cols = [
+            [_intern(v) if type(v) is str else v for v in col] if k in INTERNADOS else col
+            for k, col in columnas.items()
+        ]
+        cols += [repeat(_intern(v) if k in INTERNADOS and type(v) is str else v)
+                 for k, v in constantes.items()]
+        nuevo = object.__new__
+        out = []
+        for vals in zip(*cols):
+            r = nuevo(cls)
+            for f, v in zip(fijar, vals):
+                f(r, v)
+            out.append(r)
+        return out
+
+    @classmethod
+    def desde_dict(cls, d: Dict[str, Any]) -> "Registro":
+        """Como Registro(**d), ignorando claves que no son campos (p. ej. datos guardados)."""
+        return cls(**{k: v for k, v in d.items() if k in _CAMPOS})
+
+    # ---- interfaz de dict ----
+
+    def __getitem__(self, k):
+        if k in _CAMPOS:
+            v = getattr(self, k, _FALTA)
+            if v is not _FALTA:
+                return v
+        raise KeyError(k)
+
+    def __setitem__(self, k, v):
+        if k not in _CAMPOS:
+            raise KeyError(k)
+        if k in INTERNADOS and type(v) is str:
+            v = _intern(v)
+        setattr(self, k, v)
+
+    def __contains__(self, k):
+        return k in _CAMPOS and hasattr(self, k)
+
+    def get(self, k, default=None):
+        return getattr(self, k, default) if k in _CAMPOS else default
+
+    def setdefault(self, k, default=None):
+        v = self.get(k, _FALTA)
+        if v is _FALTA:
+            self[k] = v = default
+        return v
+
+    def keys(self) -> List[str]:
+        return [k for k in CAMPOS if hasattr(self, k)]
+
+    def items(self):
+        return self.as_dict().items()
+
+    def values(self):
+        return self.as_dict().values()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = {}
+        for k in CAMPOS:
+            v = getattr(self, k, _FALTA)
+            if v is not _FALTA:
+                out[k] = v
+        return out
+
+    def __eq__(self, other):
+        if isinstance(other, (Registro, dict)):
+            return self.as_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Registro({self.as_dict()!r})"
+
+
+def a_dict(d) -> Dict[str, Any]:
+    return d.as_dict() if isinstance(d, Registro) else d
+
+
+def a_dicts(registros: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Lista de dicts (para json.dump) a partir de Registro o dicts."""
+    return [a_dict(d) for d in registros]
@@ -0,0 +1,203 @@
+# utils_salida.py
+import json
+import mmap
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils_registro import CAMPOS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él se escribe NDJSON
+    pa = None
+    pq = None
+
+# Columnas de salida (los campos de un Registro); las numéricas se guardan como float64
+OUTPUT_COLUMNS = list(CAMPOS)
+NUMERIC_COLUMNS = {"presupuesto", "presupuesto_usd", "valor_adj_usd"}
+
+
+def _partition_dir(root: Path, pais: str) -> Path:
+    return root / f"pais={pais or 'Desconocido'}"
+
+
+def _typed(record: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for col in OUTPUT_COLUMNS:
+        val = record.get(col)
+        if col in NUMERIC_COLUMNS:
+            try:
+                out[col] = float(val or 0.0)
+            except (TypeError, ValueError):
+                out[col] = 0.0
+        else:
+            out[col] = None if val is None else str(val)
+    return out
+
+
+def _arrow_schema():
+    return pa.schema([
+        (col, pa.float64() if col in NUMERIC_COLUMNS else pa.string())
+        for col in OUTPUT_COLUMNS
+    ])
+
+
+class DatasetWriter:
+    """
+    Escritor en streaming particionado por país:
+      <root>/pais=<País>/part-00000.parquet   (si pyarrow está instalado)
+      <root>/pais=<País>/part-00000.ndjson    (en otro caso)
+
+    Las particiones se escriben en <root>/.escritura-<pid>/ y close() reemplaza
+    las de `paises` (por defecto todas las pais=* de root) y las que recibieron
+    filas: un país sin filas en esta corrida no conserva las de la anterior. Si
+    la escritura falla, root queda como estaba.
+    """
+
+    def __init__(self, root: Path, fmt: str = "auto", batch_size: int = 50000,
+                 paises: Optional[Iterable[str]] = None):
+        if fmt == "auto":
+            fmt = "parquet" if pq is not None else "ndjson"
+        if fmt == "parquet" and pq is None:
+            raise ImportError("Para fmt='parquet' hace falta instalar pyarrow")
+        self.root = Path(root)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self._files: Dict[str, Any] = {}
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self.rows = 0
+        self.paises = None if paises is None else list(paises)
+        self._staging = self.root / f".escritura-{os.getpid()}"
+        shutil.rmtree(self._staging, ignore_errors=True)
+        self._cerrado = False
+
+    def _open(self, pais: str):
+        part = _partition_dir(self._staging, pais)
+        part.mkdir(parents=True, exist_ok=True)
+        if self.fmt == "parquet":
+            return pq.ParquetWriter(part / "part-00000.parquet", _arrow_schema(), compression="zstd")
+        return open(part / "part-00000.ndjson", "w", encoding="utf-8")
+
+    def _flush(self, pais: str):
+        rows = self._buffers.get(pais)
+        if not rows:
+            return
+        table = pa.Table.from_pylist(rows, schema=_arrow_schema())
+        self._files[pais].write_table(table)
+        self._buffers[pais] = []
+
+    def write(self, record: Dict[str, Any]):
+        row = _typed(record)
+        pais = row["pais"] or "Desconocido"
+        if pais not in self._files:
+            self._files[pais] = self._open(pais)
+            self._buffers[pais] = []
+        if self.fmt == "parquet":
+            self._buffers[pais].append(row)
+            if len(self._buffers[pais]) >= self.batch_size:
+                self._flush(pais)
+        else:
+            self._files[pais].write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def write_many(self, records: Iterable[Dict[str, Any]]):
+        for r in records:
+            self.write(r)
+
+    def close(self):
+        if self._cerrado:
+            return
+        for pais, f in self._files.items():
+            if self.fmt == "parquet":
+                self._flush(pais)
+            f.close()
+        self._files = {}
+        self._publicar()
+        self._cerrado = True
+
+    def _publicar(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        nuevas = sorted(self._staging.iterdir()) if self._staging.is_dir() else []
+        if self.paises is None:
+            viejas = [p for p in self.root.glob("pais=*") if p.is_dir()]
+        else:
+            viejas = [_partition_dir(self.root, p) for p in self.paises]
+        for old in viejas + [self.root / p.name for p in nuevas]:
+            if old.is_dir():
+                shutil.rmtree(old)
+        for part in nuevas:
+            part.rename(self.root / part.name)
+        if self._staging.is_dir():
+            self._staging.rmdir()
+
+    def abort(self):
+        """Descarta lo escrito; las particiones de root no se tocan."""
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        shutil.rmtree(self._staging, ignore_errors=True)
+        self._cerrado = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_dataset(records: Iterable[Dict[str, Any]], root: Path, fmt: str = "auto",
+                  paises: Optional[Iterable[str]] = None) -> int:
+    """Escribe el dataset completo de root (o solo el de `paises`, ver DatasetWriter)."""
+    with DatasetWriter(root, fmt=fmt, paises=paises) as w:
+        w.write_many(records)
+        return w.rows
+
+
+def _partitions(root: Path, paises: Optional[Iterable[str]]) -> List[Path]:
+    root = Path(root)
+    if paises is None:
+        return sorted(p for p in root.glob("pais=*") if p.is_dir())
+    return [_partition_dir(root, p) for p in paises if _partition_dir(root, p).is_dir()]
+
+
+def read_dataset(root: Path, paises: Optional[Iterable[str]] = None,
+                 columns: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Lee el dataset fila a fila proyectando solo `columns` y solo las particiones
+    de `paises`. Los archivos se abren con memory-map.
+    """
+    cols = columns or OUTPUT_COLUMNS
+    for part in _partitions(root, paises):
+        for path in sorted(part.glob("part-*.parquet")):
+            if pq is None:
+                raise ImportError(f"Hace falta pyarrow para leer {path}")
+            table = pq.read_table(path, columns=cols, memory_map=True)
+            for batch in table.to_batches():
+                yield from batch.to_pylist()
+        for path in sorted(part.glob("part-*.ndjson")):
+            if path.stat().st_size == 0:
+                continue
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for line in iter(mm.readline, b""):
+                    row = json.loads(line)
+                    yield {c: row.get(c) for c in cols}
+
+
+def read_table(root: Path, paises: Optional[Iterable[str]] = None, columns: Optional[List[str]] = None):
+    """Devuelve un pyarrow.Table (requiere pyarrow) con la proyección pedida."""
+    if pq is None:
+        raise ImportError("read_table requiere pyarrow")
+    cols = columns or OUTPUT_COLUMNS
+    tables = []
+    for part in _partitions(root, paises):
+        for path in sorted(part.glob("part-*.parquet")):
+            tables.append(pq.read_table(path, columns=cols, memory_map=True))
+    if not tables:
+        return pa.table({c: pa.array([], type=_arrow_schema().field(c).type) for c in cols})
+    return pa.concat_tables(tables)
@@ -0,0 +1,383 @@
+# bench.py
+"""
+Benchmarks por etapa del pipeline, sin red.
+
+  python benchmarks/bench.py --tamano 10k
+  python benchmarks/bench.py --tamano 1m --etapas montos_lote,clasificador --repeticiones 3
+  python benchmarks/bench.py --tamano 10k --comparar benchmarks/resultados/<archivo>.json
+
+Cada etapa corre en un proceso nuevo (directorio de trabajo y caché HTTP
+temporales) contra el servidor local de servidor.py, y reporta filas/s y el
+pico de memoria (RSS) de la parte medida. Los resultados se guardan en
+benchmarks/resultados/ y se comparan con la corrida anterior del mismo tamaño;
+una caída de throughput o un aumento de memoria mayor a --umbral se marca como
+regresión (código de salida 1).
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+AGENTS_DIR = BENCH_DIR.parent / "agents"
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+RESULTADOS_DIR = BENCH_DIR / "resultados"
+
+sys.path.insert(0, str(AGENTS_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generadores import TAMANOS, fixtures  # noqa: E402
+
+# Ignora diferencias de memoria menores a esto al buscar regresiones
+MIN_DELTA_MB = 8.0
+
+
+# ========================
+# Memoria
+# ========================
+
+def _reset_pico() -> bool:
+    # Linux: escribir 5 en clear_refs reinicia VmHWM (pico de RSS)
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(campo: str) -> Optional[float]:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(campo + ":"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _pico_mb() -> float:
+    pico = _rss_mb("VmHWM")
+    if pico is not None or resource is None:
+        return pico or 0.0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+# ========================
+# Entradas compartidas por las etapas en memoria
+# ========================
+
+def _ndjson(path: Path, n: int):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in islice(f, n):
+            yield json.loads(line)
+
+
+def _chile_registros(path: Path, n: int):
+    from utils_chile import SCHEMA_FIELDS, build_column_index, iter_chile_rows
+    from utils_registro import Registro
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        index = build_column_index(next(reader))
+        for row in islice(iter_chile_rows(reader, index), n):
+            d = dict(zip(SCHEMA_FIELDS, row))
+            d["moneda"] = (d["moneda"] or "CLP").upper()
+            yield Registro(pais="Chile", **d)
+
+
+def _registros(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """~n registros sin normalizar, un tercio por país (como llegan al router)."""
+    from utils_colombia import normalize_from_soda_row
+    from utils_ecuador import normalize_from_search_row
+    fx, tercio = ctx["fixtures"], -(-ctx["n"] // 3)
+    out = [normalize_from_search_row(r) for r in _ndjson(fx / "ecuador.ndjson", tercio)]
+    out += [normalize_from_soda_row(r) for r in _ndjson(fx / "colombia.ndjson", tercio)]
+    out += list(_chile_registros(fx / "contracts.csv", tercio))
+    return out
+
+
+# ========================
+# Etapas: preparar(ctx) → función medida que devuelve las filas procesadas
+# ========================
+
+def _sin_limite_ecuador():
+    import utils_ecuador
+    lim = utils_ecuador.ECUADOR_LIMITER
+    lim.rate = lim.max_rate = 1e6
+    lim.burst = lim.tokens = 1e6
+    return lim
+
+
+def etapa_ecuador_descarga(ctx):
+    import utils_ecuador
+    utils_ecuador.SEARCH_URL = ctx["urls"]["ecuador"]
+    lim = _sin_limite_ecuador()
+    return lambda: len(utils_ecuador.fetch_search_since(max_rows=ctx["n"], limiter=lim)[0])
+
+
+def etapa_colombia_descarga(ctx):
+    from utils_colombia import fetch_all_soda
+    return lambda: sum(1 for _ in fetch_all_soda("1=1", url=ctx["urls"]["colombia"]))
+
+
+def etapa_chile_descarga(ctx):
+    from utils_chile import download_chile_csv
+    data_dir = Path("data")
+    data_dir.mkdir(exist_ok=True)
+
+    def run():
+        download_chile_csv(ctx["urls"]["chile"], data_dir, mode="stream")
+        return ctx["n"]
+    return run
+
+
+def etapa_chile_reglas(ctx):
+    from utils_chile import normalize_chile_rules
+
+    def run():
+        normalize_chile_rules(ctx["fixtures"] / "contracts.csv", Path("chile_normalized.csv"))
+        return ctx["n"]
+    return run
+
+
+def etapa_chile_lectura(ctx):
+    from utils_chile import iter_lotes_csv, normalize_chile_rules, registros_de_lote
+    path = normalize_chile_rules(ctx["fixtures"] / "contracts.csv", Path("chile_normalized.csv"))
+    return lambda: sum(len(registros_de_lote(lote)) for lote in iter_lotes_csv(path))
+
+
+def _montos(ctx):
+    return [d.get("presupuesto") for d in _registros(ctx)]
+
+
+def etapa_montos_escalar(ctx):
+    from utils_montos import to_number
+    valores = _montos(ctx)
+    return lambda: len([to_number(v) for v in valores])
+
+
+def etapa_montos_lote(ctx):
+    from utils_montos import to_number_many
+    valores = _montos(ctx)
+    return lambda: len(to_number_many(valores))
+
+
+def etapa_clasificador(ctx):
+    import final_agent
+    filas = [(d.get("objeto", ""), d.get("entidad", ""), d.get("justificacion", "")) for d in _registros(ctx)]
+
+    def run():
+        for o, e, j in filas:
+            final_agent.clasificar_categoria_avanzado(o, e, j)
+        return len(filas)
+    return run
+
+
+def etapa_normalizacion(ctx):
+    import final_agent
+    registros = _registros(ctx)
+    return lambda: len(final_agent.normalizar_lote(registros))
+
+
+def etapa_agregacion(ctx):
+    import final_agent
+    from utils_agregacion import CuboAgregado
+    registros = final_agent.normalizar_lote(_registros(ctx))
+
+    def run():
+        CuboAgregado().add_many(registros)
+        return len(registros)
+    return run
+
+
+def etapa_router(ctx):
+    import final_agent
+    import utils_ecuador
+    import utils_fuentes
+    utils_ecuador.SEARCH_URL = ctx["urls"]["ecuador"]
+    _sin_limite_ecuador()
+    utils_fuentes.SODA_URL = ctx["urls"]["colombia"]
+    utils_fuentes.CHILE_URL_TEMPLATE = ctx["urls"]["chile"]
+    utils_fuentes.MAX_EC_ROWS = ctx["n"]
+    timeouts = {pais: 1e9 for pais in final_agent.ROUTER_TIMEOUTS}
+    return lambda: len(final_agent.ejecutar_router(timeouts=timeouts))
+
+
+ETAPAS: Dict[str, Callable[[Dict[str, Any]], Callable[[], int]]] = {
+    "ecuador_descarga": etapa_ecuador_descarga,
+    "colombia_descarga": etapa_colombia_descarga,
+    "chile_descarga": etapa_chile_descarga,
+    "chile_reglas": etapa_chile_reglas,
+    "chile_lectura": etapa_chile_lectura,
+    "montos_escalar": etapa_montos_escalar,
+    "montos_lote": etapa_montos_lote,
+    "clasificador": etapa_clasificador,
+    "normalizacion": etapa_normalizacion,
+    "agregacion": etapa_agregacion,
+    "router": etapa_router,
+}
+
+
+def correr_etapa(nombre: str, ctx: Dict[str, Any]) -> Dict[str, float]:
+    """Se ejecuta en el proceso hijo."""
+    fn = ETAPAS[nombre](ctx)
+    base = _rss_mb("VmRSS") or 0.0
+    exacto = _reset_pico()
+    inicio = time.perf_counter()
+    filas = fn()
+    segundos = time.perf_counter() - inicio
+    pico = _pico_mb()
+    return {
+        "filas": filas,
+        "segundos": round(segundos, 4),
+        "filas_s": round(filas / segundos, 1) if segundos > 0 else 0.0,
+        "pico_mb": round(pico, 1),
+        # Sin clear_refs el pico incluye la preparación
+        "delta_mb": round(pico - base, 1) if exacto else None,
+    }
+
+
+def _lanzar(nombre: str, tamano: str, fx_dir: Path, urls: Dict[str, str]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"bench-{nombre}-") as tmp:
+        salida = Path(tmp) / "resultado.json"
+        env = {
+            **os.environ,
+            "HTTP_CACHE_DIR": str(Path(tmp) / "http_cache"),
+            "LLM_CACHE_DIR": str(Path(tmp) / "llm_cache"),
+            "LLM_BACKEND": "local",
+            "HTTP_OFFLINE": "0",
+        }
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--_hijo", nombre, "--tamano", tamano,
+               "--_fixtures", str(fx_dir), "--_urls", json.dumps(urls), "--_salida", str(salida)]
+        proc = subprocess.run(cmd, cwd=tmp, env=env, capture_output=True, text=True)
+        if proc.returncode != 0 or not salida.exists():
+            return {"error": (proc.stderr or proc.stdout)[-2000:]}
+        return json.loads(salida.read_text(encoding="utf-8"))
+
+
+# ========================
+# Resultados y comparación
+# ========================
+
+def _commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _anterior(tamano: str, excluir: Optional[Path] = None) -> Optional[Path]:
+    previos = sorted(p for p in RESULTADOS_DIR.glob(f"*-{tamano}.json") if p != excluir)
+    return previos[-1] if previos else None
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any], umbral: float) -> List[str]:
+    regresiones = []
+    print(f"\n📈 Comparación con {base.get('fecha')} ({base.get('commit') or 'sin commit'}):")
+    for nombre, r in actual["etapas"].items():
+        b = base.get("etapas", {}).get(nombre)
+        if not b or "error" in r or "error" in b:
+            continue
+        dv = r["filas_s"] / b["filas_s"] - 1 if b["filas_s"] else 0.0
+        dm = r["pico_mb"] - b["pico_mb"]
+        marcas = []
+        if dv < -umbral:
+            marcas.append("throughput")
+        if dm > MIN_DELTA_MB and b["pico_mb"] and dm / b["pico_mb"] > umbral:
+            marcas.append("memoria")
+        estado = "⚠️ REGRESIÓN (" + ", ".join(marcas) + ")" if marcas else "ok"
+        print(f"  {nombre:<18} filas/s {dv:+7.1%}   pico {dm:+8.1f} MB   {estado}")
+        if marcas:
+            regresiones.append(nombre)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks por etapa (sin red)")
+    parser.add_argument("--tamano", choices=list(TAMANOS), default="10k")
+    parser.add_argument("--etapas", default="all", help=f"Lista separada por comas: {', '.join(ETAPAS)}")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Se guarda la más rápida")
+    parser.add_argument("--comparar", default="anterior",
+                        help="'anterior' (última corrida del mismo tamaño), ruta a un JSON o 'no'")
+    parser.add_argument("--umbral", type=float, default=0.15, help="Variación tolerada (0.15 = 15%%)")
+    parser.add_argument("--no-guardar", action="store_true")
+    parser.add_argument("--por-pagina", type=int, default=100, help="Filas por página de Ecuador")
+    parser.add_argument("--error-429-cada", type=int, default=0,
+                        help="El stub de Ecuador responde 429 cada N peticiones (0 = nunca)")
+    parser.add_argument("--_hijo", help=argparse.SUPPRESS)
+    parser.add_argument("--_fixtures", help=argparse.SUPPRESS)
+    parser.add_argument("--_urls", help=argparse.SUPPRESS)
+    parser.add_argument("--_salida", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._hijo:
+        ctx = {"n": TAMANOS[args.tamano], "fixtures": Path(args._fixtures), "urls": json.loads(args._urls)}
+        resultado = correr_etapa(args._hijo, ctx)
+        Path(args._salida).write_text(json.dumps(resultado), encoding="utf-8")
+        return 0
+
+    from servidor import StubServer
+
+    etapas = list(ETAPAS) if args.etapas == "all" else [e.strip() for e in args.etapas.split(",")]
+    desconocidas = [e for e in etapas if e not in ETAPAS]
+    if desconocidas:
+        parser.error(f"Etapas desconocidas: {desconocidas}")
+
+    fx_dir = fixtures(args.tamano, FIXTURES_DIR)
+    resultado = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tamano": args.tamano,
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "etapas": {},
+    }
+    with StubServer(fx_dir, per_page=args.por_pagina, error_429_cada=args.error_429_cada) as stub:
+        print(f"🧪 {args.tamano}: stub en {stub.url}\n")
+        print(f"  {'etapa':<18} {'filas':>10} {'segundos':>10} {'filas/s':>12} {'pico MB':>9} {'Δ MB':>8}")
+        for nombre in etapas:
+            corridas = [_lanzar(nombre, args.tamano, fx_dir, stub.urls) for _ in range(max(1, args.repeticiones))]
+            ok = [c for c in corridas if "error" not in c]
+            r = min(ok, key=lambda c: c["segundos"]) if ok else corridas[0]
+            resultado["etapas"][nombre] = r
+            if "error" in r:
+                print(f"  {nombre:<18} ❌ {r['error'].strip().splitlines()[-1] if r['error'].strip() else 'error'}")
+            else:
+                delta = "-" if r["delta_mb"] is None else f"{r['delta_mb']:.1f}"
+                print(f"  {nombre:<18} {r['filas']:>10} {r['segundos']:>10.3f} {r['filas_s']:>12,.0f} "
+                      f"{r['pico_mb']:>9.1f} {delta:>8}")
+
+    guardado = None
+    if not args.no_guardar:
+        RESULTADOS_DIR.mkdir(exist_ok=True)
+        guardado = RESULTADOS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{args.tamano}.json"
+        guardado.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n💾 Resultados en {guardado}")
+
+    if args.comparar == "no":
+        return 0
+    base_path = _anterior(args.tamano, excluir=guardado) if args.comparar == "anterior" else Path(args.comparar)
+    if base_path is None or not base_path.exists():
+        return 0
+    regresiones = comparar(resultado, json.loads(base_path.read_text(encoding="utf-8")), args.umbral)
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
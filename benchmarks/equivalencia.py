@@ -0,0 +1,288 @@
+# equivalencia.py
+"""
+Pruebas diferenciales de las reescrituras optimizadas contra las reglas
+originales (copiadas tal cual de la versión escalar), con entradas aleatorias:
+
+  python benchmarks/equivalencia.py
+  python benchmarks/equivalencia.py --casos 50000 --semilla 7 --solo montos
+
+Sale con código 1 si algún caso difiere y muestra los primeros.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+AGENTS_DIR = BENCH_DIR.parent / "agents"
+
+sys.path.insert(0, str(AGENTS_DIR))
+
+MAX_EJEMPLOS = 10
+
+
+# ========================
+# Montos (utils_montos)
+# ========================
+
+def to_number_original(val) -> float:
+    if val is None:
+        return 0.0
+    if isinstance(val, (int, float)):
+        return float(val)
+
+    s = str(val).strip()
+    if s == "":
+        return 0.0
+
+    repl = ["USD", "US$", "$", "CLP", "COP", "UF", "CLF", "FET"]
+    s_up = s.upper()
+    for token in repl:
+        s_up = s_up.replace(token, "")
+    s = s_up
+
+    s = s.replace("\xa0", " ").strip()
+
+    if s.count(".") > 0 and s.count(",") > 0:
+        s = s.replace(".", "")
+        s = s.replace(",", ".")
+    else:
+        if s.count(",") == 1 and len(s.split(",")[-1]) in (1, 2):
+            s = s.replace(",", ".")
+        else:
+            s = s.replace(",", "")
+
+    s = s.replace(" ", "")
+
+    if s.startswith("(") and s.endswith(")"):
+        s = "-" + s[1:-1]
+
+    s = re.sub(r"[^0-9\.\-]", "", s)
+
+    try:
+        return float(s) if s not in ("", ".", "-", "-.") else 0.0
+    except Exception:
+        return 0.0
+
+
+def convertir_a_usd_original(valor, moneda):
+    v = to_number_original(valor)
+    m = (moneda or "USD").strip().upper()
+
+    cop_per_usd = to_number_original(os.getenv("FX_COP_PER_USD", "4000"))
+    clp_per_usd = to_number_original(os.getenv("FX_CLP_PER_USD", "850"))
+    uf_usd      = to_number_original(os.getenv("FX_UF_USD", "42"))
+
+    rates = {
+        "USD": 1.0,
+        "COP": (1.0 / cop_per_usd) if cop_per_usd > 0 else 0.00025,
+        "CLP": (1.0 / clp_per_usd) if clp_per_usd > 0 else 1/850.0,
+        "UF": uf_usd if uf_usd > 0 else 42.0,
+        "CLF": uf_usd if uf_usd > 0 else 42.0,
+        "FET": uf_usd if uf_usd > 0 else 42.0,
+        "": 1.0,
+        None: 1.0,
+    }
+    return float(v) * rates.get(m, 1.0)
+
+
+_PIEZAS_MONTO = [
+    "0", "1", "7", "12", "345", "999", "1000", "00", ".", ",", ".", ",", " ", "  ", "\xa0", "\t",
+    "-", "+", "(", ")", "$", "US$", "usd", "USD", "clp", "CLP", "COP", "UF", "uf", "CLF", "FET",
+    "e", "E5", "nan", "inf", "abc", "ñ", "١٢", "½", "'", "_",
+]
+_MONEDAS = ["USD", "usd", " clp ", "CLP", "COP", "UF", "clf", "FET", "EUR", "", None, "  ", "US$"]
+
+
+def _monto_aleatorio(rng: random.Random) -> Any:
+    r = rng.random()
+    if r < 0.05:
+        return None
+    if r < 0.10:
+        return rng.choice([rng.randint(-10**9, 10**9), rng.uniform(-1e9, 1e9), True, 0, -0.0])
+    if r < 0.12:
+        return Decimal(f"{rng.randint(0, 10**6)}.{rng.randint(0, 99)}")
+    if r < 0.35:
+        # Formatos reales: miles con punto o coma, decimales con coma o punto, moneda
+        entero = f"{rng.randint(0, 10**rng.randint(1, 12)):,}"
+        if rng.random() < 0.5:
+            entero = entero.replace(",", ".")
+        dec = rng.choice(["", f",{rng.randint(0, 99):02d}", f".{rng.randint(0, 9)}", f",{rng.randint(0, 9)}"])
+        pre = rng.choice(["", "", "$ ", "USD ", "CLP ", "US$", "(", "-"])
+        post = ")" if pre == "(" else rng.choice(["", "", " ", " CLP", "\xa0"])
+        return f"{pre}{entero}{dec}{post}"
+    if r < 0.55:
+        return f"{rng.uniform(-1e7, 1e7):.{rng.randint(0, 6)}f}"
+    if r < 0.57:
+        return "9" * rng.randint(20, 400)
+    return "".join(rng.choice(_PIEZAS_MONTO) for _ in range(rng.randint(0, 12)))
+
+
+def _mismo_float(a: float, b: float) -> bool:
+    return a == b or (a != a and b != b)
+
+
+def chequear_montos(casos: int, rng: random.Random) -> List[str]:
+    import utils_montos
+    from utils_montos import convertir_a_usd_many, reset_fx_rates, to_number, to_number_many
+
+    valores = [_monto_aleatorio(rng) for _ in range(casos)]
+    monedas = [rng.choice(_MONEDAS) for _ in range(casos)]
+    reset_fx_rates()
+    lote = to_number_many(valores)
+    usd = convertir_a_usd_many(valores, monedas)
+    # Lo mismo sin numpy.strings (NumPy < 2): las cadenas sucias van al camino escalar
+    ns, utils_montos._NS = utils_montos._NS, None
+    try:
+        lote_np1 = to_number_many(valores)
+    finally:
+        utils_montos._NS = ns
+
+    errores = []
+    for i, (v, m) in enumerate(zip(valores, monedas)):
+        esperado = to_number_original(v)
+        for nombre, obtenido in (("to_number", to_number(v)), ("to_number_many", float(lote[i])),
+                                 ("to_number_many sin numpy.strings", float(lote_np1[i]))):
+            if not _mismo_float(esperado, obtenido):
+                errores.append(f"{nombre}({v!r}) = {obtenido!r}, original {esperado!r}")
+        esperado_usd = convertir_a_usd_original(v, m)
+        if not _mismo_float(esperado_usd, float(usd[i])):
+            errores.append(f"convertir_a_usd_many({v!r}, {m!r}) = {float(usd[i])!r}, original {esperado_usd!r}")
+    return errores
+
+
+# ========================
+# Clasificador (utils_clasificador)
+# ========================
+
+def clasificar_categoria_original(objeto: str, entidad: str, justificacion: str = "") -> str:
+    t = f"{(objeto or '')} {(entidad or '')} {(justificacion or '')}".lower()
+
+    salud_kw = [
+        "salud", "hospital", "clínic", "clinic", "médic", "medic", "quirúrg", "quirurg",
+        "insumo", "medicament", "laboratorio", "ambulancia", "esteriliz", "equipos médicos",
+        "servicio de salud", "cesfam", "sar ", "sapu"
+    ]
+    educ_kw = [
+        "educación", "educacion", "escuela", "colegio", "universidad", "liceo", "docente",
+        "estudiante", "alumno", "junji", "jardín infantil", "jardin infantil", "daem",
+        "institución educativa", "institucion educativa"
+    ]
+    infra_kw = [
+        "infraestructura", "obra", "obras", "vía", "via", "carretera", "puente", "calzada",
+        "rehabilitación", "rehabilitacion", "mantenimiento vial", "alcantarillado", "agua potable",
+        "paviment", "vial", "edificaci", "servidor", "impresor", "telefon", "hpe", "seguro",
+        "mantención", "mantencion", "licitación obra", "construcción", "conservación"
+    ]
+
+    entidad_health = any(x in (entidad or "").lower() for x in [
+        "servicio de salud", "hospital", "cesfam", "sapu", "sar ", "posta", "ss metropolitan"
+    ])
+    entidad_educ = any(x in (entidad or "").lower() for x in [
+        "junji", "jardín infantil", "jardin infantil", "colegio", "liceo", "daem",
+        "ministerio de educación", "universidad", "municipalidad de"
+    ])
+    entidad_infra = any(x in (entidad or "").lower() for x in [
+        "mop", "obras públicas", "obras publicas", "dirección de vialidad", "direccion de vialidad",
+        "serviu", "ministerio de obras", "municipalidad de", "dom"
+    ])
+
+    if any(k in t for k in salud_kw) or entidad_health:
+        return "Salud"
+    if any(k in t for k in educ_kw) or entidad_educ:
+        return "Educación"
+    if any(k in t for k in infra_kw) or entidad_infra:
+        return "Infraestructura"
+    return "Otras"
+
+
+def _fragmentos_clasificador() -> List[str]:
+    import utils_clasificador as uc
+    kws = (uc.SALUD_KW + uc.EDUC_KW + uc.INFRA_KW
+           + uc.ENTIDAD_SALUD_KW + uc.ENTIDAD_EDUC_KW + uc.ENTIDAD_INFRA_KW)
+    # Palabras completas, sus mitades (coincidencias que cruzan un espacio) y ruido
+    mitades = [k[:len(k) // 2] for k in kws] + [k[len(k) // 2:] for k in kws]
+    ruido = ["compra", "de", "servicio", "región", "sur", "sa", "ministerio", "dirección", "ss",
+             "İstanbul", "ΟΔΟΣ", "straße", "", " ", "  ", "\t", "\n", "-", "/", "(", "2023"]
+    return kws + mitades + ruido
+
+
+def _texto_aleatorio(rng: random.Random, piezas: List[str]) -> Any:
+    r = rng.random()
+    if r < 0.05:
+        return None
+    if r < 0.08:
+        return ""
+    partes = []
+    for _ in range(rng.randint(1, 6)):
+        p = rng.choice(piezas)
+        c = rng.random()
+        p = p.upper() if c < 0.2 else p.title() if c < 0.3 else p
+        partes.append(p)
+    return rng.choice(["", " ", "  ", "/"]).join(partes) if rng.random() < 0.3 else " ".join(partes)
+
+
+def chequear_clasificador(casos: int, rng: random.Random) -> List[str]:
+    from utils_clasificador import ClasificadorCategorias
+
+    piezas = _fragmentos_clasificador()
+    filas = []
+    for _ in range(casos):
+        objeto = _texto_aleatorio(rng, piezas)
+        if rng.random() < 0.03:
+            objeto = rng.choice([0, 123, 4.5])  # el original acepta no-texto en objeto y justificación
+        # Filas repetidas ejercitan las cachés de classify_many
+        filas.append(rng.choice(filas) if filas and rng.random() < 0.1 else
+                     (objeto, _texto_aleatorio(rng, piezas), _texto_aleatorio(rng, piezas)))
+
+    # Caché chica: también se prueba el vaciado de las memos
+    clasificadores = [ClasificadorCategorias(), ClasificadorCategorias(cache_size=64)]
+    lotes = [c.classify_many(filas) for c in clasificadores]
+    errores = []
+    for i, fila in enumerate(filas):
+        esperado = clasificar_categoria_original(*fila)
+        for c, lote in zip(clasificadores, lotes):
+            for nombre, obtenido in (("clasificar", c.clasificar(*fila)), ("classify_many", lote[i])):
+                if obtenido != esperado:
+                    errores.append(f"{nombre}{fila!r} (cache {c._token_mask.maxsize}) = {obtenido!r}, "
+                                   f"original {esperado!r}")
+    return errores
+
+
+CHEQUEOS: Dict[str, Callable[[int, random.Random], List[str]]] = {
+    "montos": chequear_montos,
+    "clasificador": chequear_clasificador,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compara las versiones optimizadas con las reglas originales")
+    parser.add_argument("--casos", type=int, default=300_000, help="Entradas aleatorias por chequeo")
+    parser.add_argument("--semilla", type=int, default=2023)
+    parser.add_argument("--solo", help=f"Chequeos separados por coma ({', '.join(CHEQUEOS)})")
+    args = parser.parse_args(argv)
+
+    nombres = [n.strip() for n in args.solo.split(",") if n.strip()] if args.solo else list(CHEQUEOS)
+    desconocidos = sorted(set(nombres) - set(CHEQUEOS))
+    if desconocidos:
+        parser.error(f"Chequeos desconocidos: {', '.join(desconocidos)}")
+
+    fallas = 0
+    for nombre in nombres:
+        inicio = time.perf_counter()
+        errores = CHEQUEOS[nombre](args.casos, random.Random(args.semilla))
+        estado = "✅ sin diferencias" if not errores else f"❌ {len(errores)} diferencias"
+        print(f"{nombre}: {args.casos} casos, {estado} ({time.perf_counter() - inicio:.1f}s)")
+        for e in errores[:MAX_EJEMPLOS]:
+            print(f"   {e}")
+        fallas += len(errores)
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
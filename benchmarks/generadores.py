@@ -0,0 +1,186 @@
+# generadores.py
+"""
+Datos sintéticos deterministas con la forma de cada fuente:
+  - Ecuador: filas de search_ocds (se sirven paginadas como {"data", "pages", "total"})
+  - Colombia: filas SODA con las columnas de SODA_FIELDS
+  - Chile: contracts.csv estilo OCDS aplanado (";", campos con saltos de línea)
+    empaquetado en un .tar.gz como el de data.open-contracting.org
+
+Los fixtures se graban una vez por tamaño en benchmarks/fixtures/<tamaño>/ y se
+reutilizan mientras no cambie VERSION.
+"""
+import csv
+import json
+import random
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+VERSION = 1
+SEMILLA = 2023
+
+TAMANOS = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+ENTIDADES = [
+    "Hospital General {}", "Servicio de Salud {}", "CESFAM {}", "Municipalidad de {}",
+    "Ministerio de Obras Públicas", "Universidad de {}", "Liceo Bicentenario {}",
+    "JUNJI Región {}", "SERVIU {}", "Gobierno Autónomo Descentralizado de {}",
+    "Empresa Pública de Agua Potable {}", "Instituto Nacional de {}", "Dirección de Vialidad {}",
+]
+LUGARES = [
+    "Pichincha", "Guayas", "Azuay", "Manabí", "Bogotá D.C.", "Medellín", "Cali", "Barranquilla",
+    "Metropolitana", "Valparaíso", "Biobío", "Araucanía", "Los Lagos", "Antofagasta",
+]
+OBJETOS = [
+    "Adquisición de insumos médicos para {}", "Compra de medicamentos {}",
+    "Mantenimiento vial del tramo {}", "Construcción de puente sobre el río {}",
+    "Adquisición de mobiliario escolar para escuela {}", "Servicio de aseo para {}",
+    "Suministro de servidores e impresoras para {}", "Rehabilitación de alcantarillado en {}",
+    "Contratación de seguro de vehículos {}", "Compra de alimentos para jardín infantil {}",
+    "Pavimentación de calzada en {}", "Arriendo de equipos de laboratorio {}",
+]
+PROVEEDORES = [
+    "Constructora {} S.A.", "Distribuidora Médica {} Ltda.", "Comercial {} SpA",
+    "Servicios Integrales {} S.A.S.", "Tecnología {} Cía. Ltda.", "{} y Asociados",
+]
+NOMBRES = [
+    "Andes", "Pacífico", "Norte", "Sur", "Central", "Oriente", "San José", "La Esperanza",
+    "Los Ríos", "El Salto", "Santa María", "Nueva Aurora", "Cordillera", "Valle Verde",
+]
+JUSTIFICACIONES = [
+    "Bien normalizado según catálogo", "Subasta inversa electrónica por monto",
+    "Necesidad institucional prioritaria; ver informe técnico adjunto",
+    "Reposición de stock crítico del establecimiento", "",
+]
+
+CHILE_HEADER = [
+    "id", "ocid", "buyer/name", "tender/title", "value/amount", "value/currency",
+    "buyer/address/region", "tender/tenderPeriod/startDate", "dateSigned",
+    "tender/numberOfTenderers", "suppliers/0/name", "award/value/amount",
+    "tender/procurementMethodRationale",
+]
+
+
+def _nombre(rnd: random.Random, plantillas: List[str]) -> str:
+    return rnd.choice(plantillas).format(rnd.choice(NOMBRES))
+
+
+def _fecha(rnd: random.Random, year: int = 2023) -> str:
+    return f"{year}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T{rnd.randint(8, 18):02d}:00:00Z"
+
+
+def _monto(rnd: random.Random, estilo: str) -> str:
+    v = rnd.lognormvariate(10, 2)
+    if estilo == "plano":
+        return f"{v:.2f}"
+    if estilo == "latino":  # 1.234.567,89
+        entero, dec = f"{v:,.2f}".split(".")
+        return f"{entero.replace(',', '.')},{dec}"
+    if estilo == "moneda":
+        return rnd.choice(["USD ", "$ ", "US$"]) + f"{v:,.2f}"
+    return str(int(v))
+
+
+def ecuador_rows(n: int, seed: int = SEMILLA) -> Iterator[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    for i in range(n):
+        yield {
+            "ocid": f"ocds-5wno2w-SIE-{2023}-{i:08d}",
+            "buyerName": _nombre(rnd, ENTIDADES),
+            "title": _nombre(rnd, OBJETOS),
+            "budgetAmount": round(rnd.lognormvariate(9, 1.5), 2),
+            "currency": "USD",
+            "buyerProvince": rnd.choice(LUGARES[:4]),
+            "date": _fecha(rnd),
+            "awardDate": _fecha(rnd) if rnd.random() < 0.7 else None,
+            "tenderersCount": rnd.randint(0, 12),
+            "supplierName": _nombre(rnd, PROVEEDORES) if rnd.random() < 0.8 else None,
+            "awardValueAmount": round(rnd.lognormvariate(9, 1.5), 2),
+            "procurementMethodRationale": rnd.choice(JUSTIFICACIONES),
+        }
+
+
+def soda_rows(n: int, seed: int = SEMILLA + 1) -> Iterator[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    for i in range(n):
+        row = {
+            "id_del_proceso": f"CO1.REQ.{i:09d}",
+            "entidad": _nombre(rnd, ENTIDADES).upper(),
+            "descripci_n_del_procedimiento": _nombre(rnd, OBJETOS),
+            "precio_base": str(int(rnd.lognormvariate(17, 1.5))),
+            "ciudad_entidad": rnd.choice(LUGARES[4:8]),
+            "fecha_de_publicacion_del": _fecha(rnd)[:-1] + ".000",
+            "fecha_adjudicacion": _fecha(rnd)[:-1] + ".000",
+            "proveedores_invitados": str(rnd.randint(0, 20)),
+            "nombre_del_proveedor": _nombre(rnd, PROVEEDORES),
+            "valor_total_adjudicacion": str(int(rnd.lognormvariate(17, 1.5))),
+            "justificaci_n_modalidad_de": rnd.choice(JUSTIFICACIONES),
+        }
+        # SODA omite las claves nulas
+        if rnd.random() < 0.1:
+            del row["nombre_del_proveedor"]
+        yield row
+
+
+def chile_rows(n: int, seed: int = SEMILLA + 2) -> Iterator[List[str]]:
+    rnd = random.Random(seed)
+    estilos = ["plano", "latino", "entero", "moneda"]
+    for i in range(n):
+        justificacion = rnd.choice(JUSTIFICACIONES)
+        if rnd.random() < 0.02:
+            justificacion += "\nDetalle; \"según bases\" punto 2"
+        yield [
+            str(1_000_000 + i),
+            f"ocds-70d2nz-{i}",
+            _nombre(rnd, ENTIDADES),
+            _nombre(rnd, OBJETOS),
+            _monto(rnd, rnd.choice(estilos)),
+            rnd.choice(["CLP", "CLP", "CLP", "UF", "USD", ""]),
+            rnd.choice(LUGARES[8:]),
+            _fecha(rnd),
+            _fecha(rnd)[:10],
+            str(rnd.randint(0, 15)),
+            _nombre(rnd, PROVEEDORES),
+            _monto(rnd, "plano"),
+            justificacion,
+        ]
+
+
+# ========================
+# Fixtures grabados
+# ========================
+
+def _write_ndjson(path: Path, rows: Iterator[Dict[str, Any]]):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _write_chile(dir_: Path, n: int):
+    csv_path = dir_ / "contracts.csv"
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter=";", lineterminator="\n")
+        w.writerow(CHILE_HEADER)
+        w.writerows(chile_rows(n))
+    with tarfile.open(dir_ / "chile.tar.gz", "w:gz", compresslevel=6) as tar:
+        tar.add(csv_path, arcname="2023/contracts.csv")
+
+
+def fixtures(tamano: str, root: Path) -> Path:
+    """Graba (si hace falta) y devuelve el directorio de fixtures de `tamano`."""
+    n = TAMANOS[tamano]
+    dir_ = Path(root) / tamano
+    manifest = dir_ / "manifest.json"
+    try:
+        if json.loads(manifest.read_text(encoding="utf-8")) == {"version": VERSION, "filas": n}:
+            return dir_
+    except (OSError, ValueError):
+        pass
+    dir_.mkdir(parents=True, exist_ok=True)
+    print(f"🧪 Generando fixtures {tamano} ({n} filas por fuente) en {dir_} ...")
+    _write_ndjson(dir_ / "ecuador.ndjson", ecuador_rows(n))
+    _write_ndjson(dir_ / "colombia.ndjson", soda_rows(n))
+    _write_chile(dir_, n)
+    manifest.write_text(json.dumps({"version": VERSION, "filas": n}), encoding="utf-8")
+    return dir_
+
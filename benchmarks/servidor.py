@@ -0,0 +1,179 @@
+# servidor.py
+"""
+Servidor HTTP local que reproduce las tres APIs a partir de los fixtures
+grabados (sin red):
+
+  /ecuador/search_ocds?page=N          → {"data": [...], "pages": P, "total": T}
+  /colombia/resource.json?$limit&$offset → array JSON (en streaming)
+  /chile/2023.csv.tar.gz               → tar.gz con ETag, 304 y Range
+"""
+import mmap
+import socket
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+IO_CHUNK = 1024 * 1024
+
+
+class NdjsonFixture:
+    """Archivo NDJSON con índice de offsets por línea para servir rebanadas sin parsear."""
+
+    def __init__(self, path: Path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = array("q", [0])
+        pos = self.mm.find(b"\n")
+        while pos != -1:
+            self.offsets.append(pos + 1)
+            pos = self.mm.find(b"\n", pos + 1)
+        self.rows = len(self.offsets) - 1
+
+    def slice_bytes(self, start: int, stop: int) -> bytes:
+        start, stop = min(start, self.rows), min(stop, self.rows)
+        return self.mm[self.offsets[start]:self.offsets[stop]]
+
+    def json_array_len(self, start: int, stop: int) -> int:
+        start, stop = min(start, self.rows), min(stop, self.rows)
+        n = stop - start
+        # cada "\n" pasa a ser "," (menos el último) y se agregan "[" y "]"
+        return self.offsets[stop] - self.offsets[start] - n + max(n - 1, 0) + 2
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class StubServer:
+    def __init__(self, fixtures_dir: Path, per_page: int = 100, error_429_cada: int = 0,
+                 demora_ecuador: float = 0.0):
+        self.dir = Path(fixtures_dir)
+        self.per_page = per_page
+        self.error_429_cada = error_429_cada
+        self.demora_ecuador = demora_ecuador  # segundos antes de responder cada página
+        self.ecuador = NdjsonFixture(self.dir / "ecuador.ndjson")
+        self.colombia = NdjsonFixture(self.dir / "colombia.ndjson")
+        self.chile = self.dir / "chile.tar.gz"
+        self.chile_etag = f'"{self.chile.stat().st_size}-{int(self.chile.stat().st_mtime)}"'
+        self.peticiones = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def urls(self):
+        return {
+            "ecuador": f"{self.url}/ecuador/search_ocds",
+            "colombia": f"{self.url}/colombia/resource.json",
+            "chile": f"{self.url}/chile/2023.csv.tar.gz",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.ecuador.close()
+        self.colombia.close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Cabeceras y cuerpo van en writes separados: sin NODELAY, Nagle +
+                # ACK diferido suman ~40 ms por respuesta en conexiones keep-alive
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with server.lock:
+                    server.peticiones += 1
+                    n = server.peticiones
+                url = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path.startswith("/ecuador/"):
+                    if server.error_429_cada and n % server.error_429_cada == 0:
+                        return self._send(429, b"{}", {"Retry-After": "0"})
+                    return self._ecuador(int(q.get("page", 1)))
+                if url.path.startswith("/colombia/"):
+                    return self._colombia(int(q.get("$offset", 0)), int(q.get("$limit", 1000)))
+                if url.path.startswith("/chile/"):
+                    return self._chile()
+                self._send(404)
+
+            def _ecuador(self, page):
+                if server.demora_ecuador:
+                    time.sleep(server.demora_ecuador)
+                fx, per_page = server.ecuador, server.per_page
+                start = (page - 1) * per_page
+                data = fx.slice_bytes(start, start + per_page).rstrip(b"\n").replace(b"\n", b",")
+                pages = -(-fx.rows // per_page)
+                body = b'{"data":[' + data + b'],"pages":%d,"total":%d}' % (pages, fx.rows)
+                self._send(200, body, {"Content-Type": "application/json"})
+
+            def _colombia(self, offset, limit):
+                fx = server.colombia
+                start, stop = offset, offset + limit
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(fx.json_array_len(start, stop)))
+                self.end_headers()
+                self.wfile.write(b"[")
+                first = True
+                step = 5000
+                for s in range(min(start, fx.rows), min(stop, fx.rows), step):
+                    block = fx.slice_bytes(s, min(s + step, stop)).rstrip(b"\n").replace(b"\n", b",")
+                    self.wfile.write(block if first else b"," + block)
+                    first = False
+                self.wfile.write(b"]")
+
+            def _chile(self):
+                if self.headers.get("If-None-Match") == server.chile_etag:
+                    return self._send(304, headers={"ETag": server.chile_etag})
+                size = server.chile.stat().st_size
+                start = 0
+                rng = self.headers.get("Range", "")
+                status = 200
+                if rng.startswith("bytes=") and self.headers.get("If-Range", server.chile_etag) == server.chile_etag:
+                    start = int(rng[6:].split("-")[0])
+                    status = 206
+                self.send_response(status)
+                self.send_header("ETag", server.chile_etag)
+                self.send_header("Content-Type", "application/gzip")
+                self.send_header("Content-Length", str(size - start))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+                self.end_headers()
+                with open(server.chile, "rb") as f:
+                    f.seek(start)
+                    while True:
+                        chunk = f.read(IO_CHUNK)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+
+        return Handler
@@ -0,0 +1,77 @@
+# timeout_router.py
+"""
+Comprueba que una fuente vencida no retrasa la salida del proceso: corre
+ejecutar_router en un proceso hijo contra servidor.py con páginas de Ecuador
+lentas y un timeout corto, y mide desde el inicio del router hasta que el hijo
+termina (incluye la espera de hilos que hace el intérprete al salir).
+
+  python benchmarks/timeout_router.py
+  python benchmarks/timeout_router.py --timeout 2 --demora 1 --filas 2000 --margen 2
+
+Sale con código 1 si el proceso tarda más que --timeout + --margen.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+AGENTS_DIR = BENCH_DIR.parent / "agents"
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+
+sys.path.insert(0, str(AGENTS_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from generadores import fixtures  # noqa: E402
+
+
+def hijo(url: str, timeout: float, filas: int):
+    import final_agent
+    import utils_ecuador
+    utils_ecuador.SEARCH_URL = url
+    print(f"INICIO {time.time()}", flush=True)
+    datos = final_agent.ejecutar_router(timeouts={"Ecuador": timeout}, paises=("Ecuador",), max_ec_rows=filas)
+    print(f"ROUTER {len(datos)} filas", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Salida del proceso tras el timeout de una fuente")
+    parser.add_argument("--timeout", type=float, default=2.0, help="ROUTER_TIMEOUT de Ecuador (s)")
+    parser.add_argument("--demora", type=float, default=1.0, help="Demora del stub por página (s)")
+    parser.add_argument("--filas", type=int, default=2000, help="max_ec_rows (100 filas por página)")
+    parser.add_argument("--margen", type=float, default=2.0,
+                        help="Tolerancia sobre el timeout (s): cubre la página en curso al vencer")
+    parser.add_argument("--_hijo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._hijo:
+        hijo(args._hijo, args.timeout, args.filas)
+        return 0
+
+    from servidor import StubServer
+
+    with tempfile.TemporaryDirectory(prefix="timeout-router-") as tmp, \
+            StubServer(fixtures("10k", FIXTURES_DIR), demora_ecuador=args.demora) as stub:
+        env = {**os.environ, "HTTP_CACHE_DIR": str(Path(tmp) / "http_cache"), "HTTP_OFFLINE": "0"}
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--_hijo", stub.urls["ecuador"],
+               "--timeout", str(args.timeout), "--filas", str(args.filas)]
+        proc = subprocess.run(cmd, cwd=tmp, env=env, capture_output=True, text=True)
+        fin = time.time()
+
+    inicio = next((float(ln.split()[1]) for ln in proc.stdout.splitlines() if ln.startswith("INICIO ")), None)
+    if proc.returncode != 0 or inicio is None:
+        print(f"❌ El proceso hijo falló (código {proc.returncode}):\n{(proc.stderr or proc.stdout)[-2000:]}")
+        return 1
+    segundos = fin - inicio
+    limite = args.timeout + args.margen
+    print(proc.stdout.strip())
+    print(f"{'✅' if segundos <= limite else '❌'} Salida {segundos:.1f}s después de iniciar el router "
+          f"(timeout {args.timeout:.0f}s, límite {limite:.0f}s)")
+    return 0 if segundos <= limite else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())